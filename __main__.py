@@ -1,47 +1,23 @@
 import pulumi
-import pulumi_oci as oci
-import ipaddress
-import re
+import asyncio
+from cluster import OkeCluster, OkeClusterArgs, clusters_args
+from lookups import Lookups
+from nodepools import NodePoolSpec, node_pool_specs, virtual_node_pool_specs
+from subnets import subnet_layout
 
 ###################################################################################################################################
 # Utils
 ###################################################################################################################################
 
 
-def get_oke_image(source, shape, oke_version):
-    version = format_version(oke_version)
-    if re.match("^VM\\.Standard\\.A\\d+\\.Flex", shape):
-        pattern = f"(Oracle-Linux).*?(aarch64).*?({version})"
-    elif re.match(".*GPU.*", shape):
-        pattern = f"(Oracle-Linux).*?(GPU).*?({version})"
-    else:
-        pattern = f"(Oracle-Linux)-(?!.*?(?:GPU|aarch64)).*?({version})"
-    return list(filter(lambda x: re.search(pattern, x["source_name"]), source))[0][
-        "image_id"
-    ]
+def get_dependencies(value):
+    # Names of the resources an input waits for before it can be resolved
+    async def names():
+        resources = await pulumi.Output.from_input(value).resources()
+        urns = [await resource.urn.future() for resource in resources]
+        return sorted(urn.split("::")[-1] for urn in urns if urn)
 
-
-def format_version(input_string):
-    version_number = input_string.lstrip("v")
-    formatted_version = re.sub(r"\.", r"\\.", version_number)
-    return formatted_version
-
-
-def get_ads(ads, net):
-    z = []
-    for ad in ads:
-        z.append({"availability_domain": str(ad["name"]), "subnet_id": net})
-    return z
-
-
-def calculate_subnets(cidr, num_subnets):
-    supernet = ipaddress.ip_network(cidr)
-    new_prefix_length = supernet.prefixlen
-    while (2 ** (new_prefix_length - supernet.prefixlen)) < num_subnets:
-        new_prefix_length += 1
-    subnets = list(supernet.subnets(new_prefix=new_prefix_length))
-    subnet_strings = [str(subnet) for subnet in subnets[:num_subnets]]
-    return subnet_strings
+    return pulumi.Output.from_input(asyncio.ensure_future(names()))
 
 
 ###################################################################################################################################
@@ -54,617 +30,163 @@ vcn_cidr_block = config.require("vcn_cidr_block")
 node_shape = config.require("node_shape")
 kubernetes_version = config.require("kubernetes_version")
 oke_min_nodes = int(config.require("oke_min_nodes"))
+oke_max_nodes = int(config.require("oke_max_nodes"))
 node_image_id = config.require("node_image_id")
 oke_ocpus = float(config.require("oke_ocpus"))
 oke_memory_in_gbs = float(config.require("oke_memory_in_gbs"))
 ssh_key = config.require("ssh_key")
-
-(
-    loadbalancers_subnet_address,
-    public_subnet_address,
-    pods_subnet_address,
-    workers_subnet_address,
-    oke_pods_cidr,
-    oke_services_cidr,
-) = calculate_subnets(vcn_cidr_block, 6)
+lookup_cache_ttl = int(config.require("lookup_cache_ttl"))
+region = pulumi.Config("oci").get("region") or "default"
+kubeconfig_token_cache = config.require_bool("kubeconfig_token_cache")
+kubeconfig_path = config.require("kubeconfig_path")
+wait_for_ready = config.require_bool("wait_for_ready")
+ready_timeout = float(config.require("ready_timeout"))
+smoke_pods = int(config.require("smoke_pods"))
+capacity_preflight = config.require_bool("capacity_preflight")
+capacity_report_file = config.get("capacity_report_file")
+max_pods_per_node = int(config.require("max_pods_per_node"))
+boot_volume_size_in_gbs = int(config.require("boot_volume_size_in_gbs"))
+boot_volume_vpus_per_gb = int(config.require("boot_volume_vpus_per_gb"))
+containerd_volume_size_in_gbs = int(config.require("containerd_volume_size_in_gbs"))
+containerd_volume_vpus_per_gb = int(config.require("containerd_volume_vpus_per_gb"))
+kube_proxy_mode = config.require("kube_proxy_mode")
+coredns_min_replicas = int(config.require("coredns_min_replicas"))
+coredns_nodes_per_replica = int(config.require("coredns_nodes_per_replica"))
+nodelocal_dns = config.require_bool("nodelocal_dns")
+service_gateway_all_services = config.require_bool("service_gateway_all_services")
+prepull_images = config.get_object("prepull_images") or []
+node_cycling = config.require_bool("node_cycling")
+node_cycling_max_surge = config.require("node_cycling_max_surge")
+node_cycling_max_unavailable = config.require("node_cycling_max_unavailable")
+node_eviction_grace_duration = config.require("node_eviction_grace_duration")
+node_eviction_force_delete = config.require_bool("node_eviction_force_delete")
+tuning_profile = config.require("tuning_profile")
+hugepages = int(config.require("hugepages"))
+load_balancer_count = int(config.require("load_balancer_count"))
+load_balancer_profile = config.require("load_balancer_profile")
+load_balancer_ports = [
+    int(port) for port in config.require("load_balancer_ports").split(",")
+]
+load_balancer_min_bandwidth = int(config.require("load_balancer_min_bandwidth"))
+load_balancer_max_bandwidth = int(config.require("load_balancer_max_bandwidth"))
+subnet_headroom = float(config.require("subnet_headroom"))
+vcn_subnet_layout = subnet_layout(config.get_object("subnet_layout"))
+ipv6 = config.require_bool("ipv6")
+kubernetes_pods_cidr = config.require("kubernetes_pods_cidr")
+kubernetes_services_cidr = config.require("kubernetes_services_cidr")
+cni_type = config.require("cni_type")
+cluster_type = config.require("cluster_type")
+virtual_node_pools = virtual_node_pool_specs(config.get_object("virtual_node_pools"))
+cluster_autoscaler = config.require_bool("cluster_autoscaler")
+autoscaler_scale_down_delay = config.require("autoscaler_scale_down_delay")
+autoscaler_expander = config.require("autoscaler_expander")
+security_mode = config.require("security_mode")
+stack_mode = config.require("stack_mode")
+observability = config.require_bool("observability")
+log_retention_days = int(config.require("log_retention_days"))
+alarm_cpu_threshold = float(config.require("alarm_cpu_threshold"))
+alarm_memory_threshold = float(config.require("alarm_memory_threshold"))
+alarm_email = config.require("alarm_email")
+network_stack = config.get("network_stack")
+tenancy_id = pulumi.Config("oci").get("tenancyOcid") or config.get("tenancy_ocid")
+node_pool_defaults = NodePoolSpec(
+    name="NodePool",
+    shape=node_shape,
+    ocpus=oke_ocpus,
+    memory_in_gbs=oke_memory_in_gbs,
+    size=oke_min_nodes,
+    max_pods_per_node=max_pods_per_node,
+    image_id=node_image_id,
+    min_size=oke_min_nodes,
+    max_size=max(oke_min_nodes, oke_max_nodes),
+    boot_volume_size_in_gbs=boot_volume_size_in_gbs,
+    boot_volume_vpus_per_gb=boot_volume_vpus_per_gb,
+    containerd_volume_size_in_gbs=containerd_volume_size_in_gbs,
+    containerd_volume_vpus_per_gb=containerd_volume_vpus_per_gb,
+    tuning_profile=tuning_profile,
+    hugepages=hugepages,
+    prepull_images=prepull_images,
+    node_cycling=node_cycling,
+    max_surge=node_cycling_max_surge,
+    max_unavailable=node_cycling_max_unavailable,
+    eviction_grace_duration=node_eviction_grace_duration,
+    force_delete_after_grace=node_eviction_force_delete,
+)
+
+clusters = config.get_object("clusters")
 
 ###################################################################################################################################
 # Infrastructure code
 ###################################################################################################################################
 
-# Create a VCN
-vcn = oci.core.Vcn(
-    "vcn",
-    compartment_id=compartment_id,
-    cidr_block=vcn_cidr_block,
-    display_name="vcn",
-    dns_label="vcn",
-)
-
-# Create an Internet Gateway for the public subnet
-internet_gateway = oci.core.InternetGateway(
-    "InternetGateway",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="InternetGateway",
-    enabled=True,
-)
-
-# Create a NAT Gateway for the private subnet
-nat_gateway = oci.core.NatGateway(
-    "NatGateway",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="NatGateway",
-)
-
-# Create a Service Gateway for access to OCI services
-service_gateway = oci.core.ServiceGateway(
-    "ServiceGateway",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    services=[
-        oci.core.ServiceGatewayServiceArgs(
-            service_id=oci.core.get_services().services[0].id
-        )
-    ],
-    display_name="ServiceGateway",
-)
-
-# Create a separate Security List for the Public Subnet
-public_security_list = oci.core.SecurityList(
-    "PublicSecurityList",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="PublicSecurityList",
-    ingress_security_rules=[
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Kubernetes worker to Kubernetes API endpoint communication.",
-            protocol="6",
-            source=workers_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=6443,
-                min=6443,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Kubernetes worker to Kubernetes API endpoint communication.",
-            protocol="6",
-            source=workers_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=12250,
-                min=12250,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListIngressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            source=workers_subnet_address,
-            source_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Pod to Kubernetes API endpoint communication (when using VCN-native pod networking).",
-            protocol="6",
-            source=pods_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=6443,
-                min=6443,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Pod to Kubernetes API endpoint communication (when using VCN-native pod networking).",
-            protocol="6",
-            source=pods_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=12250,
-                min=12250,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="External access to Kubernetes API endpoint.",
-            protocol="6",
-            source="0.0.0.0/0",
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=6443,
-                min=6443,
-            ),
-        ),
-    ],
-    egress_security_rules=[
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow Kubernetes API endpoint to communicate with OKE.",
-            protocol="6",
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListEgressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow Kubernetes API endpoint to communicate with worker nodes.",
-            protocol="6",
-            destination=workers_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=10250,
-                min=10250,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListEgressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            destination=workers_subnet_address,
-            destination_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow Kubernetes API endpoint to communicate with pods (when using VCN-native pod networking).",
-            protocol="all",
-            destination=pods_subnet_address,
-            destination_type="CIDR_BLOCK",
-        ),
-    ],
-)
-
-# Create a separate Security List for the Workers Subnet
-workers_security_list = oci.core.SecurityList(
-    "WorkersSecurityList",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="WorkersSecurityList",
-    ingress_security_rules=[
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Allow Kubernetes API endpoint to communicate with worker nodes.",
-            protocol="6",
-            source=public_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                min=10250,
-                max=10250,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListIngressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            source="0.0.0.0/0",
-            source_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Load balancer to worker nodes node ports.",
-            protocol="6",
-            source=loadbalancers_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                min=30000,
-                max=32767,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Allow load balancer to communicate with kube-proxy on worker nodes.",
-            protocol="6",
-            source=loadbalancers_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                min=10256,
-                max=12250,
-            ),
-        ),
-    ],
-    egress_security_rules=[
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow worker nodes to access pods.",
-            protocol="6",
-            destination=pods_subnet_address,
-            destination_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListEgressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            destination="0.0.0.0/0",
-            destination_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow worker nodes to communicate with OKE.",
-            protocol="6",
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Kubernetes worker to Kubernetes API endpoint communication.",
-            protocol="6",
-            destination=public_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=6443,
-                min=6443,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Kubernetes worker to Kubernetes API endpoint communication.",
-            protocol="6",
-            destination=public_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=12250,
-                min=12250,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Access to external (ex Dokcer) container registry",
-            protocol="6",
-            destination="0.0.0.0/0",
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=443,
-                min=443,
-            ),
-        ),
-    ],
-)
-
-# Create a separate Security List for the Pods Subnet
-pods_security_list = oci.core.SecurityList(
-    "PodSecurityList",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="PodSecurityList",
-    ingress_security_rules=[
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Allow worker nodes to access pods.",
-            protocol="all",
-            source=workers_subnet_address,
-            source_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Allow Kubernetes API endpoint to communicate with pods.",
-            protocol="all",
-            source=public_subnet_address,
-            source_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Allow pods to communicate with other pods.",
-            protocol="all",
-            source=pods_subnet_address,
-            source_type="CIDR_BLOCK",
-        ),
-    ],
-    egress_security_rules=[
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow pods to communicate with other pods.",
-            protocol="all",
-            destination=pods_subnet_address,
-            destination_type="CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Path discovery",
-            icmp_options=oci.core.SecurityListEgressSecurityRuleIcmpOptionsArgs(
-                code=4,
-                type=3,
-            ),
-            protocol="1",
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow pods to communicate with OCI services.",
-            protocol="6",
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="(optional) Allow pods to communicate with internet.",
-            protocol="6",
-            destination="0.0.0.0/0",
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=443,
-                min=443,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Pod to Kubernetes API endpoint communication (when using VCN-native pod networking).",
-            protocol="6",
-            destination=public_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=6443,
-                min=6443,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Pod to Kubernetes API endpoint communication (when using VCN-native pod networking).",
-            protocol="6",
-            destination=public_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=12250,
-                min=12250,
-            ),
-        ),
-    ],
-)
-
-
-# Create a separate Security List for the Public Subnet
-loadbalancers_security_list = oci.core.SecurityList(
-    "LoadBalancersSecurityList",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="LoadBalancersSecurityList",
-    ingress_security_rules=[
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Load balancer listener protocol and port. Customize as required.",
-            protocol="6",
-            source=pods_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=443,
-                min=443,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Load balancer listener protocol and port. Customize as required.",
-            protocol="6",
-            source=pods_subnet_address,
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=80,
-                min=80,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Load balancer listener protocol and port. Customize as required.",
-            protocol="6",
-            source="0.0.0.0/0",
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=443,
-                min=443,
-            ),
-        ),
-        oci.core.SecurityListIngressSecurityRuleArgs(
-            description="Load balancer listener protocol and port. Customize as required.",
-            protocol="6",
-            source="0.0.0.0/0",
-            source_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
-                max=80,
-                min=80,
-            ),
-        ),
-    ],
-    egress_security_rules=[
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Load balancer to worker nodes node ports.",
-            protocol="6",
-            destination=workers_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                min=30000,
-                max=32767,
-            ),
-        ),
-        oci.core.SecurityListEgressSecurityRuleArgs(
-            description="Allow load balancer to communicate with kube-proxy on worker nodes.",
-            protocol="6",
-            destination=workers_subnet_address,
-            destination_type="CIDR_BLOCK",
-            tcp_options=oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
-                max=10256,
-                min=10256,
-            ),
-        ),
-    ],
-)
-
-
-# Create a Route Table for the private subnet with a route via the NAT Gateway
-workers_route_table = oci.core.RouteTable(
-    "WorkersRouteTable",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="WorkersRouteTable",
-    route_rules=[
-        oci.core.RouteTableRouteRuleArgs(
-            destination="0.0.0.0/0",
-            network_entity_id=nat_gateway.id,
-        ),
-        oci.core.RouteTableRouteRuleArgs(
-            destination=oci.core.get_services().services[0].cidr_block,
-            destination_type="SERVICE_CIDR_BLOCK",
-            network_entity_id=service_gateway.id,
-        ),
-    ],
-)
-
-# Create a Route Table for the public subnet with a route via the Internet Gateway
-public_route_table = oci.core.RouteTable(
-    "PublicRouteTable",
+lookups = Lookups(compartment_id, region, cache_ttl=lookup_cache_ttl)
+cluster_args = OkeClusterArgs(
     compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="PublicRouteTable",
-    route_rules=[
-        oci.core.RouteTableRouteRuleArgs(
-            destination="0.0.0.0/0",
-            network_entity_id=internet_gateway.id,
-        ),
-    ],
-)
-
-# Create a Route Table for the loadbalancers subnet with a route via the Internet Gateway
-loadbalancers_route_table = oci.core.RouteTable(
-    "LoadBalancersRouteTable",
-    compartment_id=compartment_id,
-    vcn_id=vcn.id,
-    display_name="LoadBalancersRouteTable",
-    route_rules=[
-        oci.core.RouteTableRouteRuleArgs(
-            destination="0.0.0.0/0",
-            network_entity_id=internet_gateway.id,
-        ),
-    ],
-)
-
-# Create a Public Subnet within the VCN
-public_subnet = oci.core.Subnet(
-    "PublicSubnet",
-    compartment_id=compartment_id,
-    security_list_ids=[public_security_list.id],
-    vcn_id=vcn.id,
-    cidr_block=public_subnet_address,
-    display_name="PublicSubnet",
-    dns_label="public",
-    prohibit_public_ip_on_vnic=False,
-    route_table_id=public_route_table.id,
-)
-
-# Create a Private Subnet within the VCN
-workers_subnet = oci.core.Subnet(
-    "WorkersSubnet",
-    compartment_id=compartment_id,
-    security_list_ids=[workers_security_list.id],
-    vcn_id=vcn.id,
-    cidr_block=workers_subnet_address,
-    display_name="WorkersSubnet",
-    dns_label="workers",
-    prohibit_public_ip_on_vnic=True,
-    route_table_id=workers_route_table.id,
-)
-
-# Create a Pods Subnet within the VCN
-pods_subnet = oci.core.Subnet(
-    "PodsSubnet",
-    compartment_id=compartment_id,
-    security_list_ids=[pods_security_list.id],
-    vcn_id=vcn.id,
-    cidr_block=pods_subnet_address,
-    display_name="PodsSubnet",
-    dns_label="pods",
-    prohibit_public_ip_on_vnic=True,
-    route_table_id=workers_route_table.id,
-)
-
-# Create a LoadBalancers Subnet within the VCN
-loadbalancers_subnet = oci.core.Subnet(
-    "LoadBalancersSubnet",
-    compartment_id=compartment_id,
-    security_list_ids=[loadbalancers_security_list.id],
-    vcn_id=vcn.id,
-    cidr_block=loadbalancers_subnet_address,
-    display_name="LoadBalancersSubnet",
-    dns_label="loadbalancers",
-    prohibit_public_ip_on_vnic=False,
-    route_table_id=loadbalancers_route_table.id,
-)
-
-# Create the OKE cluster
-oke_cluster = oci.containerengine.Cluster(
-    "OkeCluster",
-    compartment_id=compartment_id,
-    name="OkeCluster",
+    vcn_cidr_block=vcn_cidr_block,
     kubernetes_version=kubernetes_version,
-    options=oci.containerengine.ClusterOptionsArgs(
-        service_lb_subnet_ids=[loadbalancers_subnet.id],
-        kubernetes_network_config=oci.containerengine.ClusterOptionsKubernetesNetworkConfigArgs(
-            pods_cidr="10.2.0.0/16",
-            services_cidr="10.3.0.0/16",
-        ),
-    ),
-    cluster_pod_network_options=[
-        oci.containerengine.ClusterClusterPodNetworkOptionArgs(
-            cni_type="OCI_VCN_IP_NATIVE",
-        )
-    ],
-    type="BASIC_CLUSTER",
-    vcn_id=vcn.id,
-    endpoint_config=oci.containerengine.ClusterEndpointConfigArgs(
-        subnet_id=public_subnet.id, is_public_ip_enabled=True
-    ),
-)
-
-if node_image_id == "":
-    test_node_pool_option = oci.containerengine.get_node_pool_option_output(
-        node_pool_option_id=oke_cluster.id, compartment_id=compartment_id
-    )
-
-    c = test_node_pool_option.sources
-    node_image_id = c.apply(
-        lambda images: get_oke_image(images, node_shape, kubernetes_version)
+    node_pools=node_pool_specs(config.get_object("node_pools"), node_pool_defaults),
+    virtual_node_pools=virtual_node_pools,
+    ssh_key=ssh_key,
+    max_pods_per_node=max_pods_per_node,
+    load_balancer_count=load_balancer_count,
+    load_balancer_profile=load_balancer_profile,
+    load_balancer_ports=load_balancer_ports,
+    load_balancer_min_bandwidth=load_balancer_min_bandwidth,
+    load_balancer_max_bandwidth=load_balancer_max_bandwidth,
+    subnet_headroom=subnet_headroom,
+    subnet_layout=vcn_subnet_layout,
+    ipv6=ipv6,
+    kubernetes_pods_cidr=kubernetes_pods_cidr,
+    kubernetes_services_cidr=kubernetes_services_cidr,
+    cni_type=cni_type,
+    cluster_type=cluster_type,
+    security_mode=security_mode,
+    cluster_autoscaler=cluster_autoscaler,
+    autoscaler_scale_down_delay=autoscaler_scale_down_delay,
+    autoscaler_expander=autoscaler_expander,
+    tenancy_id=tenancy_id,
+    stack_mode=stack_mode,
+    network_stack=network_stack,
+    kubeconfig_path=kubeconfig_path,
+    kubeconfig_token_cache=kubeconfig_token_cache,
+    wait_for_ready=wait_for_ready,
+    ready_timeout=ready_timeout,
+    smoke_pods=smoke_pods,
+    kube_proxy_mode=kube_proxy_mode,
+    coredns_min_replicas=coredns_min_replicas,
+    coredns_nodes_per_replica=coredns_nodes_per_replica,
+    nodelocal_dns=nodelocal_dns,
+    service_gateway_all_services=service_gateway_all_services,
+    capacity_preflight=capacity_preflight,
+    capacity_report_file=capacity_report_file,
+    observability=observability,
+    log_retention_days=log_retention_days,
+    alarm_cpu_threshold=alarm_cpu_threshold,
+    alarm_memory_threshold=alarm_memory_threshold,
+    alarm_email=alarm_email,
+)
+
+if clusters:
+    # Independent clusters, each one in its own VCN, provisioned concurrently
+    if stack_mode != "all":
+        raise ValueError("The clusters list needs stack_mode all")
+    oke_clusters = {
+        name: OkeCluster(name, args, lookups)
+        for name, args in clusters_args(clusters, cluster_args, node_pool_defaults)
+    }
+    pulumi.export(
+        "clusters", {name: c.stack_outputs() for name, c in oke_clusters.items()}
     )
-
-
-get_ad_names = oci.identity.get_availability_domains_output(
-    compartment_id=compartment_id
-)
-ads = get_ad_names.availability_domains
-
-# Create a node pool
-node_pool = oci.containerengine.NodePool(
-    "NodePool",
-    name="NodePool",
-    cluster_id=oke_cluster.id,
-    compartment_id=compartment_id,
-    kubernetes_version=kubernetes_version,
-    node_config_details=oci.containerengine.NodePoolNodeConfigDetailsArgs(
-        placement_configs=ads.apply(lambda ads: get_ads(ads, workers_subnet.id)),
-        size=oke_min_nodes,
-        node_pool_pod_network_option_details=oci.containerengine.NodePoolNodeConfigDetailsNodePoolPodNetworkOptionDetailsArgs(
-            cni_type="OCI_VCN_IP_NATIVE", pod_subnet_ids=[pods_subnet.id]
-        ),
-    ),
-    node_shape=node_shape,
-    node_shape_config=oci.containerengine.NodePoolNodeShapeConfigArgs(
-        memory_in_gbs=oke_memory_in_gbs, ocpus=oke_ocpus
-    ),
-    node_source_details=oci.containerengine.NodePoolNodeSourceDetailsArgs(
-        image_id=node_image_id,
-        source_type="IMAGE",
-    ),
-    ssh_public_key=ssh_key if ssh_key else None,
-)
-
-# Retrieve the kubeconfig
-cluster_kube_config = oke_cluster.id.apply(
-    lambda cid: oci.containerengine.get_cluster_kube_config(cluster_id=cid)
-)
-
-cluster_kube_config.content.apply(lambda cc: open("kubeconfig", "w+").write(cc))
-
-pulumi.export("vcn_id", vcn.id)
-pulumi.export("internet_gateway_id", internet_gateway.id)
-pulumi.export("nat_gateway_id", nat_gateway.id)
-pulumi.export("service_gateway_id", service_gateway.id)
-pulumi.export("public_subnet_id", public_subnet.id)
-pulumi.export("pods_subnet_id", pods_subnet.id)
-pulumi.export("public_security_list_id", public_security_list.id)
-pulumi.export("workers_security_list_id", workers_security_list.id)
-pulumi.export("pods_security_list_id", pods_security_list.id)
-pulumi.export("cluster_id", oke_cluster.id)
-pulumi.export("node_pool_id", node_pool.id)
+else:
+    oke_cluster = OkeCluster("oke", cluster_args, lookups)
+    for key, value in oke_cluster.stack_outputs().items():
+        pulumi.export(key, value)
+    if stack_mode != "network":
+        pulumi.export(
+            "dependency_graph",
+            {
+                "node_images": get_dependencies(list(oke_cluster.node_images.values())),
+                "availability_domains": get_dependencies(oke_cluster.ads),
+                "node_pools": get_dependencies(oke_cluster.node_pool_inputs),
+            },
+        )
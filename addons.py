@@ -0,0 +1,312 @@
+import json
+import re
+import time
+from readiness import kubectl
+
+###################################################################################################################################
+# kube-system tuning applied with kubectl once the cluster is up: kube-proxy IPVS mode and NodeLocal DNSCache
+###################################################################################################################################
+
+NODELOCAL_DNS_IP = "169.254.20.10"
+NODELOCAL_DNS_IMAGE = "registry.k8s.io/dns/k8s-dns-node-cache:1.23.1"
+CLUSTER_DOMAIN = "cluster.local"
+# The API server may not accept the writes right after the cluster creation
+RETRIES = 10
+RETRY_DELAY = 15
+
+# The Corefile of the upstream NodeLocal DNSCache manifest, the node cache fills
+# __PILLAR__CLUSTER__DNS__ and __PILLAR__UPSTREAM__SERVERS__ when it starts
+NODELOCAL_COREFILE = """{domain}:53 {{
+    errors
+    cache {{
+        success 9984 30
+        denial 9984 5
+    }}
+    reload
+    loop
+    bind {bind}
+    forward . __PILLAR__CLUSTER__DNS__ {{
+        force_tcp
+    }}
+    prometheus :9253
+    health {local_ip}:8080
+}}
+in-addr.arpa:53 {{
+    errors
+    cache 30
+    reload
+    loop
+    bind {bind}
+    forward . __PILLAR__CLUSTER__DNS__ {{
+        force_tcp
+    }}
+    prometheus :9253
+}}
+ip6.arpa:53 {{
+    errors
+    cache 30
+    reload
+    loop
+    bind {bind}
+    forward . __PILLAR__CLUSTER__DNS__ {{
+        force_tcp
+    }}
+    prometheus :9253
+}}
+.:53 {{
+    errors
+    cache 30
+    reload
+    loop
+    bind {bind}
+    forward . __PILLAR__UPSTREAM__SERVERS__
+    prometheus :9253
+}}
+"""
+
+
+def retry(action, log):
+    for attempt in range(RETRIES):
+        try:
+            return action()
+        except RuntimeError as e:
+            if attempt == RETRIES - 1:
+                raise
+            log(f"retrying: {e}")
+            time.sleep(RETRY_DELAY)
+
+
+def use_ipvs(kubeconfig, log=print):
+    # The KubeProxy add-on leaves the ConfigMap to us, the pods are restarted to
+    # pick the new mode up
+    configmap = kubectl(
+        kubeconfig, "get", "configmap", "kube-proxy", "-n", "kube-system", "-o", "json"
+    )
+    key = next((k for k in configmap.get("data", {}) if k.endswith(".conf")), None)
+    if key is None:
+        raise RuntimeError(
+            "The kube-proxy ConfigMap of kube-system has no .conf key, "
+            "the KubeProxy add-on may not have written its configuration yet"
+        )
+    config = configmap["data"][key]
+    if re.search(r"(?m)^mode: \"?ipvs\"?$", config):
+        return False
+    if re.search(r"(?m)^mode:", config):
+        config = re.sub(r"(?m)^mode:.*$", "mode: ipvs", config)
+    else:
+        config += "\nmode: ipvs\n"
+    kubectl(
+        kubeconfig,
+        "patch",
+        "configmap",
+        "kube-proxy",
+        "-n",
+        "kube-system",
+        "--type",
+        "merge",
+        "-p",
+        json.dumps({"data": {key: config}}),
+    )
+    kubectl(
+        kubeconfig, "rollout", "restart", "daemonset", "kube-proxy", "-n", "kube-system"
+    )
+    log("kube-proxy switched to IPVS mode")
+    return True
+
+
+def nodelocal_dns_manifest(kube_dns_ip, ipvs):
+    # In IPVS mode the kube-dns IP is bound by kube-proxy, the cache listens on
+    # the link local IP only and the kubelet points the pods to it
+    labels = {"k8s-app": "node-local-dns"}
+    bind = NODELOCAL_DNS_IP if ipvs else f"{NODELOCAL_DNS_IP} {kube_dns_ip}"
+    return {
+        "apiVersion": "v1",
+        "kind": "List",
+        "items": [
+            {
+                "apiVersion": "v1",
+                "kind": "ServiceAccount",
+                "metadata": {"name": "node-local-dns", "namespace": "kube-system"},
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "Service",
+                "metadata": {
+                    "name": "kube-dns-upstream",
+                    "namespace": "kube-system",
+                    "labels": {"k8s-app": "kube-dns"},
+                },
+                "spec": {
+                    "ports": [
+                        {
+                            "name": "dns",
+                            "port": 53,
+                            "protocol": "UDP",
+                            "targetPort": 53,
+                        },
+                        {
+                            "name": "dns-tcp",
+                            "port": 53,
+                            "protocol": "TCP",
+                            "targetPort": 53,
+                        },
+                    ],
+                    "selector": {"k8s-app": "kube-dns"},
+                },
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {"name": "node-local-dns", "namespace": "kube-system"},
+                "data": {
+                    "Corefile": NODELOCAL_COREFILE.format(
+                        domain=CLUSTER_DOMAIN, bind=bind, local_ip=NODELOCAL_DNS_IP
+                    )
+                },
+            },
+            {
+                "apiVersion": "apps/v1",
+                "kind": "DaemonSet",
+                "metadata": {
+                    "name": "node-local-dns",
+                    "namespace": "kube-system",
+                    "labels": labels,
+                },
+                "spec": {
+                    "updateStrategy": {"rollingUpdate": {"maxUnavailable": "10%"}},
+                    "selector": {"matchLabels": labels},
+                    "template": {
+                        "metadata": {"labels": labels},
+                        "spec": {
+                            "priorityClassName": "system-node-critical",
+                            "serviceAccountName": "node-local-dns",
+                            "hostNetwork": True,
+                            "dnsPolicy": "Default",
+                            "tolerations": [
+                                {"key": "CriticalAddonsOnly", "operator": "Exists"},
+                                {"effect": "NoExecute", "operator": "Exists"},
+                                {"effect": "NoSchedule", "operator": "Exists"},
+                            ],
+                            "containers": [
+                                {
+                                    "name": "node-cache",
+                                    "image": NODELOCAL_DNS_IMAGE,
+                                    "resources": {
+                                        "requests": {"cpu": "25m", "memory": "5Mi"}
+                                    },
+                                    "args": [
+                                        "-localip",
+                                        bind.replace(" ", ","),
+                                        "-conf",
+                                        "/etc/Corefile",
+                                        "-upstreamsvc",
+                                        "kube-dns-upstream",
+                                    ],
+                                    "securityContext": {
+                                        "capabilities": {"add": ["NET_ADMIN"]}
+                                    },
+                                    "ports": [
+                                        {
+                                            "containerPort": 53,
+                                            "name": "dns",
+                                            "protocol": "UDP",
+                                        },
+                                        {
+                                            "containerPort": 53,
+                                            "name": "dns-tcp",
+                                            "protocol": "TCP",
+                                        },
+                                        {
+                                            "containerPort": 9253,
+                                            "name": "metrics",
+                                            "protocol": "TCP",
+                                        },
+                                    ],
+                                    "livenessProbe": {
+                                        "httpGet": {
+                                            "host": NODELOCAL_DNS_IP,
+                                            "path": "/health",
+                                            "port": 8080,
+                                        },
+                                        "initialDelaySeconds": 60,
+                                        "timeoutSeconds": 5,
+                                    },
+                                    "volumeMounts": [
+                                        {
+                                            "mountPath": "/run/xtables.lock",
+                                            "name": "xtables-lock",
+                                        },
+                                        {
+                                            "name": "config-volume",
+                                            "mountPath": "/etc/coredns",
+                                        },
+                                        {
+                                            "name": "kube-dns-config",
+                                            "mountPath": "/etc/kube-dns",
+                                        },
+                                    ],
+                                }
+                            ],
+                            "volumes": [
+                                {
+                                    "name": "xtables-lock",
+                                    "hostPath": {
+                                        "path": "/run/xtables.lock",
+                                        "type": "FileOrCreate",
+                                    },
+                                },
+                                {
+                                    "name": "kube-dns-config",
+                                    "configMap": {
+                                        "name": "kube-dns",
+                                        "optional": True,
+                                    },
+                                },
+                                {
+                                    "name": "config-volume",
+                                    "configMap": {
+                                        "name": "node-local-dns",
+                                        "items": [
+                                            {
+                                                "key": "Corefile",
+                                                "path": "Corefile.base",
+                                            }
+                                        ],
+                                    },
+                                },
+                            ],
+                        },
+                    },
+                },
+            },
+        ],
+    }
+
+
+def deploy_nodelocal_dns(kubeconfig, ipvs, log=print):
+    service = kubectl(
+        kubeconfig, "get", "service", "kube-dns", "-n", "kube-system", "-o", "json"
+    )
+    kube_dns_ip = service["spec"]["clusterIP"]
+    kubectl(
+        kubeconfig,
+        "apply",
+        "-f",
+        "-",
+        stdin=json.dumps(nodelocal_dns_manifest(kube_dns_ip, ipvs)),
+    )
+    log(f"NodeLocal DNSCache deployed in front of {kube_dns_ip}")
+    return kube_dns_ip
+
+
+def configure_kube_system(kubeconfig, ipvs, nodelocal_dns, log=print):
+    report = {}
+    if ipvs:
+        retry(lambda: use_ipvs(kubeconfig, log), log)
+        report["kube_proxy_mode"] = "ipvs"
+    if nodelocal_dns:
+        report["nodelocal_dns"] = {
+            "ip": NODELOCAL_DNS_IP,
+            "upstream": retry(lambda: deploy_nodelocal_dns(kubeconfig, ipvs, log), log),
+        }
+    return report
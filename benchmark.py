@@ -0,0 +1,139 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from tests.mocks import PERMUTATIONS, default_config, evaluate
+
+###################################################################################################################################
+# Wall time, invokes and resources of the program on the mocked providers of tests/mocks.py
+###################################################################################################################################
+
+# Supernets split by calculate_subnets in the --subnets micro-benchmark
+SUBNET_CASES = [
+    ("10.0.0.0/16", 4),
+    ("10.0.0.0/8", 4096),
+    ("2001:db8::/56", 256),
+    ("2001:db8::/32", 16),
+    ("2001:db8::/32", 65536),
+]
+
+
+def benchmark_subnets(repeat):
+    from subnets import calculate_subnets
+
+    print(f"{'supernet':<20}{'subnets':>10}{'median ms':>12}{'min ms':>10}")
+    report = {}
+    for cidr, count in SUBNET_CASES:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            calculate_subnets(cidr, count)
+            timings.append((time.perf_counter() - start) * 1000)
+        report[f"{cidr}/{count}"] = {
+            "median_ms": round(statistics.median(timings), 3),
+            "min_ms": round(min(timings), 3),
+        }
+        print(
+            f"{cidr:<20}{count:>10}{statistics.median(timings):>12.3f}{min(timings):>10.3f}"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate the program against mocked OCI providers and report wall time, invokes and resources"
+    )
+    parser.add_argument(
+        "permutations",
+        nargs="*",
+        help=f"one of {', '.join(PERMUTATIONS)}, all by default",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="evaluations per permutation"
+    )
+    parser.add_argument(
+        "--max-invokes", type=int, help="fail when a permutation makes more invokes"
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="fail when a permutation median wall time is higher",
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument(
+        "--subnets",
+        action="store_true",
+        help="time calculate_subnets on large IPv4 and IPv6 supernets instead",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the invokes and resources by type"
+    )
+    args = parser.parse_args()
+
+    unknown = set(args.permutations) - set(PERMUTATIONS)
+    if unknown:
+        parser.error(f"unknown permutations: {', '.join(sorted(unknown))}")
+
+    if args.subnets:
+        report = benchmark_subnets(args.repeat)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    project, defaults = default_config()
+    report = {}
+    failed = False
+    print(
+        f"{'permutation':<20}{'median ms':>12}{'min ms':>10}{'invokes':>10}{'resources':>12}"
+    )
+    for name in args.permutations or PERMUTATIONS:
+        config = dict(defaults, **PERMUTATIONS[name])
+        with tempfile.TemporaryDirectory() as workdir:
+            # The first evaluation pays the imports of the providers modules
+            evaluate(project, config, workdir)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                mocks, outputs = evaluate(project, config, workdir)
+                timings.append((time.perf_counter() - start) * 1000)
+        result = {
+            "median_ms": round(statistics.median(timings), 3),
+            "min_ms": round(min(timings), 3),
+            "invokes": sum(mocks.invokes.values()),
+            "resources": sum(mocks.resources.values()),
+            "invokes_by_token": dict(mocks.invokes),
+            "resources_by_type": dict(mocks.resources),
+            "dependency_graph": outputs.get("dependency_graph"),
+        }
+        report[name] = result
+        print(
+            f"{name:<20}{result['median_ms']:>12.2f}{result['min_ms']:>10.2f}"
+            f"{result['invokes']:>10}{result['resources']:>12}"
+        )
+        if args.verbose:
+            for token, count in sorted(mocks.invokes.items()):
+                print(f"    invoke   {count:>3} {token}")
+            for typ, count in sorted(mocks.resources.items()):
+                print(f"    resource {count:>3} {typ}")
+        if args.max_invokes is not None and result["invokes"] > args.max_invokes:
+            print(
+                f"    {name}: {result['invokes']} invokes, budget is {args.max_invokes}"
+            )
+            failed = True
+        if args.max_ms is not None and result["median_ms"] > args.max_ms:
+            print(
+                f"    {name}: {result['median_ms']:.2f} ms, budget is {args.max_ms} ms"
+            )
+            failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
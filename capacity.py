@@ -0,0 +1,158 @@
+import concurrent.futures
+import json
+import os
+import re
+import subprocess
+from typing import Dict, List, NamedTuple, Optional
+from nodepools import candidate_shapes, capacity_reservation
+
+###################################################################################################################################
+# Compute capacity preflight
+#
+# The capacity report of every availability domain comes from the OCI CLI, the OKE_CAPACITY_OCI_CLI
+# environment variable replaces the CLI, or from a JSON report file with the same statuses:
+#   {"AD-1": {"VM.Standard.A1.Flex": "OUT_OF_HOST_CAPACITY"},
+#    "AD-2": {"VM.Standard.A1.Flex": {"FAULT-DOMAIN-1": "AVAILABLE", "FAULT-DOMAIN-2": "OUT_OF_HOST_CAPACITY"}}}
+# the availability domains are matched by their name or its AD-<n> suffix.
+###################################################################################################################################
+
+OCI_CLI = os.environ.get("OKE_CAPACITY_OCI_CLI", "oci")
+AVAILABLE = "AVAILABLE"
+# The shapes missing from a report file are not known to be exhausted
+UNKNOWN = "UNKNOWN"
+
+
+class CapacityQuery(NamedTuple):
+    availability_domain: str
+    shape: str
+    ocpus: float
+    memory_in_gbs: float
+    fault_domain: str = ""
+
+
+def capacity_queries(placements) -> List[CapacityQuery]:
+    # The shapes of every pool in its availability domains and pinned fault domains,
+    # the reserved capacity is not queried
+    queries = []
+    for placement in placements:
+        spec = placement.spec
+        for shape in candidate_shapes(spec):
+            for ad in placement.availability_domains:
+                if shape == spec.shape and capacity_reservation(spec, ad):
+                    continue
+                for fd in spec.fault_domains or [""]:
+                    queries.append(
+                        CapacityQuery(ad, shape, spec.ocpus, spec.memory_in_gbs, fd)
+                    )
+    return list(dict.fromkeys(queries))
+
+
+def is_available(statuses, spec, ad, shape, fault_domain):
+    query = CapacityQuery(ad, shape, spec.ocpus, spec.memory_in_gbs, fault_domain)
+    return statuses.get(query, UNKNOWN) in (AVAILABLE, UNKNOWN)
+
+
+def shape_availability(query: CapacityQuery):
+    availability = {"instanceShape": query.shape}
+    if query.shape.endswith(".Flex"):
+        availability["instanceShapeConfig"] = {
+            "ocpus": query.ocpus,
+            "memoryInGBs": query.memory_in_gbs,
+        }
+    if query.fault_domain:
+        availability["faultDomain"] = query.fault_domain
+    return availability
+
+
+def report_availability_domain(compartment_id, ad, queries):
+    # The capacity report is created in the root compartment of the tenancy
+    result = subprocess.run(
+        [
+            OCI_CLI,
+            "compute",
+            "compute-capacity-report",
+            "create",
+            "--compartment-id",
+            compartment_id,
+            "--availability-domain",
+            ad,
+            "--shape-availabilities",
+            json.dumps([shape_availability(q) for q in queries]),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"The capacity report of {ad} failed: {result.stderr.strip()}"
+        )
+    availabilities = json.loads(result.stdout)["data"]["shape-availabilities"]
+    return {
+        q: availability["availability-status"]
+        for q, availability in zip(queries, availabilities)
+    }
+
+
+def query_capacity(
+    compartment_id, queries: List[CapacityQuery]
+) -> Dict[CapacityQuery, str]:
+    # One report per availability domain, all of them at the same time
+    by_ad = {}
+    for query in queries:
+        by_ad.setdefault(query.availability_domain, []).append(query)
+    statuses = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(by_ad) or 1) as pool:
+        for result in pool.map(
+            lambda item: report_availability_domain(compartment_id, *item),
+            by_ad.items(),
+        ):
+            statuses.update(result)
+    return statuses
+
+
+def read_capacity_report(
+    path, queries: List[CapacityQuery]
+) -> Dict[CapacityQuery, str]:
+    with open(path) as f:
+        report = json.load(f)
+    statuses = {}
+    for query in queries:
+        suffix = re.search(r"AD-\d+$", query.availability_domain)
+        shapes = report.get(query.availability_domain) or report.get(
+            suffix[0] if suffix else None, {}
+        )
+        status = shapes.get(query.shape, UNKNOWN)
+        if isinstance(status, dict):
+            # Without a fault domain any of them will do
+            status = (
+                status.get(query.fault_domain, UNKNOWN)
+                if query.fault_domain
+                else AVAILABLE if AVAILABLE in status.values() else min(status.values())
+            )
+        statuses[query] = status
+    return statuses
+
+
+def capacity_report(statuses: Dict[CapacityQuery, str]):
+    # The statuses in the format of the report files, the status of a shape in
+    # its fault domains replaces the one of its availability domain
+    report = {}
+    for query, status in sorted(
+        statuses.items(), key=lambda item: item[0].fault_domain
+    ):
+        shapes = report.setdefault(query.availability_domain, {})
+        if query.fault_domain:
+            if not isinstance(shapes.get(query.shape), dict):
+                shapes[query.shape] = {}
+            shapes[query.shape][query.fault_domain] = status
+        else:
+            shapes[query.shape] = status
+    return report
+
+
+def capacity_statuses(
+    compartment_id, queries: List[CapacityQuery], report_file: Optional[str] = None
+) -> Dict[CapacityQuery, str]:
+    if report_file:
+        return read_capacity_report(report_file, queries)
+    return query_capacity(compartment_id, queries)
@@ -0,0 +1,205 @@
+import base64
+import shlex
+from typing import Dict, NamedTuple, Tuple
+from nodepools import DEFAULT_VPUS_PER_GB, MIN_VOLUME_SIZE_IN_GBS
+
+###################################################################################################################################
+# Worker nodes cloud-init
+###################################################################################################################################
+
+# The default OKE cloud-init, it downloads and runs the node bootstrap script
+OKE_INIT_SCRIPT = """#!/bin/bash
+{prepare}curl --fail -H "Authorization: Bearer Oracle" -L0 http://169.254.169.254/opc/v2/instance/metadata/oke_init_script | base64 --decode >/var/run/oke-init.sh
+bash /var/run/oke-init.sh{args}
+{finish}"""
+
+# Grow the root filesystem to a boot volume larger than the image
+GROW_FS_SCRIPT = """/usr/libexec/oci-growfs -y || echo "oci-growfs failed" >&2
+"""
+
+# The node changes its own block volumes with the OCI CLI of the Oracle Linux images and
+# the instance principal, nothing is installed at boot. A failure leaves the node on its
+# boot volume but does not stop its bootstrap, set -e would be ignored in a subshell
+# followed by ||
+VOLUMES_SCRIPT = """(
+set -e
+command -v oci >/dev/null || {{ echo "the node image has no OCI CLI" >&2; exit 1; }}
+export OCI_CLI_AUTH=instance_principal
+imds() {{ curl -sf -H "Authorization: Bearer Oracle" "http://169.254.169.254/opc/v2/instance/$1"; }}
+instance_id=$(imds id)
+compartment_id=$(imds compartmentId)
+ad=$(imds availabilityDomain)
+{volumes})
+[ $? -eq 0 ] || echo "node volumes setup failed" >&2
+"""
+
+BOOT_VOLUME_VPUS_SCRIPT = """boot_volume_id=$(oci compute boot-volume-attachment list --availability-domain "$ad" --compartment-id "$compartment_id" --instance-id "$instance_id" --query 'data[0]."boot-volume-id"' --raw-output)
+oci bv boot-volume update --boot-volume-id "$boot_volume_id" --vpus-per-gb {vpus} --force >/dev/null
+"""
+
+# The containerd volume is tagged with its instance, it is not deleted with the node
+# but by the next nodes booting in its availability domain, see CONTAINERD_REAP_SCRIPT
+CONTAINERD_VOLUME_SCRIPT = """volume_id=$(oci bv volume create --availability-domain "$ad" --compartment-id "$compartment_id" --display-name "$(hostname)-containerd" --size-in-gbs {size} --vpus-per-gb {vpus} --freeform-tags "{{\\"oke-containerd-instance\\": \\"$instance_id\\"}}" --wait-for-state AVAILABLE --query data.id --raw-output)
+oci compute volume-attachment attach-paravirtualized-volume --instance-id "$instance_id" --volume-id "$volume_id" --device {device} --wait-for-state ATTACHED >/dev/null
+for i in $(seq 60); do [ -b {device} ] && break; sleep 2; done
+mkfs.xfs -q {device}
+mkdir -p /var/lib/containerd
+echo "{device} /var/lib/containerd xfs defaults,_netdev,nofail 0 2" >>/etc/fstab
+mount /var/lib/containerd
+(
+{reap}) >/var/log/oke-containerd-reap.log 2>&1 &
+"""
+CONTAINERD_DEVICE = "/dev/oracleoci/oraclevdb"
+
+# Deletes in the background the detached containerd volumes of the availability domain whose
+# instance is terminated, the volume of a running or stopped node is never deleted
+CONTAINERD_REAP_SCRIPT = """for volume in $(oci bv volume list --compartment-id "$compartment_id" --availability-domain "$ad" --lifecycle-state AVAILABLE --all --query 'data[?"freeform-tags"."oke-containerd-instance"].join(`":"`, [id, "freeform-tags"."oke-containerd-instance"])' --raw-output | tr -d '[]",'); do
+state=$(oci compute instance get --instance-id "${volume#*:}" --query 'data."lifecycle-state"' --raw-output 2>&1) || true
+case "$state" in
+TERMINATED | *'"status": 404'*) oci bv volume delete --volume-id "${volume%%:*}" --force && echo "deleted ${volume%%:*} of ${volume#*:}" ;;
+esac
+done
+"""
+
+
+# Pull the images in parallel once the bootstrap started containerd, the pods
+# scheduled meanwhile share the pulls in progress
+PREPULL_SCRIPT = """for i in $(seq 30); do crictl --runtime-endpoint {endpoint} info >/dev/null 2>&1 && break; sleep 2; done
+for image in {images}; do crictl --runtime-endpoint {endpoint} pull "$image" >/dev/null || echo "pre-pull of $image failed" >&2 & done
+wait
+"""
+CONTAINERD_ENDPOINT = "unix:///run/containerd/containerd.sock"
+
+# The kernel modules of kube-proxy in IPVS mode, also loaded at reboot
+IPVS_MODULES = ("ip_vs", "ip_vs_rr", "ip_vs_wrr", "ip_vs_sh", "nf_conntrack")
+IPVS_SCRIPT = """printf '%s\\n' {modules} >/etc/modules-load.d/oke-ipvs.conf
+for module in {modules}; do modprobe $module; done
+"""
+
+###################################################################################################################################
+# Tuning profiles
+###################################################################################################################################
+
+
+class TuningProfile(NamedTuple):
+    sysctls: Dict[str, str] = {}
+    kubelet_extra_args: Tuple[str, ...] = ()
+    # Kernel modules loaded before the sysctls that belong to them, also at reboot
+    modules: Tuple[str, ...] = ()
+
+
+TUNING_PROFILES = {
+    "default": TuningProfile(),
+    # Many concurrent connections, large socket buffers and queues
+    "high-throughput-network": TuningProfile(
+        sysctls={
+            "net.netfilter.nf_conntrack_max": "1048576",
+            "net.core.somaxconn": "32768",
+            "net.core.netdev_max_backlog": "16384",
+            "net.core.rmem_max": "16777216",
+            "net.core.wmem_max": "16777216",
+            "net.ipv4.tcp_rmem": "4096 87380 16777216",
+            "net.ipv4.tcp_wmem": "4096 65536 16777216",
+            "net.ipv4.tcp_max_syn_backlog": "8192",
+            "net.ipv4.ip_local_port_range": "1024 65535",
+            "net.ipv4.tcp_tw_reuse": "1",
+            "fs.file-max": "2097152",
+        },
+        modules=("nf_conntrack",),
+    ),
+    # Exclusive CPUs for the Guaranteed pods and no kernel work moving their memory
+    "latency-sensitive": TuningProfile(
+        sysctls={
+            "net.core.busy_poll": "50",
+            "net.core.busy_read": "50",
+            "kernel.numa_balancing": "0",
+            "vm.swappiness": "0",
+        },
+        kubelet_extra_args=(
+            "--cpu-manager-policy=static",
+            "--topology-manager-policy=best-effort",
+        ),
+    ),
+}
+
+TUNING_SCRIPT = """{modules}cat >/etc/sysctl.d/90-oke-tuning.conf <<'EOF'
+{sysctls}EOF
+sysctl -q --system
+"""
+
+
+def oke_init_script(kubelet_extra_args=(), prepare=(), finish=()):
+    args = ""
+    if kubelet_extra_args:
+        args = " --kubelet-extra-args " + shlex.quote(" ".join(kubelet_extra_args))
+    return OKE_INIT_SCRIPT.format(
+        prepare="".join(prepare), args=args, finish="".join(finish)
+    )
+
+
+def tuning_script(spec):
+    # The sysctls of the profile and the 2 MiB huge pages, set before the kubelet
+    # starts so it reports the huge pages of the node
+    profile = TUNING_PROFILES[spec.tuning_profile]
+    sysctls = dict(profile.sysctls)
+    if spec.hugepages:
+        sysctls["vm.nr_hugepages"] = str(spec.hugepages)
+    if not sysctls:
+        return []
+    return [
+        TUNING_SCRIPT.format(
+            modules="".join(
+                f"echo {module} >>/etc/modules-load.d/oke-tuning.conf\nmodprobe {module}\n"
+                for module in profile.modules
+            ),
+            sysctls="".join(f"{key} = {value}\n" for key, value in sysctls.items()),
+        )
+    ]
+
+
+def ipvs_script():
+    return [IPVS_SCRIPT.format(modules=" ".join(IPVS_MODULES))]
+
+
+def kubelet_extra_args(spec, vcn_native, cluster_dns=None):
+    # With flannel the pods per node are limited by the kubelet
+    args = [] if vcn_native else [f"--max-pods={spec.max_pods_per_node}"]
+    if cluster_dns:
+        args.append(f"--cluster-dns={cluster_dns}")
+    return args + list(TUNING_PROFILES[spec.tuning_profile].kubelet_extra_args)
+
+
+def storage_script(spec):
+    # The storage setup of a node pool, run before the node joins the cluster
+    # so containerd starts on its volume
+    parts = []
+    if spec.boot_volume_size_in_gbs > MIN_VOLUME_SIZE_IN_GBS:
+        parts.append(GROW_FS_SCRIPT)
+    volumes = ""
+    if spec.boot_volume_vpus_per_gb != DEFAULT_VPUS_PER_GB:
+        volumes += BOOT_VOLUME_VPUS_SCRIPT.format(vpus=spec.boot_volume_vpus_per_gb)
+    if spec.containerd_volume_size_in_gbs:
+        volumes += CONTAINERD_VOLUME_SCRIPT.format(
+            size=spec.containerd_volume_size_in_gbs,
+            vpus=spec.containerd_volume_vpus_per_gb,
+            device=CONTAINERD_DEVICE,
+            reap=CONTAINERD_REAP_SCRIPT,
+        )
+    if volumes:
+        parts.append(VOLUMES_SCRIPT.format(volumes=volumes))
+    return parts
+
+
+def prepull_script(spec):
+    if not spec.prepull_images:
+        return []
+    return [
+        PREPULL_SCRIPT.format(
+            endpoint=CONTAINERD_ENDPOINT,
+            images=" ".join(shlex.quote(image) for image in spec.prepull_images),
+        )
+    ]
+
+
+def user_data(script):
+    return base64.b64encode(script.encode()).decode()
@@ -0,0 +1,1468 @@
+import pulumi
+import pulumi_oci as oci
+import asyncio
+import datetime
+import ipaddress
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from addons import NODELOCAL_DNS_IP, configure_kube_system
+from capacity import capacity_queries, capacity_report, capacity_statuses, is_available
+from cloudinit import (
+    TUNING_PROFILES,
+    ipvs_script,
+    kubelet_extra_args,
+    oke_init_script,
+    prepull_script,
+    storage_script,
+    tuning_script,
+    user_data,
+)
+from images import ImageCatalog
+from observability import (
+    FLOW_LOG_TIERS,
+    LOG_RETENTION_DAYS,
+    nat_gateway_alarm,
+    node_alarms,
+)
+from readiness import smoke_benchmark, wait_ready
+from nodepools import (
+    CAPACITY_FIT_TAG,
+    NodePoolSpec,
+    VirtualNodePoolSpec,
+    capacity_reservation,
+    fit_new_capacity,
+    is_flexible,
+    MIN_VOLUME_SIZE_IN_GBS,
+    manages_volumes,
+    node_pool_specs,
+    place_node_pools,
+    planned_counts,
+    storage_layout,
+    virtual_node_pool_specs,
+)
+from security import (
+    LOAD_BALANCER_PROFILES,
+    compile_rules,
+    ipv6_flows,
+    nsg_rule_args,
+    nsg_rule_name,
+    oke_flows,
+    security_list_egress_rules,
+    security_list_ingress_rules,
+)
+from subnets import (
+    DEFAULT_SUBNET_LAYOUT,
+    calculate_subnets,
+    check_disjoint,
+    check_overlay_capacity,
+    ipv6_subnets,
+    plan_subnets,
+    rebase_cidr,
+    subnet_requests,
+)
+
+###################################################################################################################################
+# Utils
+###################################################################################################################################
+
+
+def get_ads(ads, net, spec=None):
+    z = []
+    for ad in ads:
+        placement = {"availability_domain": ad, "subnet_id": net}
+        if spec and spec.fault_domains:
+            placement["fault_domains"] = spec.fault_domains
+        if spec and capacity_reservation(spec, ad):
+            placement["capacity_reservation_id"] = capacity_reservation(spec, ad)
+        z.append(placement)
+    return z
+
+
+def gateway_service(services, all_services):
+    # Only the "All <region> Services In Oracle Services Network" CIDR reaches OCIR,
+    # the first service is kept otherwise, so the existing gateways do not change
+    if all_services:
+        for service in services:
+            if service.cidr_block.startswith("all-"):
+                return service
+        raise ValueError("The region has no all services service gateway CIDR")
+    return services[0]
+
+
+def use_token_cache(kubeconfig, helper):
+    # Mint the exec credentials through the caching helper instead of the OCI CLI
+    return re.sub(r"(?m)^(\s*)command: oci$", rf"\g<1>command: {helper}", kubeconfig)
+
+
+def get_virtual_node_ads(ads, net, spec):
+    return [
+        oci.containerengine.VirtualNodePoolPlacementConfigurationArgs(
+            availability_domain=ad,
+            fault_domains=spec.fault_domains,
+            subnet_id=net,
+        )
+        for ad in ads
+    ]
+
+
+def write_file(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def post_deploy(kubeconfig_path, expected_nodes, timeout, smoke_pods, started):
+    # Runs in a thread so the waits do not block the other clusters of the stack
+    def log(message):
+        pulumi.log.info(f"{kubeconfig_path}: {message}")
+
+    def run():
+        report = {
+            "readiness": wait_ready(kubeconfig_path, expected_nodes, timeout, log)
+        }
+        report["time_to_ready"] = round(time.monotonic() - started, 1)
+        if not report["readiness"]["ready"]:
+            pulumi.log.warn(
+                f"{kubeconfig_path}: the cluster is not ready after {timeout} seconds"
+            )
+        elif smoke_pods:
+            report["smoke_benchmark"] = smoke_benchmark(
+                kubeconfig_path, smoke_pods, timeout, log
+            )
+        return report
+
+    if pulumi.runtime.is_dry_run():
+        return None
+    return asyncio.get_event_loop().run_in_executor(None, run)
+
+
+def load_balancer_annotations(args, nsg_ids, subnet_id):
+    # The Service annotations matching the security rules of the load balancers
+    # profile, the security rules are not managed by the cloud controller
+    if args.load_balancer_profile == "network":
+        annotations = {
+            "oci.oraclecloud.com/load-balancer-type": "nlb",
+            "oci-network-load-balancer.oraclecloud.com/is-preserve-source": "true",
+            "oci-network-load-balancer.oraclecloud.com/security-list-management-mode": "None",
+            "oci-network-load-balancer.oraclecloud.com/subnet": subnet_id,
+        }
+    else:
+        annotations = {
+            "oci.oraclecloud.com/load-balancer-type": "lb",
+            "service.beta.kubernetes.io/oci-load-balancer-shape": "flexible",
+            "service.beta.kubernetes.io/oci-load-balancer-shape-flex-min": str(
+                args.load_balancer_min_bandwidth
+            ),
+            "service.beta.kubernetes.io/oci-load-balancer-shape-flex-max": str(
+                args.load_balancer_max_bandwidth
+            ),
+            "service.beta.kubernetes.io/oci-load-balancer-security-list-management-mode": "None",
+        }
+    if nsg_ids is not None:
+        annotations["oci.oraclecloud.com/oci-network-security-groups"] = (
+            pulumi.Output.from_input(nsg_ids).apply(
+                lambda ids: ",".join(ids) if ids else None
+            )
+        )
+    return annotations
+
+
+def post_configure(kubeconfig_path, ipvs, nodelocal_dns):
+    def log(message):
+        pulumi.log.info(f"{kubeconfig_path}: {message}")
+
+    if pulumi.runtime.is_dry_run():
+        return None
+    return asyncio.get_event_loop().run_in_executor(
+        None, lambda: configure_kube_system(kubeconfig_path, ipvs, nodelocal_dns, log)
+    )
+
+
+def parse_timestamp(timestamp):
+    return datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def last_cycle(compartment_id, node_pool_id):
+    # The latest cycling of the nodes of a pool, still in progress when it
+    # outlasts the deploy, the next deploy reports its end
+    cycles = [
+        w
+        for w in oci.containerengine.get_work_requests(
+            compartment_id=compartment_id,
+            resource_id=node_pool_id,
+            resource_type="NODEPOOL",
+        ).work_requests
+        if w.operation_type == "NODEPOOL_CYCLING"
+    ]
+    if not cycles:
+        return None
+    cycle = max(cycles, key=lambda w: w.time_accepted)
+    seconds = None
+    if cycle.time_started and cycle.time_finished:
+        seconds = (
+            parse_timestamp(cycle.time_finished) - parse_timestamp(cycle.time_started)
+        ).total_seconds()
+    return {
+        "status": cycle.status,
+        "started": cycle.time_started,
+        "finished": cycle.time_finished,
+        "seconds": seconds,
+    }
+
+
+def autoscaler_policy_statements(dynamic_group, compartment):
+    return [
+        f"Allow dynamic-group {dynamic_group} to {verb} in compartment id {compartment}"
+        for verb in (
+            "manage cluster-node-pools",
+            "manage instance-family",
+            "use subnets",
+            "read virtual-network-family",
+            "use vnics",
+            "inspect compartments",
+        )
+    ]
+
+
+def volume_policy_statements(dynamic_group, compartment):
+    return [
+        f"Allow dynamic-group {dynamic_group} to {verb} in compartment id {compartment}"
+        for verb in ("manage volume-family", "use instance-family")
+    ]
+
+
+def volume_matching_rule(compartment, tag_namespace, tag):
+    # Only the nodes of the pools managing their volumes carry the tag
+    return (
+        f"ALL {{instance.compartment.id = '{compartment}', "
+        f"tag.{tag_namespace}.{tag}.value = 'true'}}"
+    )
+
+
+def virtual_node_policy_statements(compartment_name, pods_subnet_id):
+    # The documented tenancy policy of the virtual nodes: the OKE service tenancy may
+    # only attach the container instances it creates for them to the pods subnet
+    return [
+        f"define tenancy ContainerEngine as {CONTAINER_ENGINE_TENANCY_ID}",
+        f"endorse any-user to associate compute-container-instances in compartment {compartment_name} "
+        f"of tenancy ContainerEngine with subnets in compartment {compartment_name} "
+        "where ALL {request.principal.type='virtualnode', "
+        "request.operation='CreateContainerInstance', "
+        f"request.principal.subnet='{pods_subnet_id}'}}",
+    ]
+
+
+def ipv6_rule(rule, vcn_ipv6_cidr):
+    # The IPv6 rules are compiled against IPV6_PLACEHOLDER_CIDR, their tier peers
+    # move to the block Oracle allocates to the VCN
+    if rule.peer_type != "CIDR_BLOCK":
+        return rule
+    peer = ipaddress.ip_network(rule.peer)
+    placeholder = ipaddress.ip_network(IPV6_PLACEHOLDER_CIDR)
+    if peer.version != 6 or not peer.subnet_of(placeholder):
+        return rule
+    return rule._replace(
+        peer=vcn_ipv6_cidr.apply(
+            lambda cidr: rebase_cidr(rule.peer, IPV6_PLACEHOLDER_CIDR, cidr)
+        )
+    )
+
+
+def node_user_data(spec, vcn_native, ipvs=False, cluster_dns=None):
+    # The stock OKE cloud-init is kept when nothing changes it
+    prepare = (
+        tuning_script(spec) + (ipvs_script() if ipvs else []) + storage_script(spec)
+    )
+    finish = prepull_script(spec)
+    extra_args = kubelet_extra_args(spec, vcn_native, cluster_dns)
+    if not prepare and not finish and not extra_args:
+        return None
+    return {"user_data": user_data(oke_init_script(extra_args, prepare, finish))}
+
+
+###################################################################################################################################
+# OKE cluster component
+###################################################################################################################################
+
+SECURITY_TIERS = {
+    "public": "Public",
+    "workers": "Workers",
+    "pods": "Pod",
+    "loadbalancers": "LoadBalancers",
+}
+
+# The OKE service tenancy running the container instances of the virtual nodes
+CONTAINER_ENGINE_TENANCY_ID = (
+    "ocid1.tenancy.oc1..aaaaaaaa6y3oz5kmqumnaa2vpvjwh2dnfpaqd5ddkncevgj3c7vlrdjiiq"
+)
+
+# The documentation prefix standing for the IPv6 /56 of the VCN until Oracle allocates it
+IPV6_PLACEHOLDER_CIDR = "2001:db8::/56"
+
+# Settings of the clusters config entries, the missing ones come from the stack config
+CLUSTER_SETTINGS = (
+    "vcn_cidr_block",
+    "kubernetes_version",
+    "cni_type",
+    "cluster_type",
+    "security_mode",
+    "load_balancer_count",
+    "load_balancer_profile",
+    "ipv6",
+    "kubernetes_pods_cidr",
+    "kubernetes_services_cidr",
+    "cluster_autoscaler",
+    "node_pools",
+    "virtual_node_pools",
+)
+
+
+class OkeClusterArgs(NamedTuple):
+    compartment_id: str
+    vcn_cidr_block: str
+    kubernetes_version: str
+    node_pools: List[NodePoolSpec]
+    virtual_node_pools: List[VirtualNodePoolSpec] = []
+    ssh_key: str = ""
+    max_pods_per_node: int = 31
+    load_balancer_count: int = 4
+    # flexible or network, the network load balancers keep the client source IP
+    load_balancer_profile: str = "flexible"
+    load_balancer_ports: List[int] = [80, 443]
+    # Mbps of the flexible load balancers
+    load_balancer_min_bandwidth: int = 10
+    load_balancer_max_bandwidth: int = 100
+    subnet_headroom: float = 2
+    # tier: (first slot, slot count) in the eighths of the VCN, see subnets.subnet_layout
+    subnet_layout: Dict[str, Tuple[int, int]] = DEFAULT_SUBNET_LAYOUT
+    # Dual-stack VCN, every subnet gets a /64 of the Oracle allocated IPv6 /56
+    ipv6: bool = False
+    kubernetes_pods_cidr: str = "10.2.0.0/16"
+    kubernetes_services_cidr: str = "10.3.0.0/16"
+    cni_type: str = "OCI_VCN_IP_NATIVE"
+    cluster_type: str = "BASIC_CLUSTER"
+    security_mode: str = "security_lists"
+    cluster_autoscaler: bool = False
+    autoscaler_scale_down_delay: str = "10m"
+    autoscaler_expander: str = "least-waste"
+    tenancy_id: Optional[str] = None
+    # all, network or cluster, a cluster reads its network from network_stack
+    stack_mode: str = "all"
+    network_stack: Optional[str] = None
+    kubeconfig_path: str = "kubeconfig"
+    kubeconfig_token_cache: bool = False
+    # Wait for the nodes and the kube-system pods to be Ready after the deploy
+    wait_for_ready: bool = False
+    ready_timeout: float = 900
+    smoke_pods: int = 0
+    # kube-system tuning: kube-proxy mode, CoreDNS autoscaling (0 keeps the OKE
+    # defaults) and a DNS cache on every node
+    kube_proxy_mode: str = "iptables"
+    coredns_min_replicas: int = 0
+    coredns_nodes_per_replica: int = 0
+    nodelocal_dns: bool = False
+    # Route the OCIR and all the other OCI services traffic through the service gateway
+    service_gateway_all_services: bool = False
+    # Check the compute capacity of the node pool shapes before placing them,
+    # the report file replaces the capacity report API
+    capacity_preflight: bool = False
+    capacity_report_file: Optional[str] = None
+    # Flow logs of the subnets and alarms on the NAT gateway and the nodes, the
+    # alarms notify alarm_email when it is set
+    observability: bool = False
+    log_retention_days: int = 30
+    alarm_cpu_threshold: float = 90
+    alarm_memory_threshold: float = 90
+    alarm_email: str = ""
+    # Prepended to the names of the resources, empty for the single cluster
+    # of a stack so its resources keep their original names
+    resource_prefix: str = ""
+
+    @property
+    def vcn_native(self):
+        return self.cni_type == "OCI_VCN_IP_NATIVE"
+
+
+def check_args(args: OkeClusterArgs):
+    if args.cni_type not in ("OCI_VCN_IP_NATIVE", "FLANNEL_OVERLAY"):
+        raise ValueError(
+            f"cni_type must be OCI_VCN_IP_NATIVE or FLANNEL_OVERLAY, got {args.cni_type}"
+        )
+    if args.cluster_type not in ("BASIC_CLUSTER", "ENHANCED_CLUSTER"):
+        raise ValueError(
+            f"cluster_type must be BASIC_CLUSTER or ENHANCED_CLUSTER, got {args.cluster_type}"
+        )
+    if args.virtual_node_pools and (
+        args.cluster_type != "ENHANCED_CLUSTER" or not args.vcn_native
+    ):
+        raise ValueError(
+            "Virtual node pools need cluster_type ENHANCED_CLUSTER and cni_type OCI_VCN_IP_NATIVE"
+        )
+    if args.kube_proxy_mode not in ("iptables", "ipvs"):
+        raise ValueError(
+            f"kube_proxy_mode must be iptables or ipvs, got {args.kube_proxy_mode}"
+        )
+    if args.cluster_type != "ENHANCED_CLUSTER" and (
+        args.kube_proxy_mode == "ipvs"
+        or args.coredns_min_replicas
+        or args.coredns_nodes_per_replica
+        or args.cluster_autoscaler
+    ):
+        raise ValueError(
+            "The kube-proxy, CoreDNS and cluster autoscaler add-on settings need cluster_type ENHANCED_CLUSTER"
+        )
+    if args.security_mode not in ("security_lists", "network_security_groups"):
+        raise ValueError(
+            f"security_mode must be security_lists or network_security_groups, got {args.security_mode}"
+        )
+    if args.load_balancer_profile not in LOAD_BALANCER_PROFILES:
+        raise ValueError(
+            f"load_balancer_profile must be {' or '.join(LOAD_BALANCER_PROFILES)}, "
+            f"got {args.load_balancer_profile}"
+        )
+    if not 10 <= args.load_balancer_min_bandwidth <= args.load_balancer_max_bandwidth:
+        raise ValueError(
+            "The load balancers bandwidth needs 10 <= load_balancer_min_bandwidth <= load_balancer_max_bandwidth, "
+            f"got {args.load_balancer_min_bandwidth} and {args.load_balancer_max_bandwidth}"
+        )
+    if args.stack_mode not in ("all", "network", "cluster"):
+        raise ValueError(
+            f"stack_mode must be all, network or cluster, got {args.stack_mode}"
+        )
+    if args.stack_mode == "cluster" and not args.network_stack:
+        raise ValueError(
+            "A cluster stack needs the network stack name, set network_stack to <organization>/<project>/<stack>"
+        )
+    if args.virtual_node_pools and args.stack_mode != "network" and not args.tenancy_id:
+        raise ValueError(
+            "The virtual node pools need the tenancy OCID for their policy, "
+            "set oci:tenancyOcid or tenancy_ocid"
+        )
+    if args.cluster_autoscaler and args.stack_mode != "network" and not args.tenancy_id:
+        raise ValueError(
+            "The cluster autoscaler needs the tenancy OCID for its dynamic group, "
+            "set oci:tenancyOcid or tenancy_ocid"
+        )
+    if (
+        args.capacity_preflight
+        and args.stack_mode != "network"
+        and not args.capacity_report_file
+        and not args.tenancy_id
+    ):
+        raise ValueError(
+            "The capacity preflight needs the tenancy OCID for the capacity reports, "
+            "set oci:tenancyOcid or tenancy_ocid"
+        )
+    if (
+        args.capacity_preflight
+        and args.capacity_report_file
+        and not os.path.isfile(args.capacity_report_file)
+    ):
+        raise ValueError(
+            f"capacity_report_file {args.capacity_report_file} is not a file, "
+            "unset it to query the capacity report API"
+        )
+    if args.log_retention_days not in LOG_RETENTION_DAYS:
+        raise ValueError(
+            f"log_retention_days must be one of {', '.join(map(str, LOG_RETENTION_DAYS))}, "
+            f"got {args.log_retention_days}"
+        )
+    for name in ("alarm_cpu_threshold", "alarm_memory_threshold"):
+        if not 0 < getattr(args, name) <= 100:
+            raise ValueError(f"{name} must be a percentage, got {getattr(args, name)}")
+    for pool in args.node_pools:
+        if pool.tuning_profile not in TUNING_PROFILES:
+            raise ValueError(
+                f"The tuning_profile of the node pool {pool.name} must be one of "
+                f"{', '.join(TUNING_PROFILES)}, got {pool.tuning_profile}"
+            )
+    volume_pools = [p.name for p in args.node_pools if manages_volumes(p)]
+    if volume_pools and args.stack_mode != "network" and not args.tenancy_id:
+        raise ValueError(
+            f"The node pools {', '.join(volume_pools)} change their volumes and need the tenancy OCID "
+            "for the dynamic group of the nodes, set oci:tenancyOcid or tenancy_ocid"
+        )
+    return args
+
+
+def clusters_args(
+    clusters: list, defaults: OkeClusterArgs, node_pool_defaults: NodePoolSpec
+) -> List[Tuple[str, OkeClusterArgs]]:
+    # Every cluster gets its own VCN, carved out of the stack vcn_cidr_block
+    # unless the cluster sets its own
+    cidrs = calculate_subnets(defaults.vcn_cidr_block, len(clusters))
+    names = []
+    result = []
+    for cluster, cidr in zip(clusters, cidrs):
+        if "name" not in cluster:
+            raise ValueError(f"Every cluster needs a name: {cluster}")
+        name = cluster["name"]
+        unknown = set(cluster) - set(CLUSTER_SETTINGS) - {"name"}
+        if unknown:
+            raise ValueError(
+                f"Unknown settings for the cluster {name}: {', '.join(sorted(unknown))}"
+            )
+        names.append(name)
+        settings = {key: cluster[key] for key in CLUSTER_SETTINGS if key in cluster}
+        if "node_pools" in settings:
+            settings["node_pools"] = node_pool_specs(
+                settings["node_pools"], node_pool_defaults
+            )
+        if "virtual_node_pools" in settings:
+            settings["virtual_node_pools"] = virtual_node_pool_specs(
+                settings["virtual_node_pools"]
+            )
+        if "load_balancer_count" in settings:
+            settings["load_balancer_count"] = int(settings["load_balancer_count"])
+        for key in ("cluster_autoscaler", "ipv6"):
+            if key in settings:
+                settings[key] = str(settings[key]).lower() == "true"
+        result.append(
+            (
+                name,
+                defaults._replace(
+                    vcn_cidr_block=settings.pop("vcn_cidr_block", cidr),
+                    kubeconfig_path=f"{defaults.kubeconfig_path}-{name}",
+                    resource_prefix=f"{name}-",
+                    **settings,
+                ),
+            )
+        )
+    if len(set(names)) != len(names):
+        raise ValueError(f"The cluster names must be unique: {', '.join(names)}")
+    return result
+
+
+class OkeCluster(pulumi.ComponentResource):
+    def __init__(
+        self,
+        name: str,
+        args: OkeClusterArgs,
+        lookups,
+        opts: Optional[pulumi.ResourceOptions] = None,
+    ):
+        super().__init__("okelab:index:OkeCluster", name, None, opts)
+        self.started = time.monotonic()
+        self.args = check_args(args)
+        self.lookups = lookups
+        self.ads = [ad.name for ad in lookups.availability_domains]
+        self.node_pool_placements = place_node_pools(args.node_pools, self.ads)
+        self.capacity = None
+        if args.capacity_preflight and args.stack_mode != "network":
+            # Only the pools not deployed yet are placed by the capacity reports
+            node_pool_tags = self.lookups.node_pool_tags(self._child_name("OkeCluster"))
+            deployed = {
+                p.name: node_pool_tags[self._child_name(p.name)]
+                for p in self.node_pool_placements
+                if self._child_name(p.name) in node_pool_tags
+            }
+            self.capacity = capacity_statuses(
+                args.tenancy_id,
+                capacity_queries(
+                    [p for p in self.node_pool_placements if p.name not in deployed]
+                ),
+                args.capacity_report_file,
+            )
+            self.node_pool_placements = fit_new_capacity(
+                self.node_pool_placements,
+                deployed,
+                lambda *query: is_available(self.capacity, *query),
+            )
+
+        check_disjoint(
+            args.vcn_cidr_block,
+            kubernetes_pods_cidr=args.kubernetes_pods_cidr,
+            kubernetes_services_cidr=args.kubernetes_services_cidr,
+        )
+        planned_node_count, planned_pod_count = planned_counts(
+            self.node_pool_placements,
+            args.virtual_node_pools,
+            args.cluster_autoscaler,
+            args.max_pods_per_node,
+        )
+        if not args.vcn_native:
+            check_overlay_capacity(
+                args.kubernetes_pods_cidr,
+                planned_node_count,
+                max(p.max_pods_per_node for p in args.node_pools),
+            )
+
+        if args.stack_mode != "cluster":
+            # The network stack sizes the subnets for all the clusters sharing them
+            self.subnet_plan = plan_subnets(
+                args.vcn_cidr_block,
+                subnet_requests(
+                    planned_node_count,
+                    planned_pod_count if args.vcn_native else 0,
+                    args.load_balancer_count,
+                    args.subnet_headroom,
+                ),
+                args.subnet_layout,
+            )
+            self._create_network()
+        else:
+            self._use_network_stack()
+        if args.stack_mode != "network":
+            self._create_cluster()
+        self.observability = None
+        if args.observability:
+            self._create_observability()
+        self.register_outputs(self.stack_outputs())
+
+    def _child_name(self, name):
+        return f"{self.args.resource_prefix}{name}"
+
+    def _child_opts(self, **kwargs):
+        # The resources were created at the top of the stack before the component
+        # existed, the alias keeps them instead of replacing them
+        return pulumi.ResourceOptions(
+            parent=self,
+            aliases=[pulumi.Alias(parent=pulumi.ROOT_STACK_RESOURCE)],
+            **kwargs,
+        )
+
+    def _create_network(self):
+        args = self.args
+        compartment_id = args.compartment_id
+        self.oci_service = gateway_service(
+            self.lookups.services, args.service_gateway_all_services
+        )
+        oci_service = self.oci_service
+
+        # Create a VCN
+        self.vcn = oci.core.Vcn(
+            self._child_name("vcn"),
+            compartment_id=compartment_id,
+            cidr_block=args.vcn_cidr_block,
+            display_name=self._child_name("vcn"),
+            dns_label="vcn",
+            is_ipv6enabled=True if args.ipv6 else None,
+            opts=self._child_opts(),
+        )
+        vcn = self.vcn
+        self.vcn_ipv6_cidr = None
+        self.subnet_ipv6_cidrs = {}
+        if args.ipv6:
+            self.vcn_ipv6_cidr = vcn.ipv6cidr_blocks.apply(lambda blocks: blocks[0])
+
+        # Create an Internet Gateway for the public subnet
+        self.internet_gateway = oci.core.InternetGateway(
+            self._child_name("InternetGateway"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            display_name=self._child_name("InternetGateway"),
+            enabled=True,
+            opts=self._child_opts(),
+        )
+
+        # Create a NAT Gateway for the private subnet
+        self.nat_gateway = oci.core.NatGateway(
+            self._child_name("NatGateway"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            display_name=self._child_name("NatGateway"),
+            opts=self._child_opts(),
+        )
+
+        # Create a Service Gateway for access to OCI services
+        self.service_gateway = oci.core.ServiceGateway(
+            self._child_name("ServiceGateway"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            services=[oci.core.ServiceGatewayServiceArgs(service_id=oci_service.id)],
+            display_name=self._child_name("ServiceGateway"),
+            opts=self._child_opts(),
+        )
+
+        # Compile the security rules of every tier from the flows between them
+        tier_cidrs = {
+            tier: self.subnet_plan[tier].cidr
+            for tier in SECURITY_TIERS
+            if tier in self.subnet_plan
+        }
+        flows = oke_flows(
+            args.vcn_native, args.load_balancer_profile, args.load_balancer_ports
+        )
+        self.security_rules = compile_rules(flows, tier_cidrs, oci_service.cidr_block)
+        if args.ipv6:
+            # The IPv6 rules of the tiers, compiled on the placeholder blocks
+            placeholder_cidrs = ipv6_subnets(IPV6_PLACEHOLDER_CIDR, SECURITY_TIERS)
+            ipv6_rules = compile_rules(
+                ipv6_flows(flows),
+                {tier: placeholder_cidrs[tier] for tier in tier_cidrs},
+                None,
+                "::/0",
+            )
+            for tier, rules in ipv6_rules.items():
+                for direction, items in rules.items():
+                    self.security_rules[tier][direction] += items
+            self.subnet_ipv6_cidrs = {
+                tier: self.vcn_ipv6_cidr.apply(
+                    lambda cidr, tier=tier: ipv6_subnets(cidr, SECURITY_TIERS)[tier]
+                )
+                for tier in tier_cidrs
+            }
+
+        def vcn_rules(rules):
+            if not args.ipv6:
+                return rules
+            return [ipv6_rule(rule, self.vcn_ipv6_cidr) for rule in rules]
+
+        # Create a separate Security List for every subnet, with network security groups
+        # they stay empty so the default security list of the VCN is not used instead
+        self.security_lists = {}
+        for tier, rules in self.security_rules.items():
+            name = self._child_name(f"{SECURITY_TIERS[tier]}SecurityList")
+            if args.security_mode == "network_security_groups":
+                rules = {"ingress": [], "egress": []}
+            self.security_lists[tier] = oci.core.SecurityList(
+                name,
+                compartment_id=compartment_id,
+                vcn_id=vcn.id,
+                display_name=name,
+                ingress_security_rules=security_list_ingress_rules(
+                    vcn_rules(rules["ingress"])
+                ),
+                egress_security_rules=security_list_egress_rules(
+                    vcn_rules(rules["egress"])
+                ),
+                opts=self._child_opts(),
+            )
+
+        # Create a Network Security Group for every tier, the load balancers one is
+        # attached through the service annotations
+        self.network_security_groups = {}
+        if args.security_mode == "network_security_groups":
+            for tier, rules in self.security_rules.items():
+                name = self._child_name(f"{SECURITY_TIERS[tier]}Nsg")
+                nsg = oci.core.NetworkSecurityGroup(
+                    name,
+                    compartment_id=compartment_id,
+                    vcn_id=vcn.id,
+                    display_name=name,
+                    opts=self._child_opts(),
+                )
+                for direction, items in rules.items():
+                    for rule, vcn_rule in zip(items, vcn_rules(items)):
+                        oci.core.NetworkSecurityGroupSecurityRule(
+                            nsg_rule_name(name, direction, rule),
+                            network_security_group_id=nsg.id,
+                            **nsg_rule_args(direction, vcn_rule),
+                            opts=self._child_opts(),
+                        )
+                self.network_security_groups[tier] = nsg
+
+        # Create a Route Table for the private subnet with a route via the NAT Gateway
+        workers_route_table = oci.core.RouteTable(
+            self._child_name("WorkersRouteTable"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            display_name=self._child_name("WorkersRouteTable"),
+            route_rules=[
+                oci.core.RouteTableRouteRuleArgs(
+                    destination="0.0.0.0/0",
+                    network_entity_id=self.nat_gateway.id,
+                ),
+                oci.core.RouteTableRouteRuleArgs(
+                    destination=oci_service.cidr_block,
+                    destination_type="SERVICE_CIDR_BLOCK",
+                    network_entity_id=self.service_gateway.id,
+                ),
+            ],
+            opts=self._child_opts(),
+        )
+
+        # The public and loadbalancers subnets reach the internet over IPv4 and IPv6
+        internet_routes = [
+            oci.core.RouteTableRouteRuleArgs(
+                destination=destination,
+                network_entity_id=self.internet_gateway.id,
+            )
+            for destination in ["0.0.0.0/0"] + (["::/0"] if args.ipv6 else [])
+        ]
+
+        # Create a Route Table for the public subnet with a route via the Internet Gateway
+        public_route_table = oci.core.RouteTable(
+            self._child_name("PublicRouteTable"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            display_name=self._child_name("PublicRouteTable"),
+            route_rules=internet_routes,
+            opts=self._child_opts(),
+        )
+
+        # Create a Route Table for the loadbalancers subnet with a route via the Internet Gateway
+        loadbalancers_route_table = oci.core.RouteTable(
+            self._child_name("LoadBalancersRouteTable"),
+            compartment_id=compartment_id,
+            vcn_id=vcn.id,
+            display_name=self._child_name("LoadBalancersRouteTable"),
+            route_rules=internet_routes,
+            opts=self._child_opts(),
+        )
+
+        # Create a Public Subnet within the VCN
+        self.public_subnet = oci.core.Subnet(
+            self._child_name("PublicSubnet"),
+            compartment_id=compartment_id,
+            security_list_ids=[self.security_lists["public"].id],
+            vcn_id=vcn.id,
+            cidr_block=self.subnet_plan["public"].cidr,
+            ipv6cidr_block=self.subnet_ipv6_cidrs.get("public"),
+            display_name=self._child_name("PublicSubnet"),
+            dns_label="public",
+            prohibit_public_ip_on_vnic=False,
+            route_table_id=public_route_table.id,
+            opts=self._child_opts(),
+        )
+
+        # Create a Private Subnet within the VCN
+        self.workers_subnet = oci.core.Subnet(
+            self._child_name("WorkersSubnet"),
+            compartment_id=compartment_id,
+            security_list_ids=[self.security_lists["workers"].id],
+            vcn_id=vcn.id,
+            cidr_block=self.subnet_plan["workers"].cidr,
+            ipv6cidr_block=self.subnet_ipv6_cidrs.get("workers"),
+            display_name=self._child_name("WorkersSubnet"),
+            dns_label="workers",
+            prohibit_public_ip_on_vnic=True,
+            route_table_id=workers_route_table.id,
+            opts=self._child_opts(),
+        )
+
+        self.pods_subnet = None
+        if args.vcn_native:
+            # Create a Pods Subnet within the VCN
+            self.pods_subnet = oci.core.Subnet(
+                self._child_name("PodsSubnet"),
+                compartment_id=compartment_id,
+                security_list_ids=[self.security_lists["pods"].id],
+                vcn_id=vcn.id,
+                cidr_block=self.subnet_plan["pods"].cidr,
+                ipv6cidr_block=self.subnet_ipv6_cidrs.get("pods"),
+                display_name=self._child_name("PodsSubnet"),
+                dns_label="pods",
+                prohibit_public_ip_on_vnic=True,
+                route_table_id=workers_route_table.id,
+                opts=self._child_opts(),
+            )
+
+        # Create a LoadBalancers Subnet within the VCN
+        self.loadbalancers_subnet = oci.core.Subnet(
+            self._child_name("LoadBalancersSubnet"),
+            compartment_id=compartment_id,
+            security_list_ids=[self.security_lists["loadbalancers"].id],
+            vcn_id=vcn.id,
+            cidr_block=self.subnet_plan["loadbalancers"].cidr,
+            ipv6cidr_block=self.subnet_ipv6_cidrs.get("loadbalancers"),
+            display_name=self._child_name("LoadBalancersSubnet"),
+            dns_label="loadbalancers",
+            prohibit_public_ip_on_vnic=False,
+            route_table_id=loadbalancers_route_table.id,
+            opts=self._child_opts(),
+        )
+
+        self.vcn_id = vcn.id
+        self.public_subnet_id = self.public_subnet.id
+        self.workers_subnet_id = self.workers_subnet.id
+        self.loadbalancers_subnet_id = self.loadbalancers_subnet.id
+        self.pods_subnet_id = self.pods_subnet.id if self.pods_subnet else None
+        self.nsg_ids = {
+            tier: [nsg.id] for tier, nsg in self.network_security_groups.items()
+        }
+
+    def _use_network_stack(self):
+        # Use the network created by the network stack
+        network_stack = pulumi.StackReference(
+            self.args.network_stack, opts=self._child_opts()
+        )
+        self.vcn_id = network_stack.require_output("vcn_id")
+        self.public_subnet_id = network_stack.require_output("public_subnet_id")
+        self.workers_subnet_id = network_stack.require_output("workers_subnet_id")
+        self.loadbalancers_subnet_id = network_stack.require_output(
+            "loadbalancers_subnet_id"
+        )
+        self.pods_subnet_id = (
+            network_stack.require_output("pods_subnet_id")
+            if self.args.vcn_native
+            else None
+        )
+        network_nsg_ids = network_stack.get_output("network_security_group_ids")
+        self.nsg_ids = {
+            tier: network_nsg_ids.apply(
+                lambda ids, tier=tier: [ids[tier]] if ids and tier in ids else None
+            )
+            for tier in ("public", "workers", "pods", "loadbalancers")
+        }
+
+    def _create_cluster(self):
+        args = self.args
+        compartment_id = args.compartment_id
+        kubernetes_version = args.kubernetes_version
+        vcn_native = args.vcn_native
+        nsg_ids = self.nsg_ids
+        ipvs = args.kube_proxy_mode == "ipvs"
+
+        # Create the OKE cluster
+        self.cluster = oci.containerengine.Cluster(
+            self._child_name("OkeCluster"),
+            compartment_id=compartment_id,
+            name=self._child_name("OkeCluster"),
+            kubernetes_version=kubernetes_version,
+            options=oci.containerengine.ClusterOptionsArgs(
+                service_lb_subnet_ids=[self.loadbalancers_subnet_id],
+                kubernetes_network_config=oci.containerengine.ClusterOptionsKubernetesNetworkConfigArgs(
+                    pods_cidr=args.kubernetes_pods_cidr,
+                    services_cidr=args.kubernetes_services_cidr,
+                ),
+            ),
+            cluster_pod_network_options=[
+                oci.containerengine.ClusterClusterPodNetworkOptionArgs(
+                    cni_type=args.cni_type,
+                )
+            ],
+            type=args.cluster_type,
+            vcn_id=self.vcn_id,
+            endpoint_config=oci.containerengine.ClusterEndpointConfigArgs(
+                subnet_id=self.public_subnet_id,
+                is_public_ip_enabled=True,
+                nsg_ids=nsg_ids.get("public"),
+            ),
+            opts=self._child_opts(),
+        )
+        oke_cluster = self.cluster
+
+        # Resolve the node images from the options of all clusters in the compartment,
+        # so the lookup runs in parallel with the cluster creation
+        if any(p.spec.image_id == "" for p in self.node_pool_placements):
+            image_catalog = ImageCatalog(self.lookups.node_pool_sources)
+        self.node_images = {
+            p.name: p.spec.image_id
+            or image_catalog.image_id(p.spec.shape, kubernetes_version)
+            for p in self.node_pool_placements
+        }
+
+        # The nodes that change their volumes authenticate as instance principals,
+        # the policy exists before they boot and the dynamic group only matches the
+        # nodes tagged by their pool
+        volume_policy = None
+        volume_tags = None
+        if any(manages_volumes(p) for p in args.node_pools):
+            volume_name = self._child_name(
+                f"{pulumi.get_project()}-{pulumi.get_stack()}-node-volumes"
+            )
+            volume_tag_namespace = oci.identity.TagNamespace(
+                self._child_name("NodeVolumesTagNamespace"),
+                compartment_id=compartment_id,
+                name=volume_name,
+                description="Tags of the OKE worker nodes managing their volumes",
+                opts=self._child_opts(),
+            )
+            volume_tag = oci.identity.Tag(
+                self._child_name("NodeVolumesTag"),
+                tag_namespace_id=volume_tag_namespace.id,
+                name="managed",
+                description="The node changes its boot volume or attaches its containerd volume",
+                opts=self._child_opts(),
+            )
+            volume_tags = pulumi.Output.all(
+                volume_tag_namespace.name, volume_tag.name
+            ).apply(lambda names: {f"{names[0]}.{names[1]}": "true"})
+            volume_dynamic_group = oci.identity.DynamicGroup(
+                self._child_name("NodeVolumesDynamicGroup"),
+                compartment_id=args.tenancy_id,
+                name=volume_name,
+                description="Worker nodes managing their boot and containerd volumes",
+                matching_rule=pulumi.Output.all(
+                    volume_tag_namespace.name, volume_tag.name
+                ).apply(lambda names: volume_matching_rule(compartment_id, *names)),
+                opts=self._child_opts(),
+            )
+            volume_policy = oci.identity.Policy(
+                self._child_name("NodeVolumesPolicy"),
+                compartment_id=compartment_id,
+                name=volume_name,
+                description="Allow the OKE worker nodes to manage their volumes",
+                statements=volume_dynamic_group.name.apply(
+                    lambda name: volume_policy_statements(name, compartment_id)
+                ),
+                opts=self._child_opts(),
+            )
+
+        # Create the node pools
+        self.node_pools = {}
+        self.node_pool_inputs = [oke_cluster.id, self.pods_subnet_id]
+        for placement in self.node_pool_placements:
+            pool = placement.spec
+            name = self._child_name(placement.name)
+            image_id = self.node_images[placement.name]
+            placement_configs = get_ads(
+                placement.availability_domains, self.workers_subnet_id, pool
+            )
+            self.node_pool_inputs += [image_id, placement_configs]
+            self.node_pools[placement.name] = oci.containerengine.NodePool(
+                name,
+                name=name,
+                cluster_id=oke_cluster.id,
+                compartment_id=compartment_id,
+                kubernetes_version=kubernetes_version,
+                node_config_details=oci.containerengine.NodePoolNodeConfigDetailsArgs(
+                    placement_configs=placement_configs,
+                    size=pool.size,
+                    nsg_ids=nsg_ids.get("workers"),
+                    defined_tags=volume_tags if manages_volumes(pool) else None,
+                    node_pool_pod_network_option_details=(
+                        oci.containerengine.NodePoolNodeConfigDetailsNodePoolPodNetworkOptionDetailsArgs(
+                            cni_type=args.cni_type,
+                            pod_subnet_ids=[self.pods_subnet_id],
+                            pod_nsg_ids=nsg_ids.get("pods"),
+                            max_pods_per_node=pool.max_pods_per_node,
+                        )
+                        if vcn_native
+                        else oci.containerengine.NodePoolNodeConfigDetailsNodePoolPodNetworkOptionDetailsArgs(
+                            cni_type=args.cni_type,
+                        )
+                    ),
+                ),
+                node_metadata=node_user_data(
+                    pool,
+                    vcn_native,
+                    ipvs,
+                    NODELOCAL_DNS_IP if ipvs and args.nodelocal_dns else None,
+                ),
+                node_shape=pool.shape,
+                node_shape_config=(
+                    oci.containerengine.NodePoolNodeShapeConfigArgs(
+                        memory_in_gbs=pool.memory_in_gbs, ocpus=pool.ocpus
+                    )
+                    if is_flexible(pool.shape)
+                    else None
+                ),
+                node_source_details=oci.containerengine.NodePoolNodeSourceDetailsArgs(
+                    image_id=image_id,
+                    source_type="IMAGE",
+                    # Unset for the default size, so the existing pools are not updated
+                    boot_volume_size_in_gbs=(
+                        str(pool.boot_volume_size_in_gbs)
+                        if pool.boot_volume_size_in_gbs != MIN_VOLUME_SIZE_IN_GBS
+                        else None
+                    ),
+                ),
+                node_pool_cycling_details=(
+                    oci.containerengine.NodePoolNodePoolCyclingDetailsArgs(
+                        is_node_cycling_enabled=True,
+                        maximum_surge=pool.max_surge,
+                        maximum_unavailable=pool.max_unavailable,
+                    )
+                    if pool.node_cycling
+                    else None
+                ),
+                node_eviction_node_pool_settings=(
+                    oci.containerengine.NodePoolNodeEvictionNodePoolSettingsArgs(
+                        eviction_grace_duration=pool.eviction_grace_duration,
+                        is_force_delete_after_grace_duration=pool.force_delete_after_grace,
+                    )
+                    if pool.node_cycling
+                    else None
+                ),
+                ssh_public_key=args.ssh_key if args.ssh_key else None,
+                freeform_tags=(
+                    {CAPACITY_FIT_TAG: placement.capacity_fit}
+                    if placement.capacity_fit
+                    else None
+                ),
+                # The node count belongs to the cluster autoscaler once it is enabled
+                opts=self._child_opts(
+                    ignore_changes=(
+                        ["nodeConfigDetails.size"] if args.cluster_autoscaler else None
+                    ),
+                    depends_on=(
+                        [volume_policy]
+                        if volume_policy and manages_volumes(pool)
+                        else None
+                    ),
+                ),
+            )
+
+        # Report the last node cycle of the pools replacing their nodes
+        self.node_cycles = {
+            placement.name: self.node_pools[placement.name].id.apply(
+                lambda id: last_cycle(compartment_id, id)
+            )
+            for placement in self.node_pool_placements
+            if placement.spec.node_cycling
+        }
+
+        # Create the virtual node pools, the pods run on serverless capacity in the pods subnet
+        # and the virtual nodes create their container instances once the policy exists
+        self.virtual_node_pools = {}
+        virtual_node_policy = None
+        if args.virtual_node_pools:
+            compartment_name = oci.identity.get_compartment_output(
+                id=compartment_id
+            ).name
+            virtual_node_policy = oci.identity.Policy(
+                self._child_name("VirtualNodePolicy"),
+                compartment_id=args.tenancy_id,
+                name=self._child_name(
+                    f"{pulumi.get_project()}-{pulumi.get_stack()}-virtual-nodes"
+                ),
+                description="Allow the OKE virtual nodes to run their pods",
+                statements=pulumi.Output.all(
+                    compartment_name, self.pods_subnet_id
+                ).apply(lambda values: virtual_node_policy_statements(*values)),
+                opts=self._child_opts(),
+            )
+        for pool in args.virtual_node_pools:
+            name = self._child_name(pool.name)
+            self.virtual_node_pools[pool.name] = oci.containerengine.VirtualNodePool(
+                name,
+                cluster_id=oke_cluster.id,
+                compartment_id=compartment_id,
+                display_name=name,
+                size=pool.size,
+                placement_configurations=get_virtual_node_ads(
+                    self.ads, self.workers_subnet_id, pool
+                ),
+                nsg_ids=nsg_ids.get("workers"),
+                pod_configuration=oci.containerengine.VirtualNodePoolPodConfigurationArgs(
+                    shape=pool.pod_shape,
+                    subnet_id=self.pods_subnet_id,
+                    nsg_ids=nsg_ids.get("pods"),
+                ),
+                opts=self._child_opts(depends_on=[virtual_node_policy]),
+            )
+
+        # Install the cluster autoscaler add-on, the nodes authenticate as instance principals
+        self.autoscaler_nodes = None
+        if args.cluster_autoscaler:
+            autoscaler_name = self._child_name(
+                f"{pulumi.get_project()}-{pulumi.get_stack()}-cluster-autoscaler"
+            )
+            autoscaler_dynamic_group = oci.identity.DynamicGroup(
+                self._child_name("ClusterAutoscalerDynamicGroup"),
+                compartment_id=args.tenancy_id,
+                name=autoscaler_name,
+                description="Worker nodes running the OKE cluster autoscaler",
+                matching_rule=f"ALL {{instance.compartment.id = '{compartment_id}'}}",
+                opts=self._child_opts(),
+            )
+            autoscaler_policy = oci.identity.Policy(
+                self._child_name("ClusterAutoscalerPolicy"),
+                compartment_id=compartment_id,
+                name=autoscaler_name,
+                description="Allow the OKE cluster autoscaler to resize the node pools",
+                statements=autoscaler_dynamic_group.name.apply(
+                    lambda name: autoscaler_policy_statements(name, compartment_id)
+                ),
+                opts=self._child_opts(),
+            )
+            self.autoscaler_nodes = pulumi.Output.all(
+                *[
+                    self.node_pools[p.name].id.apply(
+                        lambda id, p=p: f"{p.spec.min_size}:{p.spec.max_size}:{id}"
+                    )
+                    for p in self.node_pool_placements
+                ]
+            ).apply(",".join)
+            oci.containerengine.Addon(
+                self._child_name("ClusterAutoscalerAddon"),
+                addon_name="ClusterAutoscaler",
+                cluster_id=oke_cluster.id,
+                remove_addon_resources_on_delete=True,
+                configurations=[
+                    oci.containerengine.AddonConfigurationArgs(
+                        key="authType", value="instance"
+                    ),
+                    oci.containerengine.AddonConfigurationArgs(
+                        key="nodes", value=self.autoscaler_nodes
+                    ),
+                    oci.containerengine.AddonConfigurationArgs(
+                        key="scaleDownDelayAfterAdd",
+                        value=args.autoscaler_scale_down_delay,
+                    ),
+                    oci.containerengine.AddonConfigurationArgs(
+                        key="expander", value=args.autoscaler_expander
+                    ),
+                ],
+                opts=self._child_opts(depends_on=[autoscaler_policy]),
+            )
+
+        # Configure the essential add-ons of the enhanced cluster, OKE installed
+        # them so they stay when the resources are deleted
+        self.addons = {}
+        if ipvs:
+            self.addons["KubeProxy"] = oci.containerengine.Addon(
+                self._child_name("KubeProxyAddon"),
+                addon_name="KubeProxy",
+                cluster_id=oke_cluster.id,
+                remove_addon_resources_on_delete=False,
+                configurations=[
+                    oci.containerengine.AddonConfigurationArgs(
+                        key="customizeKubeProxyConfigMap", value="true"
+                    )
+                ],
+                opts=self._child_opts(),
+            )
+        coredns = {
+            key: str(value)
+            for key, value in (
+                ("minReplica", args.coredns_min_replicas),
+                ("nodesPerReplica", args.coredns_nodes_per_replica),
+            )
+            if value
+        }
+        if coredns:
+            self.addons["CoreDNS"] = oci.containerengine.Addon(
+                self._child_name("CoreDnsAddon"),
+                addon_name="CoreDNS",
+                cluster_id=oke_cluster.id,
+                remove_addon_resources_on_delete=False,
+                configurations=[
+                    oci.containerengine.AddonConfigurationArgs(key=key, value=value)
+                    for key, value in coredns.items()
+                ],
+                opts=self._child_opts(),
+            )
+
+        # Retrieve the kubeconfig
+        cluster_kube_config = oke_cluster.id.apply(
+            lambda cid: oci.containerengine.get_cluster_kube_config(cluster_id=cid)
+        )
+
+        self.kubeconfig = cluster_kube_config.content
+        if args.kubeconfig_token_cache:
+            token_helper = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "oke_token_cache.py"
+            )
+            self.kubeconfig = self.kubeconfig.apply(
+                lambda cc: use_token_cache(cc, token_helper)
+            )
+
+        kubeconfig_file = self.kubeconfig.apply(
+            lambda cc: write_file(args.kubeconfig_path, cc)
+        )
+
+        # Switch kube-proxy to IPVS and deploy the DNS cache with kubectl
+        self.kube_system = None
+        if ipvs or args.nodelocal_dns:
+            self.kube_system = pulumi.Output.all(
+                kubeconfig_file, *[addon.id for addon in self.addons.values()]
+            ).apply(lambda values: post_configure(values[0], ipvs, args.nodelocal_dns))
+
+        # Poll the cluster once the node pools are created
+        self.readiness = None
+        if args.wait_for_ready:
+            expected_nodes = sum(p.spec.size for p in self.node_pool_placements) + sum(
+                p.size for p in args.virtual_node_pools
+            )
+            self.readiness = pulumi.Output.all(
+                kubeconfig_file,
+                self.kube_system,
+                *[pool.id for pool in self.node_pools.values()],
+                *[pool.id for pool in self.virtual_node_pools.values()],
+            ).apply(
+                lambda values: post_deploy(
+                    values[0],
+                    expected_nodes,
+                    args.ready_timeout,
+                    args.smoke_pods,
+                    self.started,
+                )
+            )
+
+    def _create_observability(self):
+        args = self.args
+        compartment_id = args.compartment_id
+        alarms = []
+        self.observability = {}
+
+        # The alarms of the stack notify a topic, and alarm_email through it
+        topic = oci.ons.NotificationTopic(
+            self._child_name("AlarmsTopic"),
+            compartment_id=compartment_id,
+            name=self._child_name(
+                f"{pulumi.get_project()}-{pulumi.get_stack()}-alarms"
+            ),
+            description="OKE network and worker nodes alarms",
+            opts=self._child_opts(),
+        )
+        if args.alarm_email:
+            oci.ons.Subscription(
+                self._child_name("AlarmsEmailSubscription"),
+                compartment_id=compartment_id,
+                topic_id=topic.id,
+                protocol="EMAIL",
+                endpoint=args.alarm_email,
+                opts=self._child_opts(),
+            )
+        self.observability["alarm_topic_id"] = topic.id
+
+        if args.stack_mode != "cluster":
+            # Collect the VCN flow logs of the private and load balancers subnets
+            log_group = oci.logging.LogGroup(
+                self._child_name("FlowLogsLogGroup"),
+                compartment_id=compartment_id,
+                display_name=self._child_name("FlowLogsLogGroup"),
+                description="VCN flow logs of the OKE subnets",
+                opts=self._child_opts(),
+            )
+            subnets = {
+                "workers": ("WorkersSubnet", self.workers_subnet),
+                "pods": ("PodsSubnet", self.pods_subnet),
+                "loadbalancers": ("LoadBalancersSubnet", self.loadbalancers_subnet),
+            }
+            flow_logs = {}
+            for tier in FLOW_LOG_TIERS:
+                subnet_name, subnet = subnets[tier]
+                if subnet is None:
+                    continue
+                name = self._child_name(f"{subnet_name}FlowLog")
+                flow_logs[tier] = oci.logging.Log(
+                    name,
+                    display_name=name,
+                    log_group_id=log_group.id,
+                    log_type="SERVICE",
+                    configuration=oci.logging.LogConfigurationArgs(
+                        compartment_id=compartment_id,
+                        source=oci.logging.LogConfigurationSourceArgs(
+                            category="all",
+                            resource=subnet.id,
+                            service="flowlogs",
+                            source_type="OCISERVICE",
+                        ),
+                    ),
+                    is_enabled=True,
+                    retention_duration=args.log_retention_days,
+                    opts=self._child_opts(),
+                )
+            self.observability.update(
+                log_group_id=log_group.id,
+                log_retention_days=args.log_retention_days,
+                flow_log_ids={tier: log.id for tier, log in flow_logs.items()},
+            )
+            alarms.append(nat_gateway_alarm(self.nat_gateway.id))
+        if args.stack_mode != "network":
+            alarms += node_alarms(
+                self.cluster.id, args.alarm_cpu_threshold, args.alarm_memory_threshold
+            )
+
+        self.alarms = {}
+        for alarm in alarms:
+            name = self._child_name(alarm.name)
+            self.alarms[alarm.name] = oci.monitoring.Alarm(
+                name,
+                compartment_id=compartment_id,
+                display_name=name,
+                metric_compartment_id=compartment_id,
+                namespace=alarm.namespace,
+                query=alarm.query,
+                severity=alarm.severity,
+                body=alarm.summary,
+                pending_duration=alarm.pending_duration,
+                destinations=[topic.id],
+                is_enabled=True,
+                opts=self._child_opts(),
+            )
+        self.observability["alarms"] = {
+            alarm.name: {"id": self.alarms[alarm.name].id, "query": alarm.query}
+            for alarm in alarms
+        }
+
+    def stack_outputs(self):
+        # The stack outputs of the cluster, the ones of the single cluster of a
+        # stack are exported at the top level
+        args = self.args
+        outputs = {}
+        if args.stack_mode != "cluster":
+            outputs.update(
+                vcn_id=self.vcn.id,
+                internet_gateway_id=self.internet_gateway.id,
+                nat_gateway_id=self.nat_gateway.id,
+                service_gateway_id=self.service_gateway.id,
+                service_gateway_cidr=self.oci_service.cidr_block,
+                public_subnet_id=self.public_subnet.id,
+                workers_subnet_id=self.workers_subnet.id,
+                loadbalancers_subnet_id=self.loadbalancers_subnet.id,
+            )
+            if args.vcn_native:
+                outputs["pods_subnet_id"] = self.pods_subnet.id
+            outputs["public_security_list_id"] = self.security_lists["public"].id
+            outputs["workers_security_list_id"] = self.security_lists["workers"].id
+            if args.vcn_native:
+                outputs["pods_security_list_id"] = self.security_lists["pods"].id
+            if self.network_security_groups:
+                outputs["network_security_group_ids"] = {
+                    tier: nsg.id for tier, nsg in self.network_security_groups.items()
+                }
+            outputs["security_rule_counts"] = {
+                tier: {direction: len(items) for direction, items in rules.items()}
+                for tier, rules in self.security_rules.items()
+            }
+            if args.ipv6:
+                outputs["vcn_ipv6_cidr"] = self.vcn_ipv6_cidr
+                outputs["subnet_ipv6_cidrs"] = self.subnet_ipv6_cidrs
+            outputs["subnet_plan"] = {
+                s.name: {
+                    "cidr": s.cidr,
+                    "requested": s.addresses,
+                    "capacity": s.capacity,
+                }
+                for s in self.subnet_plan.values()
+            }
+        if args.stack_mode != "network":
+            outputs["cluster_id"] = self.cluster.id
+            outputs["node_pool_id"] = next(iter(self.node_pools.values())).id
+            outputs["node_pool_ids"] = {
+                name: pool.id for name, pool in self.node_pools.items()
+            }
+            outputs["node_pool_placements"] = {
+                p.name: {
+                    "shape": p.spec.shape,
+                    "size": p.spec.size,
+                    "availability_domains": p.availability_domains,
+                    **(
+                        {"fault_domains": p.spec.fault_domains}
+                        if p.spec.fault_domains
+                        else {}
+                    ),
+                }
+                for p in self.node_pool_placements
+            }
+            if self.capacity is not None:
+                outputs["capacity_report"] = capacity_report(self.capacity)
+            outputs["node_pool_storage"] = {
+                pool.name: storage_layout(pool) for pool in args.node_pools
+            }
+            outputs["node_pool_tuning"] = {
+                pool.name: {
+                    "profile": pool.tuning_profile,
+                    "hugepages": pool.hugepages,
+                }
+                for pool in args.node_pools
+            }
+            if self.virtual_node_pools:
+                outputs["virtual_node_pool_ids"] = {
+                    name: pool.id for name, pool in self.virtual_node_pools.items()
+                }
+            if self.node_cycles:
+                outputs["node_pool_cycles"] = self.node_cycles
+            if self.autoscaler_nodes is not None:
+                outputs["cluster_autoscaler_nodes"] = self.autoscaler_nodes
+            outputs["kubeconfig_path"] = args.kubeconfig_path
+            if self.kube_system is not None:
+                outputs["kube_system"] = self.kube_system
+            if self.readiness is not None:
+                outputs["time_to_ready"] = self.readiness.apply(
+                    lambda report: report and report["time_to_ready"]
+                )
+                outputs["readiness"] = self.readiness
+        if self.observability is not None:
+            outputs["observability"] = self.observability
+        outputs["load_balancer_annotations"] = load_balancer_annotations(
+            args, self.nsg_ids.get("loadbalancers"), self.loadbalancers_subnet_id
+        )
+        return outputs
@@ -0,0 +1,90 @@
+import re
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+###################################################################################################################################
+# OKE node image catalog
+###################################################################################################################################
+
+# Oracle-Linux-8.10-aarch64-2024.06.30-0-OKE-1.30.1-716
+# Oracle-Linux-8.10-Gen2-GPU-2024.06.30-0-OKE-1.30.1-716
+SOURCE_NAME = re.compile(
+    r"^(?P<os>Oracle-Linux)-(?P<os_version>\d+(?:\.\d+)*)-"
+    r"(?P<flavors>(?:[A-Za-z][A-Za-z0-9_]*-)*)"
+    r"(?P<build_date>\d{4}\.\d{2}\.\d{2})-(?P<build>\d+)-"
+    r"OKE-(?P<kubernetes_version>\d+\.\d+\.\d+)-(?P<oke_build>\d+)$"
+)
+ARM_SHAPE = re.compile(r"^(VM|BM)\.Standard\.A\d+\.")
+
+
+class OkeImage(NamedTuple):
+    image_id: str
+    source_name: str
+    os: str
+    os_version: Tuple[int, ...]
+    arch: str
+    gpu: bool
+    kubernetes_version: str
+    build_date: str
+    build: int
+    oke_build: int
+
+    @property
+    def sort_key(self):
+        return (self.build_date, self.os_version, self.build, self.oke_build)
+
+
+def parse_source(image_id, source_name):
+    match = SOURCE_NAME.match(source_name)
+    if not match:
+        return None
+    flavors = match["flavors"].split("-")
+    return OkeImage(
+        image_id=image_id,
+        source_name=source_name,
+        os=match["os"],
+        os_version=tuple(int(n) for n in match["os_version"].split(".")),
+        arch="aarch64" if "aarch64" in flavors else "x86_64",
+        gpu="GPU" in flavors,
+        kubernetes_version=match["kubernetes_version"],
+        build_date=match["build_date"],
+        build=int(match["build"]),
+        oke_build=int(match["oke_build"]),
+    )
+
+
+def shape_platform(shape):
+    return ("aarch64" if ARM_SHAPE.match(shape) else "x86_64", "GPU" in shape)
+
+
+class ImageCatalog:
+    # Parses the node pool sources once and keeps the newest build for every
+    # (arch, gpu, kubernetes version), lookups for any number of shapes are O(1)
+    def __init__(self, sources: Iterable):
+        self.images: Dict[Tuple[str, bool, str], OkeImage] = {}
+        for source in sources:
+            image = parse_source(source.image_id, source.source_name)
+            if image is None:
+                continue
+            key = (image.arch, image.gpu, image.kubernetes_version)
+            current = self.images.get(key)
+            if current is None or image.sort_key > current.sort_key:
+                self.images[key] = image
+
+    def find(self, shape, kubernetes_version) -> OkeImage:
+        arch, gpu = shape_platform(shape)
+        version = kubernetes_version.lstrip("v")
+        image = self.images.get((arch, gpu, version))
+        if image is None:
+            available = sorted(
+                (v for (a, g, v) in self.images if a == arch and g == gpu),
+                key=lambda v: tuple(int(n) for n in v.split(".")),
+            )
+            raise ValueError(
+                f"No OKE image for shape {shape} ({arch}{', GPU' if gpu else ''}) "
+                f"and Kubernetes {kubernetes_version}, available versions: "
+                f"{', '.join(available) or 'none'}"
+            )
+        return image
+
+    def image_id(self, shape, kubernetes_version) -> str:
+        return self.find(shape, kubernetes_version).image_id
@@ -0,0 +1,121 @@
+import pulumi_oci as oci
+import functools
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, NamedTuple
+
+###################################################################################################################################
+# Data sources shared by the whole program
+###################################################################################################################################
+
+
+class Service(NamedTuple):
+    id: str
+    name: str
+    cidr_block: str
+
+
+class AvailabilityDomain(NamedTuple):
+    name: str
+
+
+class NodePoolSource(NamedTuple):
+    image_id: str
+    source_name: str
+
+
+class Lookups:
+    # Every data source is invoked at most once per run, when the on-disk cache is
+    # enabled (cache_ttl > 0) the results are reused across runs until they expire
+    def __init__(self, compartment_id, region, cache_ttl=0, cache_dir=".lookups"):
+        self.compartment_id = compartment_id
+        self.cache_ttl = cache_ttl
+        key = hashlib.sha256(f"{region}/{compartment_id}".encode()).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"{region}-{key}.json")
+
+    @functools.cached_property
+    def services(self) -> List[Service]:
+        return self._cached(
+            "services",
+            Service,
+            lambda: [
+                Service(s.id, s.name, s.cidr_block)
+                for s in oci.core.get_services().services
+            ],
+        )
+
+    @functools.cached_property
+    def availability_domains(self) -> List[AvailabilityDomain]:
+        return self._cached(
+            "availability_domains",
+            AvailabilityDomain,
+            lambda: [
+                AvailabilityDomain(ad.name)
+                for ad in oci.identity.get_availability_domains(
+                    compartment_id=self.compartment_id
+                ).availability_domains
+            ],
+        )
+
+    @functools.cached_property
+    def node_pool_sources(self) -> List[NodePoolSource]:
+        return self._cached(
+            "node_pool_sources",
+            NodePoolSource,
+            lambda: [
+                NodePoolSource(s.image_id, s.source_name)
+                for s in oci.containerengine.get_node_pool_option(
+                    node_pool_option_id="all", compartment_id=self.compartment_id
+                ).sources
+            ],
+        )
+
+    def node_pool_tags(self, cluster_name) -> Dict[str, Dict[str, str]]:
+        # The freeform tags of the node pools of the named cluster by name, never
+        # cached on disk so a pool created since the last run does not look new. The
+        # default names repeat across stacks, so the pools of the other clusters of
+        # the compartment are left out, and a cluster not created yet has none
+        clusters = [
+            cluster
+            for cluster in oci.containerengine.get_clusters(
+                compartment_id=self.compartment_id, name=cluster_name
+            ).clusters
+            if cluster.state != "DELETED"
+        ]
+        if not clusters:
+            return {}
+        return {
+            pool.name: dict(pool.freeform_tags or {})
+            for pool in oci.containerengine.get_node_pools(
+                compartment_id=self.compartment_id, cluster_id=clusters[0].id
+            ).node_pools
+            if pool.state != "DELETED"
+        }
+
+    def _cached(self, name, typ, fetch):
+        if self.cache_ttl <= 0:
+            return fetch()
+        cache = self._read_cache()
+        entry = cache.get(name)
+        if entry and time.time() - entry["time"] < self.cache_ttl:
+            return [typ(*row) for row in entry["value"]]
+        value = fetch()
+        cache[name] = {"time": time.time(), "value": value}
+        self._write_cache(cache)
+        return value
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, cache):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
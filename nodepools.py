@@ -0,0 +1,431 @@
+import hashlib
+import json
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+###################################################################################################################################
+# Node pools definition
+###################################################################################################################################
+
+# The performance of the block volumes, 10 VPUs per GB is the Balanced default
+# of the boot volumes, above 20 the Ultra High Performance levels
+MIN_VOLUME_SIZE_IN_GBS = 50
+DEFAULT_VPUS_PER_GB = 10
+MAX_VPUS_PER_GB = 120
+FAULT_DOMAINS = ("FAULT-DOMAIN-1", "FAULT-DOMAIN-2", "FAULT-DOMAIN-3")
+# Freeform tag of the node pools placed by the capacity preflight, it records the fit
+# so the next deploys keep it
+CAPACITY_FIT_TAG = "oke-capacity-fit"
+
+
+class NodePoolSpec(NamedTuple):
+    name: str
+    shape: str
+    ocpus: float
+    memory_in_gbs: float
+    size: int
+    max_pods_per_node: int
+    image_id: str = ""
+    per_ad: bool = False
+    # Bounds of the cluster autoscaler
+    min_size: int = 0
+    max_size: int = 0
+    # Storage of the nodes, the containerd volume is not created when its size is 0
+    boot_volume_size_in_gbs: int = 50
+    boot_volume_vpus_per_gb: int = 10
+    containerd_volume_size_in_gbs: int = 0
+    containerd_volume_vpus_per_gb: int = 20
+    # Kernel and kubelet settings of the nodes, see cloudinit.TUNING_PROFILES
+    tuning_profile: str = "default"
+    hugepages: int = 0
+    # Placement: the fault domains the nodes are pinned to, the shapes tried in order
+    # by the capacity preflight and the capacity reservations by availability domain
+    fault_domains: List[str] = []
+    fallback_shapes: List[str] = []
+    capacity_reservations: Dict[str, str] = {}
+    # Pulled when the node boots, so it does not wait for them on its first pods
+    prepull_images: List[str] = []
+    # Replace the nodes when the pool changes, max_surge new nodes at a time while at
+    # most max_unavailable are down, both a count or a percentage of the pool
+    node_cycling: bool = False
+    max_surge: str = "1"
+    max_unavailable: str = "0"
+    # How long the pods of a node are evicted before it is deleted, at most PT60M
+    eviction_grace_duration: str = "PT60M"
+    force_delete_after_grace: bool = False
+
+
+class VirtualNodePoolSpec(NamedTuple):
+    name: str
+    size: int
+    pod_shape: str = "Pod.Standard.E4.Flex"
+    # The virtual nodes are spread over these fault domains of every availability domain
+    fault_domains: List[str] = list(FAULT_DOMAINS)
+
+
+class NodePoolPlacement(NamedTuple):
+    name: str
+    spec: NodePoolSpec
+    availability_domains: List[str]
+    # The CAPACITY_FIT_TAG of a pool the preflight moved from its config
+    capacity_fit: str = ""
+
+
+def node_pool_specs(
+    pools: Optional[list], defaults: NodePoolSpec
+) -> List[NodePoolSpec]:
+    # Without the node_pools config a single pool is built from the legacy keys
+    if not pools:
+        return [check_cycling(check_placement(check_storage(check_sizes(defaults))))]
+    specs = []
+    for pool in pools:
+        if "name" not in pool:
+            raise ValueError(f"Every node pool needs a name: {pool}")
+        unknown = set(pool) - set(NodePoolSpec._fields)
+        if unknown:
+            raise ValueError(
+                f"Unknown settings for the node pool {pool['name']}: {', '.join(sorted(unknown))}"
+            )
+        values = defaults._replace(name=pool["name"], image_id="")._asdict()
+        values.update(pool)
+        size = int(values["size"])
+        spec = NodePoolSpec(
+            name=values["name"],
+            shape=values["shape"],
+            ocpus=float(values["ocpus"]),
+            memory_in_gbs=float(values["memory_in_gbs"]),
+            size=size,
+            max_pods_per_node=int(values["max_pods_per_node"]),
+            image_id=values["image_id"],
+            per_ad=str(values["per_ad"]).lower() == "true",
+            min_size=int(pool.get("min_size", size)),
+            max_size=int(pool.get("max_size", max(size, defaults.max_size))),
+            boot_volume_size_in_gbs=int(values["boot_volume_size_in_gbs"]),
+            boot_volume_vpus_per_gb=int(values["boot_volume_vpus_per_gb"]),
+            containerd_volume_size_in_gbs=int(values["containerd_volume_size_in_gbs"]),
+            containerd_volume_vpus_per_gb=int(values["containerd_volume_vpus_per_gb"]),
+            tuning_profile=values["tuning_profile"],
+            hugepages=int(values["hugepages"]),
+            fault_domains=list(values["fault_domains"]),
+            fallback_shapes=list(values["fallback_shapes"]),
+            capacity_reservations=dict(values["capacity_reservations"]),
+            prepull_images=list(values["prepull_images"]),
+            node_cycling=str(values["node_cycling"]).lower() == "true",
+            max_surge=str(values["max_surge"]),
+            max_unavailable=str(values["max_unavailable"]),
+            eviction_grace_duration=values["eviction_grace_duration"],
+            force_delete_after_grace=str(values["force_delete_after_grace"]).lower()
+            == "true",
+        )
+        specs.append(check_cycling(check_placement(check_storage(check_sizes(spec)))))
+    names = [spec.name for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"The node pool names must be unique: {', '.join(names)}")
+    return specs
+
+
+def virtual_node_pool_specs(pools: Optional[list]) -> List[VirtualNodePoolSpec]:
+    specs = []
+    for pool in pools or []:
+        if "name" not in pool or "size" not in pool:
+            raise ValueError(f"Every virtual node pool needs a name and a size: {pool}")
+        unknown = set(pool) - set(VirtualNodePoolSpec._fields)
+        if unknown:
+            raise ValueError(
+                f"Unknown settings for the virtual node pool {pool['name']}: {', '.join(sorted(unknown))}"
+            )
+        spec = VirtualNodePoolSpec(
+            name=pool["name"],
+            size=int(pool["size"]),
+            pod_shape=pool.get(
+                "pod_shape", VirtualNodePoolSpec._field_defaults["pod_shape"]
+            ),
+            fault_domains=list(
+                pool.get(
+                    "fault_domains",
+                    VirtualNodePoolSpec._field_defaults["fault_domains"],
+                )
+            ),
+        )
+        if not spec.fault_domains:
+            raise ValueError(
+                f"The virtual node pool {spec.name} needs at least one fault domain"
+            )
+        specs.append(check_placement(spec))
+    return specs
+
+
+def check_sizes(spec):
+    if not spec.min_size <= spec.size <= spec.max_size:
+        raise ValueError(
+            f"The node pool {spec.name} needs min_size <= size <= max_size, "
+            f"got {spec.min_size} <= {spec.size} <= {spec.max_size}"
+        )
+    return spec
+
+
+def check_storage(spec):
+    if spec.boot_volume_size_in_gbs < MIN_VOLUME_SIZE_IN_GBS:
+        raise ValueError(
+            f"The boot volume of the node pool {spec.name} needs at least "
+            f"{MIN_VOLUME_SIZE_IN_GBS} GB, got {spec.boot_volume_size_in_gbs}"
+        )
+    if 0 < spec.containerd_volume_size_in_gbs < MIN_VOLUME_SIZE_IN_GBS:
+        raise ValueError(
+            f"The containerd volume of the node pool {spec.name} needs at least "
+            f"{MIN_VOLUME_SIZE_IN_GBS} GB, got {spec.containerd_volume_size_in_gbs}"
+        )
+    for vpus in (spec.boot_volume_vpus_per_gb, spec.containerd_volume_vpus_per_gb):
+        if vpus % 10 or not 0 <= vpus <= MAX_VPUS_PER_GB:
+            raise ValueError(
+                f"The VPUs per GB of the node pool {spec.name} must be a multiple "
+                f"of 10 between 0 and {MAX_VPUS_PER_GB}, got {vpus}"
+            )
+    return spec
+
+
+def check_placement(spec):
+    unknown = [fd for fd in spec.fault_domains if fd not in FAULT_DOMAINS]
+    if unknown:
+        raise ValueError(
+            f"The fault domains of the node pool {spec.name} must be in "
+            f"{', '.join(FAULT_DOMAINS)}, got {', '.join(unknown)}"
+        )
+    return spec
+
+
+def check_cycling(spec):
+    budget = re.compile(r"^\d+%?$")
+    for key in ("max_surge", "max_unavailable"):
+        value = getattr(spec, key)
+        if not budget.match(value) or (value.endswith("%") and int(value[:-1]) > 100):
+            raise ValueError(
+                f"The {key} of the node pool {spec.name} must be a count or a percentage, got {value}"
+            )
+    if (
+        spec.node_cycling
+        and spec.max_surge.rstrip("%") == spec.max_unavailable.rstrip("%") == "0"
+    ):
+        raise ValueError(
+            f"The node pool {spec.name} cannot cycle its nodes with max_surge and max_unavailable 0"
+        )
+    grace = re.match(r"^PT(\d+)M$", spec.eviction_grace_duration)
+    if not grace or int(grace[1]) > 60:
+        raise ValueError(
+            f"The eviction_grace_duration of the node pool {spec.name} must be PT0M to PT60M, "
+            f"got {spec.eviction_grace_duration}"
+        )
+    return spec
+
+
+def manages_volumes(spec):
+    # The nodes change their boot volume or attach a volume through the OCI CLI
+    return (
+        spec.boot_volume_vpus_per_gb != DEFAULT_VPUS_PER_GB
+        or spec.containerd_volume_size_in_gbs > 0
+    )
+
+
+def storage_layout(spec):
+    layout = {
+        "boot_volume_size_in_gbs": spec.boot_volume_size_in_gbs,
+        "boot_volume_vpus_per_gb": spec.boot_volume_vpus_per_gb,
+    }
+    if spec.containerd_volume_size_in_gbs:
+        layout["containerd_volume_size_in_gbs"] = spec.containerd_volume_size_in_gbs
+        layout["containerd_volume_vpus_per_gb"] = spec.containerd_volume_vpus_per_gb
+    return layout
+
+
+def planned_nodes(spec, autoscaling):
+    # With the autoscaler the subnets must fit the largest size of the pool
+    return spec.max_size if autoscaling else spec.size
+
+
+def planned_counts(
+    placements: List[NodePoolPlacement],
+    virtual_node_pools: List[VirtualNodePoolSpec],
+    autoscaling,
+    virtual_max_pods_per_node,
+) -> Tuple[int, int]:
+    # The nodes and the pod IPs the subnets must fit, a virtual node runs the
+    # max_pods_per_node of the stack
+    nodes = sum(planned_nodes(p.spec, autoscaling) for p in placements) + sum(
+        p.size for p in virtual_node_pools
+    )
+    pods = sum(
+        planned_nodes(p.spec, autoscaling) * p.spec.max_pods_per_node
+        for p in placements
+    ) + sum(p.size * virtual_max_pods_per_node for p in virtual_node_pools)
+    return nodes, pods
+
+
+def ad_suffix(ad_name):
+    match = re.search(r"AD-(\d+)$", ad_name)
+    return f"ad{match[1]}" if match else ad_name.split(":")[-1].lower()
+
+
+def place_node_pools(
+    specs: List[NodePoolSpec], ads: List[str]
+) -> List[NodePoolPlacement]:
+    # A per-AD pool becomes one pool for every availability domain, so scaling
+    # or replacing the nodes of one AD does not churn the others
+    placements = []
+    for spec in specs:
+        if spec.per_ad:
+            for ad in ads:
+                placements.append(
+                    NodePoolPlacement(f"{spec.name}-{ad_suffix(ad)}", spec, [ad])
+                )
+        else:
+            placements.append(NodePoolPlacement(spec.name, spec, list(ads)))
+    return placements
+
+
+def is_flexible(shape):
+    return shape.endswith(".Flex")
+
+
+def capacity_reservation(spec, ad):
+    # The reservations are keyed by the availability domain name or its ad<n> suffix
+    return spec.capacity_reservations.get(ad) or spec.capacity_reservations.get(
+        ad_suffix(ad)
+    )
+
+
+def candidate_shapes(spec):
+    return [spec.shape] + [s for s in spec.fallback_shapes if s != spec.shape]
+
+
+def fit_capacity(
+    placements: List[NodePoolPlacement],
+    available: Callable[[NodePoolSpec, str, str, str], bool],
+) -> List[NodePoolPlacement]:
+    # Every pool takes the first of its shapes with capacity, a pool spread over
+    # several availability domains drops the exhausted ones and the pool of an
+    # exhausted availability domain moves its nodes to the other pools of its spec
+    def has_capacity(spec, ad, shape):
+        if shape == spec.shape and capacity_reservation(spec, ad):
+            return True
+        return any(available(spec, ad, shape, fd) for fd in spec.fault_domains or [""])
+
+    def fit(placement):
+        spec = placement.spec
+        for shape in candidate_shapes(spec):
+            ads = [
+                ad
+                for ad in placement.availability_domains
+                if has_capacity(spec, ad, shape)
+            ]
+            if ads:
+                # The image and the reservations of the primary shape may not
+                # fit the fallback shape
+                return placement._replace(
+                    spec=(
+                        spec
+                        if shape == spec.shape
+                        else spec._replace(
+                            shape=shape, image_id="", capacity_reservations={}
+                        )
+                    ),
+                    availability_domains=ads,
+                )
+        return None
+
+    fitted = []
+    for name in dict.fromkeys(p.spec.name for p in placements):
+        group = [p for p in placements if p.spec.name == name]
+        results = [fit(p) for p in group]
+        if not any(results):
+            raise ValueError(
+                f"No capacity for the node pool {name} in "
+                f"{', '.join(ad for p in group for ad in p.availability_domains)} "
+                f"with the shapes {', '.join(candidate_shapes(group[0].spec))}"
+            )
+        receivers = [r for r in results if r]
+        moved = sum(p.spec.size for p, r in zip(group, results) if r is None)
+        for placement, result in zip(group, results):
+            if result is None:
+                # Kept with no nodes, so an existing pool is not replaced
+                fitted.append(
+                    placement._replace(spec=placement.spec._replace(size=0, min_size=0))
+                )
+                continue
+            extra = moved // len(receivers) + (
+                receivers.index(result) < moved % len(receivers)
+            )
+            size = result.spec.size + extra
+            fitted.append(
+                result._replace(
+                    spec=result.spec._replace(
+                        size=size, max_size=max(result.spec.max_size, size)
+                    )
+                )
+            )
+    return fitted
+
+
+def placement_key(placement: NodePoolPlacement):
+    # Changes when the config of the placement changes
+    value = json.dumps(
+        [placement.availability_domains, placement.spec._asdict()], sort_keys=True
+    )
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def capacity_fit_tag(requested: NodePoolPlacement, fitted: NodePoolPlacement):
+    # At most 256 characters as every freeform tag value
+    return json.dumps(
+        {
+            "requested": placement_key(requested),
+            "shape": fitted.spec.shape,
+            "size": fitted.spec.size,
+            "min_size": fitted.spec.min_size,
+            "max_size": fitted.spec.max_size,
+            "ads": fitted.availability_domains,
+        },
+        separators=(",", ":"),
+    )
+
+
+def recorded_fit(placement: NodePoolPlacement, tags: Dict[str, str]):
+    # The placement a deployed pool got from the preflight, as long as its config
+    # did not change since
+    tag = tags.get(CAPACITY_FIT_TAG)
+    if not tag:
+        return placement
+    fit = json.loads(tag)
+    if fit["requested"] != placement_key(placement):
+        return placement
+    spec = placement.spec
+    if fit["shape"] != spec.shape:
+        spec = spec._replace(shape=fit["shape"], image_id="", capacity_reservations={})
+    return placement._replace(
+        spec=spec._replace(
+            size=fit["size"], min_size=fit["min_size"], max_size=fit["max_size"]
+        ),
+        availability_domains=fit["ads"],
+        capacity_fit=tag,
+    )
+
+
+def fit_new_capacity(
+    placements: List[NodePoolPlacement],
+    deployed: Dict[str, Dict[str, str]],
+    available: Callable[[NodePoolSpec, str, str, str], bool],
+) -> List[NodePoolPlacement]:
+    # deployed holds the freeform tags of the deployed pools by placement name. Only
+    # the pools not deployed yet are fitted, a deployed pool is never shrunk or moved
+    # to another shape by a capacity report and keeps the fit it was created with
+    new = [p for p in placements if p.name not in deployed]
+    fitted = {p.name: p for p in fit_capacity(new, available)} if new else {}
+    result = []
+    for placement in placements:
+        if placement.name in deployed:
+            result.append(recorded_fit(placement, deployed[placement.name]))
+            continue
+        fit = fitted[placement.name]
+        if fit != placement:
+            fit = fit._replace(capacity_fit=capacity_fit_tag(placement, fit))
+        result.append(fit)
+    return result
@@ -0,0 +1,72 @@
+import pulumi
+from typing import List, NamedTuple
+
+###################################################################################################################################
+# Flow logs and alarms
+###################################################################################################################################
+
+# The logs are kept in 30 days increments up to 180 days
+LOG_RETENTION_DAYS = (30, 60, 90, 120, 150, 180)
+# The subnets whose VCN flow logs are collected
+FLOW_LOG_TIERS = ("workers", "pods", "loadbalancers")
+# The OKE worker nodes are the instances named oke-<cluster>-<pool>-<subnet>-<n>,
+# each part ending with the last characters of the OCID it stands for
+NODE_ID_SUFFIX = 10
+
+
+def node_instances(cluster_id):
+    # The worker nodes of the pools of one cluster, other clusters of the
+    # compartment keep their own alarms
+    return f'resourceDisplayName =~ "oke-*{cluster_id[-NODE_ID_SUFFIX:]}-*"'
+
+
+class AlarmSpec(NamedTuple):
+    name: str
+    namespace: str
+    query: pulumi.Input[str]
+    severity: str
+    summary: str
+    pending_duration: str = "PT5M"
+
+
+def nat_gateway_alarm(nat_gateway_id) -> AlarmSpec:
+    # Any packet dropped by the NAT gateway, usually its connections limit
+    return AlarmSpec(
+        "NatGatewayDrops",
+        "oci_nat_gateway",
+        pulumi.Output.concat(
+            'DropsToNATgw[1m]{resourceId = "', nat_gateway_id, '"}.sum() > 0'
+        ),
+        "CRITICAL",
+        "The NAT gateway of the workers is dropping packets",
+        "PT1M",
+    )
+
+
+def node_alarms(cluster_id, cpu_threshold, memory_threshold) -> List[AlarmSpec]:
+    # Fired per node, the instances of every pool of the cluster
+    instances = pulumi.Output.from_input(cluster_id).apply(node_instances)
+    return [
+        AlarmSpec(
+            "NodeCpuSaturation",
+            "oci_computeagent",
+            pulumi.Output.concat(
+                "CpuUtilization[5m]{",
+                instances,
+                f"}}.mean() > {cpu_threshold:g}",
+            ),
+            "WARNING",
+            f"A worker node is above {cpu_threshold:g}% CPU",
+        ),
+        AlarmSpec(
+            "NodeMemorySaturation",
+            "oci_computeagent",
+            pulumi.Output.concat(
+                "MemoryUtilization[5m]{",
+                instances,
+                f"}}.mean() > {memory_threshold:g}",
+            ),
+            "WARNING",
+            f"A worker node is above {memory_threshold:g}% memory",
+        ),
+    ]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+###################################################################################################################################
+# Caching kubectl exec credential plugin for OKE
+#
+# Drop-in replacement of the OCI CLI in the kubeconfig exec section, it takes the same arguments:
+#   oke_token_cache.py ce cluster generate-token --cluster-id <ocid> --region <region>
+# The token is minted with the OCI CLI once and reused until shortly before it expires, when it is about to
+# expire the cached token is still returned and a new one is minted in the background.
+###################################################################################################################################
+
+CACHE_DIR = os.environ.get(
+    "OKE_TOKEN_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".kube", "cache", "oke"),
+)
+OCI_CLI = os.environ.get("OKE_TOKEN_OCI_CLI", "oci")
+# Refresh in the background when the token expires within this many seconds
+REFRESH_WINDOW = 60
+# Never hand out a token expiring within this many seconds
+MIN_VALIDITY = 10
+# A background refresh holding the lock longer than this is considered dead
+LOCK_TIMEOUT = 30
+
+
+def cache_path(args):
+    # The OCI CLI profile changes the identity of the token
+    key = json.dumps(
+        [args, os.environ.get("OCI_CLI_PROFILE"), os.environ.get("OCI_CLI_CONFIG_FILE")]
+    )
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+
+def expires_in(credential):
+    timestamp = credential["status"]["expirationTimestamp"].replace("Z", "+00:00")
+    expiration = datetime.datetime.fromisoformat(timestamp)
+    return expiration.timestamp() - time.time()
+
+
+def read_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def mint(args, path):
+    result = subprocess.run([OCI_CLI, *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        sys.exit(result.returncode)
+    credential = json.loads(result.stdout)
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(
+        os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w"
+    ) as f:
+        json.dump(credential, f)
+    os.replace(tmp_path, path)
+    return credential
+
+
+def refresh_in_background(args, path):
+    lock_path = path + ".lock"
+    try:
+        if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+            os.remove(lock_path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--refresh", *args],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def get_credential(args):
+    path = cache_path(args)
+    credential = read_cache(path)
+    if credential is not None:
+        remaining = expires_in(credential)
+        if remaining > MIN_VALIDITY:
+            if remaining < REFRESH_WINDOW:
+                refresh_in_background(args, path)
+            return credential
+    return mint(args, path)
+
+
+def main(argv):
+    if argv and argv[0] == "--refresh":
+        path = cache_path(argv[1:])
+        try:
+            mint(argv[1:], path)
+        finally:
+            try:
+                os.remove(path + ".lock")
+            except OSError:
+                pass
+        return
+    json.dump(get_credential(argv), sys.stdout)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
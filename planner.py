@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import sys
+import time
+import yaml
+from typing import Dict, List, NamedTuple, Optional
+from nodepools import (
+    NodePoolSpec,
+    is_flexible,
+    node_pool_specs,
+    place_node_pools,
+    planned_counts,
+    planned_nodes,
+    virtual_node_pool_specs,
+)
+from subnets import (
+    IPS_PER_LOAD_BALANCER,
+    OVERLAY_MAX_PODS_PER_NODE,
+    CapacityError,
+    check_disjoint,
+    check_overlay_capacity,
+    format_plan,
+    plan_subnets,
+    subnet_layout,
+    subnet_requests,
+)
+
+###################################################################################################################################
+# Offline capacity planner
+#
+# Reads the config of a stack (the Pulumi.yaml defaults, Pulumi.<stack>.yaml and --set overrides) and
+# runs the subnet and node pool placement logic of the program without the Pulumi engine or the OCI API:
+#   python planner.py --stack dev --set oke_min_nodes=20
+# It exits with 1 when a shape, subnet or pod limit would be exceeded.
+###################################################################################################################################
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# A VCN-native node keeps its primary VNIC, every other VNIC holds 31 pod IPs
+PODS_PER_VNIC = 31
+MAX_PODS_PER_NODE = 110
+
+
+class ShapeLimits(NamedTuple):
+    min_ocpus: float
+    max_ocpus: float
+    # Memory per OCPU of the flexible shapes, the fixed shapes have a single value
+    min_memory_per_ocpu: float
+    max_memory_per_ocpu: float
+    max_memory_in_gbs: float
+    max_vnics: int
+
+
+# The flexible shapes get max(2, OCPUs) VNICs up to max_vnics, the fixed shapes max_vnics
+SHAPE_LIMITS = {
+    "VM.Standard.A1.Flex": ShapeLimits(1, 80, 1, 64, 512, 24),
+    "VM.Standard.A2.Flex": ShapeLimits(1, 78, 1, 64, 946, 24),
+    "VM.Standard.E3.Flex": ShapeLimits(1, 64, 1, 64, 1024, 24),
+    "VM.Standard.E4.Flex": ShapeLimits(1, 64, 1, 64, 1024, 24),
+    "VM.Standard.E5.Flex": ShapeLimits(1, 94, 1, 64, 1049, 24),
+    "VM.Standard3.Flex": ShapeLimits(1, 32, 1, 64, 512, 24),
+    "VM.Optimized3.Flex": ShapeLimits(1, 18, 1, 64, 256, 24),
+    "VM.Standard2.1": ShapeLimits(1, 1, 15, 15, 15, 2),
+    "VM.Standard2.2": ShapeLimits(2, 2, 15, 15, 30, 2),
+    "VM.Standard2.4": ShapeLimits(4, 4, 15, 15, 60, 4),
+    "VM.Standard2.8": ShapeLimits(8, 8, 15, 15, 120, 8),
+    "VM.GPU.A10.1": ShapeLimits(15, 15, 16, 16, 240, 15),
+    "VM.GPU.A10.2": ShapeLimits(30, 30, 16, 16, 480, 24),
+    "VM.GPU3.1": ShapeLimits(6, 6, 15, 15, 90, 6),
+}
+
+
+class StackConfig:
+    # The subset of pulumi.Config read by the planner, over plain values
+    def __init__(self, values: Dict[str, object]):
+        self.values = values
+
+    def get(self, key):
+        value = self.values.get(key)
+        return None if value is None else str(value)
+
+    def require(self, key):
+        value = self.get(key)
+        if value is None:
+            raise ValueError(f"Missing required configuration variable {key}")
+        return value
+
+    def require_bool(self, key):
+        return self.require(key).lower() == "true"
+
+    def get_object(self, key):
+        value = self.values.get(key)
+        return json.loads(value) if isinstance(value, str) else value
+
+
+def load_config(stack: Optional[str], overrides: List[str]) -> StackConfig:
+    with open(os.path.join(PROJECT_DIR, "Pulumi.yaml")) as f:
+        project = yaml.safe_load(f)
+    values = {
+        key: value["default"]
+        for key, value in project.get("config", {}).items()
+        if ":" not in key and "default" in value
+    }
+    if stack:
+        with open(os.path.join(PROJECT_DIR, f"Pulumi.{stack}.yaml")) as f:
+            stack_config = (yaml.safe_load(f) or {}).get("config", {})
+        prefix = f"{project['name']}:"
+        values.update(
+            {
+                key[len(prefix) :]: value
+                for key, value in stack_config.items()
+                if key.startswith(prefix)
+            }
+        )
+    for override in overrides:
+        key, _, value = override.partition("=")
+        values[key] = value
+    return StackConfig(values)
+
+
+def node_vnics(limits: ShapeLimits, shape, ocpus):
+    if is_flexible(shape):
+        return max(2, min(limits.max_vnics, int(ocpus)))
+    return limits.max_vnics
+
+
+def pod_limit(limits: ShapeLimits, shape, ocpus, vcn_native):
+    if not vcn_native:
+        return OVERLAY_MAX_PODS_PER_NODE
+    return min(
+        MAX_PODS_PER_NODE, (node_vnics(limits, shape, ocpus) - 1) * PODS_PER_VNIC
+    )
+
+
+def node_resources(spec: NodePoolSpec):
+    # The fixed shapes ignore the configured OCPUs and memory
+    limits = SHAPE_LIMITS.get(spec.shape)
+    if limits and not is_flexible(spec.shape):
+        return limits.max_ocpus, limits.max_memory_in_gbs
+    return spec.ocpus, spec.memory_in_gbs
+
+
+def check_shape(spec: NodePoolSpec, vcn_native) -> List[str]:
+    limits = SHAPE_LIMITS.get(spec.shape)
+    if limits is None:
+        return []
+    violations = []
+    if is_flexible(spec.shape):
+        if not limits.min_ocpus <= spec.ocpus <= limits.max_ocpus:
+            violations.append(
+                f"{spec.name}: {spec.shape} takes {limits.min_ocpus:g} to "
+                f"{limits.max_ocpus:g} OCPUs, got {spec.ocpus:g}"
+            )
+        per_ocpu = spec.memory_in_gbs / spec.ocpus if spec.ocpus else 0
+        if not limits.min_memory_per_ocpu <= per_ocpu <= limits.max_memory_per_ocpu:
+            violations.append(
+                f"{spec.name}: {spec.shape} takes {limits.min_memory_per_ocpu:g} to "
+                f"{limits.max_memory_per_ocpu:g} GB per OCPU, got {per_ocpu:g}"
+            )
+        if spec.memory_in_gbs > limits.max_memory_in_gbs:
+            violations.append(
+                f"{spec.name}: {spec.shape} takes at most {limits.max_memory_in_gbs:g} GB, "
+                f"got {spec.memory_in_gbs:g}"
+            )
+    ocpus, _ = node_resources(spec)
+    max_pods = pod_limit(limits, spec.shape, ocpus, vcn_native)
+    if spec.max_pods_per_node > max_pods:
+        violations.append(
+            f"{spec.name}: a {spec.shape} node with {ocpus:g} OCPUs runs at most "
+            f"{max_pods} pods, max_pods_per_node is {spec.max_pods_per_node}"
+        )
+    return violations
+
+
+def ad_distribution(placements, ads, autoscaling) -> Dict[str, int]:
+    # OKE spreads the nodes of a pool round robin over its placement configs
+    nodes = {ad: 0 for ad in ads}
+    for placement in placements:
+        count = planned_nodes(placement.spec, autoscaling)
+        domains = placement.availability_domains
+        for index, ad in enumerate(domains):
+            nodes[ad] += count // len(domains) + (index < count % len(domains))
+    return nodes
+
+
+def usage(demand, capacity):
+    return f"{demand / capacity:.0%}" if capacity else "-"
+
+
+def plan(config: StackConfig, ad_count=3):
+    # Returns the report lines and the violated limits
+    lines = []
+    violations = []
+    oke_min_nodes = int(config.require("oke_min_nodes"))
+    oke_max_nodes = int(config.require("oke_max_nodes"))
+    max_pods_per_node = int(config.require("max_pods_per_node"))
+    vcn_cidr_block = config.require("vcn_cidr_block")
+    vcn_native = config.require("cni_type") == "OCI_VCN_IP_NATIVE"
+    autoscaling = config.require_bool("cluster_autoscaler")
+    load_balancer_count = int(config.require("load_balancer_count"))
+    node_pool_defaults = NodePoolSpec(
+        name="NodePool",
+        shape=config.require("node_shape"),
+        ocpus=float(config.require("oke_ocpus")),
+        memory_in_gbs=float(config.require("oke_memory_in_gbs")),
+        size=oke_min_nodes,
+        max_pods_per_node=max_pods_per_node,
+        min_size=oke_min_nodes,
+        max_size=max(oke_min_nodes, oke_max_nodes),
+    )
+    node_pools = node_pool_specs(config.get_object("node_pools"), node_pool_defaults)
+    virtual_node_pools = virtual_node_pool_specs(
+        config.get_object("virtual_node_pools")
+    )
+    ads = [f"AD-{n}" for n in range(1, ad_count + 1)]
+    placements = place_node_pools(node_pools, ads)
+    if config.get_object("clusters"):
+        lines.append(
+            "The clusters list is not planned, the report covers the stack settings\n"
+        )
+
+    # Compute
+    lines.append(
+        f"{'node pool':<20}{'shape':<22}{'nodes':>7}{'ocpus':>8}{'memory':>9}{'pods':>6}{'limit':>7}"
+    )
+    total_nodes = total_ocpus = total_memory = 0
+    for placement in placements:
+        spec = placement.spec
+        nodes = planned_nodes(spec, autoscaling)
+        ocpus, memory = node_resources(spec)
+        limits = SHAPE_LIMITS.get(spec.shape)
+        limit = pod_limit(limits, spec.shape, ocpus, vcn_native) if limits else "?"
+        lines.append(
+            f"{placement.name:<20}{spec.shape:<22}{nodes:>7}{nodes * ocpus:>8g}"
+            f"{nodes * memory:>9g}{spec.max_pods_per_node:>6}{limit:>7}"
+        )
+        total_nodes += nodes
+        total_ocpus += nodes * ocpus
+        total_memory += nodes * memory
+    for spec in node_pools:
+        if spec.shape not in SHAPE_LIMITS:
+            lines.append(
+                f"{spec.shape} is not in the shape table, its limits are not checked"
+            )
+        violations += check_shape(spec, vcn_native)
+    lines.append(
+        f"{total_nodes} nodes{' at their max_size' if autoscaling else ''}, "
+        f"{total_ocpus:g} OCPUs, {total_memory:g} GB of memory"
+    )
+
+    # Subnets
+    node_count, pod_count = planned_counts(
+        placements, virtual_node_pools, autoscaling, max_pods_per_node
+    )
+    lines.append("")
+    try:
+        check_disjoint(
+            vcn_cidr_block,
+            kubernetes_pods_cidr=config.require("kubernetes_pods_cidr"),
+            kubernetes_services_cidr=config.require("kubernetes_services_cidr"),
+        )
+        if not vcn_native:
+            check_overlay_capacity(
+                config.require("kubernetes_pods_cidr"),
+                node_count,
+                max(p.max_pods_per_node for p in node_pools),
+            )
+    except CapacityError as e:
+        violations.append(str(e))
+    try:
+        subnet_plan = plan_subnets(
+            vcn_cidr_block,
+            subnet_requests(
+                node_count,
+                pod_count if vcn_native else 0,
+                load_balancer_count,
+                float(config.require("subnet_headroom")),
+            ),
+            subnet_layout(config.get_object("subnet_layout")),
+        )
+    except CapacityError as e:
+        violations.append(str(e).splitlines()[0])
+        lines.append(str(e))
+    else:
+        lines.append(format_plan(vcn_cidr_block, list(subnet_plan.values())))
+        if vcn_native:
+            pods = subnet_plan["pods"]
+            lines.append(
+                f"pod IPs: {pods.capacity} in {pods.cidr}, {pod_count} needed by "
+                f"the nodes x max pods ({usage(pod_count, pods.capacity)})"
+            )
+        load_balancers = subnet_plan["loadbalancers"]
+        lines.append(
+            f"load balancers: {load_balancers.capacity // IPS_PER_LOAD_BALANCER} fit "
+            f"{load_balancers.cidr}, {load_balancer_count} planned "
+            f"({usage(load_balancer_count * IPS_PER_LOAD_BALANCER, load_balancers.capacity)})"
+        )
+
+    # Availability domains
+    lines.append("")
+    distribution = ad_distribution(placements, ads, autoscaling)
+    lines.append(
+        "nodes by availability domain: "
+        + ", ".join(f"{ad} {nodes}" for ad, nodes in distribution.items())
+    )
+    return lines, violations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the compute, subnet and pod capacity of the stack config without deploying it"
+    )
+    parser.add_argument(
+        "--stack", help="read Pulumi.<stack>.yaml on top of the defaults"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a config value, the objects as JSON",
+    )
+    parser.add_argument(
+        "--availability-domains",
+        type=int,
+        default=3,
+        help="availability domains of the region",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        lines, violations = plan(
+            load_config(args.stack, args.set), args.availability_domains
+        )
+    except ValueError as e:
+        lines, violations = [], [str(e)]
+    elapsed = (time.perf_counter() - start) * 1000
+    print("\n".join(lines))
+    if violations:
+        print("\nlimits exceeded:")
+        for violation in violations:
+            print(f"  {violation}")
+    print(f"\nplanned in {elapsed:.1f} ms")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
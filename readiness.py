@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import math
+import subprocess
+import sys
+import time
+
+###################################################################################################################################
+# Readiness of the nodes and smoke benchmark of a cluster, through kubectl and the generated kubeconfig
+#
+#   readiness.py kubeconfig --nodes 3 --timeout 900 --smoke-pods 30
+###################################################################################################################################
+
+KUBECTL = "kubectl"
+# Backoff between two polls, in seconds
+MIN_POLL = 5
+MAX_POLL = 60
+SMOKE_NAMESPACE = "default"
+SMOKE_NAME = "oke-smoke-benchmark"
+SMOKE_IMAGE = "registry.k8s.io/pause:3.9"
+
+
+def kubectl(kubeconfig, *args, stdin=None):
+    result = subprocess.run(
+        [KUBECTL, "--kubeconfig", kubeconfig, *args],
+        input=stdin,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"kubectl {' '.join(args)} failed")
+    return json.loads(result.stdout) if "-o" in args else result.stdout
+
+
+def condition(item, kind):
+    for c in item.get("status", {}).get("conditions", []):
+        if c["type"] == kind:
+            return c["status"] == "True"
+    return False
+
+
+def pod_ready(pod):
+    return pod["status"].get("phase") == "Succeeded" or condition(pod, "Ready")
+
+
+def cluster_status(kubeconfig):
+    nodes = kubectl(kubeconfig, "get", "nodes", "-o", "json")["items"]
+    pods = kubectl(kubeconfig, "get", "pods", "-n", "kube-system", "-o", "json")[
+        "items"
+    ]
+    return {
+        "nodes": len(nodes),
+        "ready_nodes": sum(condition(node, "Ready") for node in nodes),
+        "system_pods": len(pods),
+        "ready_system_pods": sum(pod_ready(pod) for pod in pods),
+    }
+
+
+def is_ready(status, expected_nodes):
+    return (
+        status["ready_nodes"] >= max(expected_nodes, 1)
+        and status["system_pods"] > 0
+        and status["ready_system_pods"] == status["system_pods"]
+    )
+
+
+def wait_ready(kubeconfig, expected_nodes, timeout, log=print):
+    # Poll with an exponential backoff until the nodes and the kube-system pods
+    # are Ready, the API server may still be unreachable at the beginning
+    start = time.monotonic()
+    delay = MIN_POLL
+    status = {}
+    while True:
+        try:
+            status = cluster_status(kubeconfig)
+            if is_ready(status, expected_nodes):
+                break
+            log(
+                f"{status['ready_nodes']}/{expected_nodes} nodes and "
+                f"{status['ready_system_pods']}/{status['system_pods']} kube-system pods ready"
+            )
+        except (RuntimeError, ValueError) as e:
+            log(f"cluster not reachable yet: {e}")
+        if time.monotonic() - start + delay > timeout:
+            return {
+                "ready": False,
+                "seconds": round(time.monotonic() - start, 1),
+                **status,
+            }
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL)
+    return {"ready": True, "seconds": round(time.monotonic() - start, 1), **status}
+
+
+def percentile(values, q):
+    # Nearest rank percentile
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def parse_time(timestamp):
+    return datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def smoke_deployment(pods):
+    # Pause pods spread over the availability domains
+    labels = {"app": SMOKE_NAME}
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {"name": SMOKE_NAME, "namespace": SMOKE_NAMESPACE},
+        "spec": {
+            "replicas": pods,
+            "selector": {"matchLabels": labels},
+            "template": {
+                "metadata": {"labels": labels},
+                "spec": {
+                    "topologySpreadConstraints": [
+                        {
+                            "maxSkew": 1,
+                            "topologyKey": "topology.kubernetes.io/zone",
+                            "whenUnsatisfiable": "ScheduleAnyway",
+                            "labelSelector": {"matchLabels": labels},
+                        }
+                    ],
+                    "containers": [
+                        {
+                            "name": "pause",
+                            "image": SMOKE_IMAGE,
+                            "resources": {"requests": {"cpu": "10m", "memory": "8Mi"}},
+                        }
+                    ],
+                },
+            },
+        },
+    }
+
+
+def pod_start_seconds(pod):
+    # From the pod creation to its container running, the timestamps have a
+    # resolution of one second
+    for status in pod["status"].get("containerStatuses", []):
+        running = status.get("state", {}).get("running")
+        if running:
+            created = parse_time(pod["metadata"]["creationTimestamp"])
+            return (parse_time(running["startedAt"]) - created).total_seconds()
+    return None
+
+
+def smoke_benchmark(kubeconfig, pods, timeout, log=print):
+    kubectl(kubeconfig, "apply", "-f", "-", stdin=json.dumps(smoke_deployment(pods)))
+    start = time.monotonic()
+    try:
+        while True:
+            items = kubectl(
+                kubeconfig,
+                "get",
+                "pods",
+                "-n",
+                SMOKE_NAMESPACE,
+                "-l",
+                f"app={SMOKE_NAME}",
+                "-o",
+                "json",
+            )["items"]
+            seconds = [s for s in map(pod_start_seconds, items) if s is not None]
+            if len(seconds) >= pods or time.monotonic() - start > timeout:
+                break
+            log(f"{len(seconds)}/{pods} smoke pods running")
+            time.sleep(MIN_POLL)
+    finally:
+        kubectl(
+            kubeconfig,
+            "delete",
+            "deployment",
+            SMOKE_NAME,
+            "-n",
+            SMOKE_NAMESPACE,
+            "--ignore-not-found",
+        )
+    nodes = kubectl(kubeconfig, "get", "nodes", "-o", "json")["items"]
+    node_zones = {
+        node["metadata"]["name"]: node["metadata"]
+        .get("labels", {})
+        .get("topology.kubernetes.io/zone", "unknown")
+        for node in nodes
+    }
+    zones = {}
+    for item in items:
+        zone = node_zones.get(item["spec"].get("nodeName"), "unscheduled")
+        zones[zone] = zones.get(zone, 0) + 1
+    return {
+        "pods": pods,
+        "running": len(seconds),
+        "p50": percentile(seconds, 50) if seconds else None,
+        "p99": percentile(seconds, 99) if seconds else None,
+        "pods_per_zone": zones,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Wait for the nodes and kube-system pods to be Ready, then optionally run a pod start smoke benchmark"
+    )
+    parser.add_argument("kubeconfig", help="the kubeconfig of the cluster")
+    parser.add_argument("--nodes", type=int, default=1, help="ready nodes to wait for")
+    parser.add_argument("--timeout", type=float, default=900, help="seconds to wait")
+    parser.add_argument(
+        "--smoke-pods", type=int, default=0, help="pods started by the smoke benchmark"
+    )
+    args = parser.parse_args()
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    report = {"readiness": wait_ready(args.kubeconfig, args.nodes, args.timeout, log)}
+    if report["readiness"]["ready"] and args.smoke_pods:
+        report["smoke_benchmark"] = smoke_benchmark(
+            args.kubeconfig, args.smoke_pods, args.timeout, log
+        )
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if not report["readiness"]["ready"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+import yaml
+from pulumi import automation as auto
+
+###################################################################################################################################
+# Parallel rollout of the program to several regions with the Automation API
+#
+# The targets file is a YAML (or JSON) list, every target is deployed to its own stack:
+#   - region: eu-frankfurt-1
+#     compartment_ocid: ocid1.compartment.oc1..aaaa
+#     vcn_cidr_block: 10.0.0.0/16
+#     stack: frankfurt          # optional, the region by default
+#     config:                   # optional, any other config of the program
+#       oke_min_nodes: "3"
+###################################################################################################################################
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# The workspace of the inline program, it keeps the Pulumi.<stack>.yaml of the targets
+WORK_DIR = os.path.join(PROJECT_DIR, ".rollout")
+TARGET_KEYS = {"region", "compartment_ocid", "vcn_cidr_block", "stack", "config"}
+
+_print_lock = threading.Lock()
+
+
+def log(stack_name, message):
+    with _print_lock:
+        print(f"[{stack_name}] {message}", flush=True)
+
+
+def load_project():
+    with open(os.path.join(PROJECT_DIR, "Pulumi.yaml")) as f:
+        project = yaml.safe_load(f)
+    defaults = {
+        key: value["default"]
+        for key, value in project.get("config", {}).items()
+        if ":" not in key and "default" in value
+    }
+    return project["name"], defaults
+
+
+def load_targets(path):
+    with open(path) as f:
+        targets = yaml.safe_load(f)
+    if not isinstance(targets, list) or not targets:
+        raise ValueError(f"{path} must contain a list of targets")
+    for target in targets:
+        missing = {"region", "compartment_ocid"} - set(target)
+        if missing:
+            raise ValueError(f"Target {target} misses {', '.join(sorted(missing))}")
+        unknown = set(target) - TARGET_KEYS
+        if unknown:
+            raise ValueError(
+                f"Unknown settings for the target {target['region']}: {', '.join(sorted(unknown))}"
+            )
+    names = [target.get("stack", target["region"]) for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"The target stacks must be unique: {', '.join(names)}")
+    return targets
+
+
+###################################################################################################################################
+# Timing telemetry
+###################################################################################################################################
+
+
+class TimingRecorder:
+    # Collects the start and end of every resource step from the engine events,
+    # the times are taken when the event is received, in seconds from the rollout start
+
+    def __init__(self, stack_name, origin, verbose=False):
+        self.stack_name = stack_name
+        self.origin = origin
+        self.verbose = verbose
+        self.steps = {}
+
+    def __call__(self, event: auto.EngineEvent):
+        now = time.monotonic() - self.origin
+        if event.resource_pre_event and not event.resource_pre_event.planning:
+            metadata = event.resource_pre_event.metadata
+            self.steps[metadata.urn] = {
+                "urn": metadata.urn,
+                "type": metadata.type,
+                "name": metadata.urn.split("::")[-1],
+                "op": str(getattr(metadata.op, "value", metadata.op)),
+                "start": round(now, 3),
+                "end": None,
+                "duration": None,
+                "failed": False,
+            }
+            if self.verbose:
+                log(self.stack_name, f"{self.steps[metadata.urn]['op']} {metadata.urn}")
+        elif event.res_outputs_event or event.res_op_failed_event:
+            step_event = event.res_outputs_event or event.res_op_failed_event
+            step = self.steps.get(step_event.metadata.urn)
+            if step is None:
+                return
+            step["end"] = round(now, 3)
+            step["duration"] = round(now - step["start"], 3)
+            step["failed"] = event.res_op_failed_event is not None
+            if step["op"] != "same" or step["failed"]:
+                log(
+                    self.stack_name,
+                    f"{step['op']} {step['name']} {'failed' if step['failed'] else 'done'} in {step['duration']:.1f}s",
+                )
+        elif event.diagnostic_event and event.diagnostic_event.severity == "error":
+            log(self.stack_name, event.diagnostic_event.message.strip())
+
+
+def critical_path(steps, dependencies):
+    # Walk back from the last resource to finish through the dependency that
+    # finished last, that is the chain of steps the deployment waited on
+    finished = {urn: step for urn, step in steps.items() if step["end"] is not None}
+    if not finished:
+        return []
+    urn = max(finished, key=lambda u: finished[u]["end"])
+    path = []
+    while urn is not None:
+        path.append(urn)
+        waited = [d for d in dependencies.get(urn, []) if d in finished]
+        urn = max(waited, key=lambda u: finished[u]["end"]) if waited else None
+    return [finished[urn] for urn in reversed(path)]
+
+
+def stack_dependencies(stack: auto.Stack):
+    deployment = stack.export_stack().deployment or {}
+    dependencies = {}
+    for resource in deployment.get("resources", []):
+        dependencies[resource["urn"]] = list(resource.get("dependencies", []))
+        if resource.get("parent"):
+            dependencies[resource["urn"]].append(resource["parent"])
+    return dependencies
+
+
+###################################################################################################################################
+# Rollout
+###################################################################################################################################
+
+
+def program():
+    runpy.run_path(os.path.join(PROJECT_DIR, "__main__.py"), run_name="__main__")
+
+
+def deploy(target, project, defaults, operation, origin, verbose):
+    stack_name = target.get("stack", target["region"])
+    os.makedirs(WORK_DIR, exist_ok=True)
+    stack = auto.create_or_select_stack(
+        stack_name=stack_name,
+        project_name=project,
+        program=program,
+        opts=auto.LocalWorkspaceOptions(
+            work_dir=WORK_DIR,
+            project_settings=auto.ProjectSettings(name=project, runtime="python"),
+        ),
+    )
+    # The inline program does not read the Pulumi.yaml defaults, the values
+    # already set on the stack are kept
+    existing = stack.get_all_config()
+    config = {
+        f"{project}:{key}": str(value)
+        for key, value in defaults.items()
+        if f"{project}:{key}" not in existing
+    }
+    config.update(
+        {
+            "oci:region": target["region"],
+            f"{project}:compartment_ocid": target["compartment_ocid"],
+            # The targets run in the same directory, every one gets its kubeconfig
+            f"{project}:kubeconfig_path": os.path.join(
+                PROJECT_DIR, f"kubeconfig-{stack_name}"
+            ),
+        }
+    )
+    if "vcn_cidr_block" in target:
+        config[f"{project}:vcn_cidr_block"] = target["vcn_cidr_block"]
+    for key, value in target.get("config", {}).items():
+        config[key if ":" in key else f"{project}:{key}"] = (
+            value if isinstance(value, str) else json.dumps(value)
+        )
+    stack.set_all_config(
+        {key: auto.ConfigValue(value=value) for key, value in config.items()}
+    )
+
+    recorder = TimingRecorder(stack_name, origin, verbose)
+    start = time.monotonic() - origin
+    log(stack_name, f"{operation} started in {target['region']}")
+    result = "succeeded"
+    try:
+        if operation == "up":
+            stack.up(on_event=recorder)
+        elif operation == "preview":
+            stack.preview(on_event=recorder)
+        else:
+            stack.destroy(on_event=recorder)
+    except auto.CommandError as e:
+        result = "failed"
+        log(stack_name, str(e).strip().splitlines()[-1])
+    end = time.monotonic() - origin
+    log(stack_name, f"{operation} {result} in {end - start:.1f}s")
+
+    path = critical_path(recorder.steps, stack_dependencies(stack))
+    return stack_name, {
+        "region": target["region"],
+        "operation": operation,
+        "result": result,
+        "start": round(start, 3),
+        "end": round(end, 3),
+        "duration": round(end - start, 3),
+        "resources": sorted(recorder.steps.values(), key=lambda s: s["start"]),
+        "critical_path": [step["name"] for step in path],
+        "critical_path_duration": round(sum(step["duration"] for step in path), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Deploy the program to several regions in parallel and report the timing of every resource"
+    )
+    parser.add_argument("targets", help="YAML or JSON file with the list of targets")
+    parser.add_argument(
+        "--operation", choices=("up", "preview", "destroy"), default="up"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="targets deployed at the same time"
+    )
+    parser.add_argument(
+        "--report", default="rollout.json", help="where the timing report is written"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="print every resource step when it starts",
+    )
+    args = parser.parse_args()
+
+    project, defaults = load_project()
+    targets = load_targets(args.targets)
+    origin = time.monotonic()
+    report = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(
+                deploy, target, project, defaults, args.operation, origin, args.verbose
+            )
+            for target in targets
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            stack_name, result = future.result()
+            report[stack_name] = result
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    for stack_name, result in report.items():
+        slowest = max(
+            result["resources"], key=lambda s: s["duration"] or 0, default=None
+        )
+        print(
+            f"{stack_name:<20}{result['result']:>10}{result['duration']:>10.1f}s"
+            f"  critical path {result['critical_path_duration']:.1f}s"
+            + (
+                f", slowest {slowest['name']} {slowest['duration']:.1f}s"
+                if slowest
+                else ""
+            )
+        )
+    if any(result["result"] != "succeeded" for result in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
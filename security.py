@@ -0,0 +1,490 @@
+import pulumi_oci as oci
+import hashlib
+import ipaddress
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+###################################################################################################################################
+# Security rules matrix
+###################################################################################################################################
+
+TCP = "6"
+UDP = "17"
+ICMP = "1"
+ICMPV6 = "58"
+ALL = "all"
+
+# Peers that are not a tier of the VCN
+INTERNET = "internet"
+SERVICES = "services"
+
+PATH_DISCOVERY = (3, 4)
+# ICMPv6 Packet Too Big
+PATH_DISCOVERY_V6 = (2, 0)
+# The tiers routed to the internet over IPv6, the NAT and service gateways are IPv4 only
+IPV6_INTERNET_TIERS = ("public", "loadbalancers")
+NODE_PORTS = (30000, 32767)
+
+# The load balancers of the Kubernetes services, a flexible load balancer proxies
+# the connections while a network load balancer keeps the client source IP
+LOAD_BALANCER_PROFILES = ("flexible", "network")
+
+
+class Flow(NamedTuple):
+    source: str
+    destination: str
+    protocol: str
+    # Destination ports or (min, max) ranges, None for all the ports
+    ports: Optional[Sequence] = None
+    description: str = ""
+    icmp: Optional[Tuple[int, Optional[int]]] = None
+
+
+class Rule(NamedTuple):
+    peer: str
+    peer_type: str
+    protocol: str
+    port_min: Optional[int] = None
+    port_max: Optional[int] = None
+    icmp_type: Optional[int] = None
+    icmp_code: Optional[int] = None
+    description: str = ""
+
+    @property
+    def key(self):
+        return self._replace(description="")
+
+
+def oke_flows(vcn_native=True, load_balancer="flexible", listener_ports=(80, 443)):
+    # Flows between the tiers of the OKE network, a flow opens the egress of
+    # the source and the ingress of the destination
+    listener_ports = list(listener_ports)
+    flows = [
+        Flow(
+            INTERNET,
+            "public",
+            TCP,
+            [6443],
+            "External access to Kubernetes API endpoint.",
+        ),
+        Flow(
+            "workers",
+            "public",
+            TCP,
+            [6443, 12250],
+            "Kubernetes worker to Kubernetes API endpoint communication.",
+        ),
+        Flow("workers", "public", ICMP, None, "Path discovery", PATH_DISCOVERY),
+        Flow(
+            "public",
+            SERVICES,
+            TCP,
+            None,
+            "Allow Kubernetes API endpoint to communicate with OKE.",
+        ),
+        Flow("public", SERVICES, ICMP, None, "Path discovery", PATH_DISCOVERY),
+        Flow(
+            "public",
+            "workers",
+            TCP,
+            [10250],
+            "Allow Kubernetes API endpoint to communicate with worker nodes.",
+        ),
+        Flow("public", "workers", ICMP, None, "Path discovery", PATH_DISCOVERY),
+        Flow(INTERNET, "workers", ICMP, None, "Path discovery", PATH_DISCOVERY),
+        Flow("workers", INTERNET, ICMP, None, "Path discovery", PATH_DISCOVERY),
+        Flow(
+            "workers",
+            SERVICES,
+            TCP,
+            None,
+            "Allow worker nodes to communicate with OKE.",
+        ),
+        Flow(
+            "workers",
+            INTERNET,
+            TCP,
+            [443],
+            "Access to external (ex Docker) container registry.",
+        ),
+        Flow(
+            "loadbalancers",
+            "workers",
+            TCP,
+            [NODE_PORTS],
+            "Load balancer to worker nodes node ports.",
+        ),
+        Flow(
+            "loadbalancers",
+            "workers",
+            TCP,
+            [10256],
+            "Allow load balancer to communicate with kube-proxy on worker nodes.",
+        ),
+        Flow(
+            INTERNET,
+            "loadbalancers",
+            TCP,
+            listener_ports,
+            "Load balancer listener protocol and port. Customize as required.",
+        ),
+    ]
+    if load_balancer == "network":
+        flows += [
+            Flow(
+                INTERNET,
+                "workers",
+                TCP,
+                [NODE_PORTS],
+                "Clients to worker nodes node ports, the network load balancer preserves their source IP.",
+            ),
+        ]
+    if vcn_native:
+        flows += [
+            Flow(
+                "pods",
+                "public",
+                TCP,
+                [6443, 12250],
+                "Pod to Kubernetes API endpoint communication (when using VCN-native pod networking).",
+            ),
+            Flow(
+                "public",
+                "pods",
+                ALL,
+                None,
+                "Allow Kubernetes API endpoint to communicate with pods (when using VCN-native pod networking).",
+            ),
+            Flow("workers", "pods", TCP, None, "Allow worker nodes to access pods."),
+            Flow(
+                "pods", "pods", ALL, None, "Allow pods to communicate with other pods."
+            ),
+            Flow(
+                "pods",
+                SERVICES,
+                TCP,
+                None,
+                "Allow pods to communicate with OCI services.",
+            ),
+            Flow("pods", SERVICES, ICMP, None, "Path discovery", PATH_DISCOVERY),
+            Flow(
+                "pods",
+                INTERNET,
+                TCP,
+                [443],
+                "(optional) Allow pods to communicate with internet.",
+            ),
+            Flow(
+                "pods",
+                "loadbalancers",
+                TCP,
+                listener_ports,
+                "Load balancer listener protocol and port. Customize as required.",
+            ),
+        ]
+    else:
+        flows += [
+            Flow(
+                "workers",
+                "workers",
+                ALL,
+                None,
+                "Allow pods on one worker node to communicate with pods on other worker nodes.",
+            ),
+            Flow(
+                "public",
+                "workers",
+                TCP,
+                None,
+                "Allow Kubernetes API endpoint to communicate with worker nodes.",
+            ),
+        ]
+    return flows
+
+
+def ipv6_flows(flows: List[Flow]) -> List[Flow]:
+    # The IPv6 counterpart of the flows: ICMP becomes ICMPv6, the services are
+    # not reachable and the internet only from the tiers with an IPv6 route
+    result = []
+    for flow in flows:
+        if SERVICES in (flow.source, flow.destination):
+            continue
+        if INTERNET in (flow.source, flow.destination) and not {
+            flow.source,
+            flow.destination,
+        } & set(IPV6_INTERNET_TIERS):
+            continue
+        if flow.protocol == ICMP:
+            flow = flow._replace(
+                protocol=ICMPV6,
+                icmp=PATH_DISCOVERY_V6 if flow.icmp == PATH_DISCOVERY else flow.icmp,
+            )
+        result.append(flow)
+    return result
+
+
+def port_ranges(ports):
+    if ports is None:
+        return [None]
+    return [(p, p) if isinstance(p, int) else tuple(p) for p in ports]
+
+
+def merge_ranges(ranges):
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def contains(outer: Rule, inner: Rule):
+    if outer.peer_type != inner.peer_type:
+        return False
+    if outer.peer_type == "CIDR_BLOCK":
+        a, b = ipaddress.ip_network(outer.peer), ipaddress.ip_network(inner.peer)
+        if a.version != b.version or not b.subnet_of(a):
+            return False
+    elif outer.peer != inner.peer:
+        return False
+    if outer.protocol == ALL:
+        return True
+    if outer.protocol != inner.protocol:
+        return False
+    if outer.protocol in (ICMP, ICMPV6):
+        return outer.icmp_type is None or (
+            outer.icmp_type == inner.icmp_type
+            and outer.icmp_code in (None, inner.icmp_code)
+        )
+    if outer.port_min is None:
+        return True
+    return (
+        inner.port_min is not None
+        and outer.port_min <= inner.port_min
+        and inner.port_max <= outer.port_max
+    )
+
+
+def describe(rules):
+    # The descriptions of the merged rules, at most 255 characters
+    return " ".join(dict.fromkeys(r.description for r in rules if r.description))[:255]
+
+
+def compact(rules: List[Rule]) -> List[Rule]:
+    # Merge the adjacent port ranges of the same peer and protocol
+    groups: Dict[tuple, List[Rule]] = {}
+    for rule in rules:
+        groups.setdefault(
+            (rule.peer, rule.peer_type, rule.protocol, rule.icmp_type, rule.icmp_code),
+            [],
+        ).append(rule)
+    merged = []
+    for (peer, peer_type, protocol, icmp_type, icmp_code), group in groups.items():
+        base = Rule(peer, peer_type, protocol, icmp_type=icmp_type, icmp_code=icmp_code)
+        if protocol not in (TCP, UDP) or any(r.port_min is None for r in group):
+            merged.append(base._replace(description=describe(group)))
+            continue
+        for low, high in merge_ranges([(r.port_min, r.port_max) for r in group]):
+            merged.append(
+                base._replace(
+                    port_min=low,
+                    port_max=high,
+                    description=describe(
+                        [r for r in group if low <= r.port_min <= high]
+                    ),
+                )
+            )
+
+    # Drop the rules already allowed by a wider one
+    compacted = [
+        rule
+        for rule in merged
+        if not any(
+            other is not rule and other.key != rule.key and contains(other, rule)
+            for other in merged
+        )
+    ]
+    return sorted(
+        compacted,
+        key=lambda r: (
+            r.peer_type,
+            r.peer,
+            r.protocol,
+            r.port_min or 0,
+            r.icmp_type or 0,
+        ),
+    )
+
+
+def compile_rules(
+    flows: List[Flow], cidrs: Dict[str, str], services_cidr, internet_cidr="0.0.0.0/0"
+):
+    # Returns the compacted ingress and egress rules of every tier in cidrs,
+    # flows involving tiers that are not in cidrs are ignored
+    def peer(name):
+        if name == INTERNET:
+            return internet_cidr, "CIDR_BLOCK"
+        if name == SERVICES:
+            return services_cidr, "SERVICE_CIDR_BLOCK"
+        return cidrs[name], "CIDR_BLOCK"
+
+    known = set(cidrs) | {INTERNET, SERVICES}
+    rules = {tier: {"ingress": [], "egress": []} for tier in cidrs}
+    for flow in flows:
+        if flow.source not in known or flow.destination not in known:
+            continue
+        icmp_type, icmp_code = flow.icmp or (None, None)
+        for ports in port_ranges(flow.ports):
+            low, high = ports or (None, None)
+            if flow.destination in cidrs:
+                cidr, cidr_type = peer(flow.source)
+                rules[flow.destination]["ingress"].append(
+                    Rule(
+                        cidr,
+                        cidr_type,
+                        flow.protocol,
+                        low,
+                        high,
+                        icmp_type,
+                        icmp_code,
+                        flow.description,
+                    )
+                )
+            if flow.source in cidrs:
+                cidr, cidr_type = peer(flow.destination)
+                rules[flow.source]["egress"].append(
+                    Rule(
+                        cidr,
+                        cidr_type,
+                        flow.protocol,
+                        low,
+                        high,
+                        icmp_type,
+                        icmp_code,
+                        flow.description,
+                    )
+                )
+    return {
+        tier: {direction: compact(items) for direction, items in directions.items()}
+        for tier, directions in rules.items()
+    }
+
+
+###################################################################################################################################
+# Security lists and network security groups rules
+###################################################################################################################################
+
+
+def security_list_ingress_rules(rules: List[Rule]):
+    return [
+        oci.core.SecurityListIngressSecurityRuleArgs(
+            description=rule.description,
+            protocol=rule.protocol,
+            source=rule.peer,
+            source_type=rule.peer_type,
+            tcp_options=(
+                oci.core.SecurityListIngressSecurityRuleTcpOptionsArgs(
+                    min=rule.port_min, max=rule.port_max
+                )
+                if rule.protocol == TCP and rule.port_min is not None
+                else None
+            ),
+            udp_options=(
+                oci.core.SecurityListIngressSecurityRuleUdpOptionsArgs(
+                    min=rule.port_min, max=rule.port_max
+                )
+                if rule.protocol == UDP and rule.port_min is not None
+                else None
+            ),
+            icmp_options=(
+                oci.core.SecurityListIngressSecurityRuleIcmpOptionsArgs(
+                    type=rule.icmp_type, code=rule.icmp_code
+                )
+                if rule.icmp_type is not None
+                else None
+            ),
+        )
+        for rule in rules
+    ]
+
+
+def security_list_egress_rules(rules: List[Rule]):
+    return [
+        oci.core.SecurityListEgressSecurityRuleArgs(
+            description=rule.description,
+            protocol=rule.protocol,
+            destination=rule.peer,
+            destination_type=rule.peer_type,
+            tcp_options=(
+                oci.core.SecurityListEgressSecurityRuleTcpOptionsArgs(
+                    min=rule.port_min, max=rule.port_max
+                )
+                if rule.protocol == TCP and rule.port_min is not None
+                else None
+            ),
+            udp_options=(
+                oci.core.SecurityListEgressSecurityRuleUdpOptionsArgs(
+                    min=rule.port_min, max=rule.port_max
+                )
+                if rule.protocol == UDP and rule.port_min is not None
+                else None
+            ),
+            icmp_options=(
+                oci.core.SecurityListEgressSecurityRuleIcmpOptionsArgs(
+                    type=rule.icmp_type, code=rule.icmp_code
+                )
+                if rule.icmp_type is not None
+                else None
+            ),
+        )
+        for rule in rules
+    ]
+
+
+def nsg_rule_name(nsg_name, direction, rule: Rule):
+    # Named after the rule content so adding a rule does not rename the others
+    digest = hashlib.sha256(repr(tuple(rule.key)).encode()).hexdigest()[:8]
+    return f"{nsg_name}-{direction}-{digest}"
+
+
+def nsg_rule_args(direction, rule: Rule):
+    port_range = (
+        oci.core.NetworkSecurityGroupSecurityRuleTcpOptionsDestinationPortRangeArgs(
+            min=rule.port_min, max=rule.port_max
+        )
+        if rule.port_min is not None
+        else None
+    )
+    args = dict(
+        direction=direction.upper(),
+        description=rule.description,
+        protocol=rule.protocol,
+        tcp_options=(
+            oci.core.NetworkSecurityGroupSecurityRuleTcpOptionsArgs(
+                destination_port_range=port_range
+            )
+            if rule.protocol == TCP and port_range
+            else None
+        ),
+        udp_options=(
+            oci.core.NetworkSecurityGroupSecurityRuleUdpOptionsArgs(
+                destination_port_range=oci.core.NetworkSecurityGroupSecurityRuleUdpOptionsDestinationPortRangeArgs(
+                    min=rule.port_min, max=rule.port_max
+                )
+            )
+            if rule.protocol == UDP and port_range
+            else None
+        ),
+        icmp_options=(
+            oci.core.NetworkSecurityGroupSecurityRuleIcmpOptionsArgs(
+                type=rule.icmp_type, code=rule.icmp_code
+            )
+            if rule.icmp_type is not None
+            else None
+        ),
+    )
+    if direction == "ingress":
+        args.update(source=rule.peer, source_type=rule.peer_type)
+    else:
+        args.update(destination=rule.peer, destination_type=rule.peer_type)
+    return args
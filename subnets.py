@@ -0,0 +1,216 @@
+import ipaddress
+import itertools
+import math
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+###################################################################################################################################
+# Subnet planning
+###################################################################################################################################
+
+# OCI reserves the first two and the last address of every subnet
+RESERVED_ADDRESSES = 3
+# Smallest subnet handed out by the planner (/28 for IPv4)
+MIN_SUBNET_SIZE = 16
+# The VCN is cut in equal slots, a /16 in /19s like the original equal split, and
+# every tier keeps the same slots whatever the demand since OCI cannot move the CIDR
+# of a subnet, the slots out of the layout are left free
+SUBNET_SLOTS = 8
+# tier: (first slot, slot count), the count a power of two and the first slot aligned to it
+DEFAULT_SUBNET_LAYOUT = {
+    "loadbalancers": (0, 1),
+    "public": (1, 1),
+    "pods": (2, 1),
+    "workers": (3, 1),
+}
+# OCI IPv6 subnets are always /64 blocks of the /56 of their VCN
+IPV6_SUBNET_PREFIX = 64
+# A load balancer takes a private IP for the primary and one for the standby
+IPS_PER_LOAD_BALANCER = 2
+# With flannel every node gets a /25 of the pods CIDR and runs at most 110 pods
+OVERLAY_NODE_BLOCK = 128
+OVERLAY_MAX_PODS_PER_NODE = 110
+
+
+class CapacityError(ValueError):
+    pass
+
+
+class SubnetRequest(NamedTuple):
+    name: str
+    addresses: int
+
+
+class PlannedSubnet(NamedTuple):
+    name: str
+    cidr: str
+    addresses: int
+    capacity: int
+
+    @property
+    def usage(self):
+        return self.addresses / self.capacity
+
+
+def subnet_at(cidr, new_prefix, index):
+    # The index-th block of size /new_prefix in cidr, computed without
+    # enumerating the blocks before it
+    supernet = ipaddress.ip_network(cidr)
+    if new_prefix < supernet.prefixlen or new_prefix > supernet.max_prefixlen:
+        raise CapacityError(f"{cidr} has no /{new_prefix} blocks")
+    count = 2 ** (new_prefix - supernet.prefixlen)
+    if not 0 <= index < count:
+        raise CapacityError(f"{cidr} has {count} /{new_prefix} blocks, not {index + 1}")
+    size = 2 ** (supernet.max_prefixlen - new_prefix)
+    return str(
+        ipaddress.ip_network((int(supernet.network_address) + index * size, new_prefix))
+    )
+
+
+def iter_subnets(cidr, new_prefix):
+    supernet = ipaddress.ip_network(cidr)
+    address = type(supernet.network_address)
+    first = int(supernet.network_address)
+    size = 2 ** (supernet.max_prefixlen - new_prefix)
+    for index in range(2 ** (new_prefix - supernet.prefixlen)):
+        yield f"{address(first + index * size)}/{new_prefix}"
+
+
+def calculate_subnets(cidr, num_subnets):
+    # The smallest prefix splitting cidr in num_subnets blocks, only the
+    # blocks handed out are built
+    supernet = ipaddress.ip_network(cidr)
+    new_prefix_length = supernet.prefixlen + math.ceil(math.log2(max(num_subnets, 1)))
+    if new_prefix_length > supernet.max_prefixlen:
+        raise CapacityError(f"{cidr} cannot be split in {num_subnets} subnets")
+    return list(
+        itertools.islice(iter_subnets(supernet, new_prefix_length), num_subnets)
+    )
+
+
+def rebase_cidr(cidr, old_supernet, new_supernet):
+    # Moves cidr from old_supernet to the same offset in new_supernet
+    network = ipaddress.ip_network(cidr)
+    old = ipaddress.ip_network(old_supernet)
+    new = ipaddress.ip_network(new_supernet)
+    offset = int(network.network_address) - int(old.network_address)
+    return str(
+        ipaddress.ip_network((int(new.network_address) + offset, network.prefixlen))
+    )
+
+
+def ipv6_subnets(vcn_ipv6_cidr, tiers) -> Dict[str, str]:
+    # A /64 of the VCN IPv6 block for every tier, at the position of the tier so
+    # a tier keeps its block when the others come and go
+    return {
+        tier: subnet_at(vcn_ipv6_cidr, IPV6_SUBNET_PREFIX, index)
+        for index, tier in enumerate(tiers)
+    }
+
+
+def subnet_requests(nodes, pods, load_balancers, headroom):
+    # Addresses needed by every subnet, multiplied by the growth headroom, the
+    # pods subnet is only needed when the pods take their IPs from the VCN
+    requests = [
+        SubnetRequest(
+            "loadbalancers",
+            math.ceil(load_balancers * IPS_PER_LOAD_BALANCER * headroom),
+        ),
+        SubnetRequest("public", math.ceil(headroom)),
+        SubnetRequest("pods", math.ceil(pods * headroom)),
+        SubnetRequest("workers", math.ceil(nodes * headroom)),
+    ]
+    return [r for r in requests if r.name != "pods" or pods > 0]
+
+
+def subnet_layout(overrides: Optional[dict]) -> Dict[str, Tuple[int, int]]:
+    # The default layout with the tiers moved by the subnet_layout config
+    layout = dict(DEFAULT_SUBNET_LAYOUT)
+    for tier, value in (overrides or {}).items():
+        if tier not in layout:
+            raise ValueError(
+                f"Unknown subnet_layout tier {tier}, the tiers are {', '.join(layout)}"
+            )
+        first, count = (int(n) for n in value)
+        if count not in (1, 2, 4, 8) or first % count or first + count > SUBNET_SLOTS:
+            raise ValueError(
+                f"The subnet_layout of {tier} must be [first slot, slot count] with a count of "
+                f"1, 2, 4 or 8 slots, a first slot multiple of the count and at most "
+                f"{SUBNET_SLOTS} slots, got {value}"
+            )
+        layout[tier] = (first, count)
+    slots = [
+        (slot, tier)
+        for tier, (first, count) in layout.items()
+        for slot in range(first, first + count)
+    ]
+    taken = {}
+    for slot, tier in slots:
+        if slot in taken:
+            raise ValueError(
+                f"The subnet_layout tiers {taken[slot]} and {tier} share the slot {slot}"
+            )
+        taken[slot] = tier
+    return layout
+
+
+def plan_subnets(
+    cidr, requests: List[SubnetRequest], layout=DEFAULT_SUBNET_LAYOUT
+) -> Dict[str, PlannedSubnet]:
+    # Every tier takes its slots of the layout, the demand only checks it fits so a
+    # change of the node, pod or load balancer counts never moves a subnet
+    supernet = ipaddress.ip_network(cidr)
+    slot_prefix = supernet.prefixlen + int(math.log2(SUBNET_SLOTS))
+    if 2 ** (supernet.max_prefixlen - slot_prefix) < MIN_SUBNET_SIZE:
+        raise CapacityError(f"The VCN {cidr} is too small for {SUBNET_SLOTS} subnets")
+    plan = {}
+    for r in requests:
+        first, count = layout[r.name]
+        prefix = slot_prefix - int(math.log2(count))
+        plan[r.name] = PlannedSubnet(
+            r.name,
+            subnet_at(cidr, prefix, first // count),
+            r.addresses,
+            2 ** (supernet.max_prefixlen - prefix) - RESERVED_ADDRESSES,
+        )
+    if any(s.addresses > s.capacity for s in plan.values()):
+        raise CapacityError(
+            f"The VCN {cidr} is too small for the subnet plan, grow vcn_cidr_block "
+            "for a new stack or give the full tiers more slots with subnet_layout\n"
+            + format_plan(cidr, list(plan.values()))
+        )
+    return plan
+
+
+def check_disjoint(cidr, **ranges):
+    vcn = ipaddress.ip_network(cidr)
+    for name, value in ranges.items():
+        if ipaddress.ip_network(value).overlaps(vcn):
+            raise CapacityError(f"The {name} {value} overlaps the VCN {cidr}")
+
+
+def check_overlay_capacity(pods_cidr, nodes, max_pods_per_node):
+    if max_pods_per_node > OVERLAY_MAX_PODS_PER_NODE:
+        raise CapacityError(
+            f"Flannel runs at most {OVERLAY_MAX_PODS_PER_NODE} pods per node, "
+            f"{max_pods_per_node} requested"
+        )
+    capacity = ipaddress.ip_network(pods_cidr).num_addresses // OVERLAY_NODE_BLOCK
+    if nodes > capacity:
+        raise CapacityError(
+            f"The pods CIDR {pods_cidr} fits {capacity} flannel nodes, {nodes} planned"
+        )
+
+
+def format_plan(cidr, subnets):
+    lines = [f"{'subnet':<16}{'cidr':<20}{'requested':>10}{'capacity':>10}{'usage':>8}"]
+    for s in subnets:
+        lines.append(
+            f"{s.name:<16}{s.cidr:<20}{s.addresses:>10}{s.capacity:>10}{s.usage:>8.0%}"
+        )
+    allocated = sum(s.capacity + RESERVED_ADDRESSES for s in subnets)
+    available = ipaddress.ip_network(cidr).num_addresses
+    lines.append(
+        f"{allocated} addresses allocated, {cidr} has {available}, "
+        f"{available - allocated} left free"
+    )
+    return "\n".join(lines)
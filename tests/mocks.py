@@ -0,0 +1,413 @@
+import pulumi
+import collections
+import json
+import os
+import runpy
+import yaml
+
+###################################################################################################################################
+# Mocked OCI providers and config permutations of the program, shared by the tests and benchmark.py
+###################################################################################################################################
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPARTMENT_ID = "ocid1.compartment.oc1..benchmark"
+TENANCY_ID = "ocid1.tenancy.oc1..benchmark"
+REGION = "eu-frankfurt-1"
+
+# Config overrides evaluated on top of the Pulumi.yaml defaults
+PERMUTATIONS = {
+    "default": {},
+    "x86": {"node_shape": "VM.Standard.E5.Flex"},
+    "gpu": {
+        "node_shape": "VM.GPU.A10.1",
+        "oke_ocpus": "15",
+        "oke_memory_in_gbs": "240",
+    },
+    "fixed_image": {"node_image_id": "ocid1.image.oc1..fixed"},
+    "lookup_cache": {"lookup_cache_ttl": "3600"},
+    "large_cluster": {
+        "oke_min_nodes": "100",
+        "max_pods_per_node": "110",
+        "subnet_layout": {"pods": [4, 4]},
+    },
+    "token_cache": {"kubeconfig_token_cache": "true"},
+    "flannel": {"cni_type": "FLANNEL_OVERLAY", "max_pods_per_node": "110"},
+    "autoscaler": {
+        "cluster_type": "ENHANCED_CLUSTER",
+        "cluster_autoscaler": "true",
+        "oke_max_nodes": "10",
+    },
+    "virtual_nodes": {
+        "cluster_type": "ENHANCED_CLUSTER",
+        "virtual_node_pools": [{"name": "burst", "size": 3}],
+    },
+    "addons": {
+        "cluster_type": "ENHANCED_CLUSTER",
+        "kube_proxy_mode": "ipvs",
+        "coredns_min_replicas": "3",
+        "coredns_nodes_per_replica": "8",
+        "nodelocal_dns": "true",
+    },
+    "nsg": {"security_mode": "network_security_groups"},
+    "ipv6": {"ipv6": "true"},
+    "ipv6_nsg": {"ipv6": "true", "security_mode": "network_security_groups"},
+    "nlb": {
+        "load_balancer_profile": "network",
+        "load_balancer_ports": "443,8443",
+        "security_mode": "network_security_groups",
+    },
+    "node_cycling": {
+        "node_cycling": "true",
+        "node_cycling_max_surge": "50%",
+        "node_eviction_grace_duration": "PT15M",
+    },
+    "tuning": {
+        "tuning_profile": "high-throughput-network",
+        "node_pools": [
+            {"name": "NodePool"},
+            {
+                "name": "latency",
+                "tuning_profile": "latency-sensitive",
+                "hugepages": 512,
+            },
+        ],
+    },
+    "capacity": {
+        "capacity_preflight": "true",
+        "capacity_report_file": "capacity.json",
+        "node_pools": [
+            {
+                "name": "arm",
+                "shape": "VM.Standard.A1.Flex",
+                "size": 3,
+                "per_ad": True,
+                "fallback_shapes": ["VM.Standard.E5.Flex"],
+            },
+            {
+                "name": "general",
+                "shape": "VM.Standard.E5.Flex",
+                "fault_domains": ["FAULT-DOMAIN-1", "FAULT-DOMAIN-2"],
+                "capacity_reservations": {"ad3": "ocid1.capacityreservation.oc1..ad3"},
+            },
+        ],
+    },
+    "registry": {
+        "service_gateway_all_services": "true",
+        "prepull_images": [
+            "fra.ocir.io/tenancy/app:1.0",
+            "registry.k8s.io/pause:3.9",
+        ],
+    },
+    "storage": {
+        "boot_volume_size_in_gbs": "100",
+        "boot_volume_vpus_per_gb": "20",
+        "containerd_volume_size_in_gbs": "200",
+        "containerd_volume_vpus_per_gb": "30",
+    },
+    "observability": {
+        "observability": "true",
+        "log_retention_days": "90",
+        "alarm_email": "oncall@example.com",
+    },
+    "network_stack": {"stack_mode": "network"},
+    "cluster_stack": {
+        "stack_mode": "cluster",
+        "network_stack": "organization/oke/network",
+    },
+    "clusters": {
+        "clusters": [
+            {"name": "blue"},
+            {
+                "name": "green",
+                "cni_type": "FLANNEL_OVERLAY",
+                "node_pools": [{"name": "NodePool", "max_pods_per_node": 110}],
+            },
+        ]
+    },
+    "node_pools": {
+        "node_pools": [
+            {
+                "name": "general",
+                "shape": "VM.Standard.E5.Flex",
+                "size": 2,
+                "per_ad": True,
+            },
+            {
+                "name": "arm",
+                "shape": "VM.Standard.A1.Flex",
+                "ocpus": 4,
+                "memory_in_gbs": 24,
+            },
+            {"name": "gpu", "shape": "VM.GPU.A10.1", "size": 1},
+        ]
+    },
+}
+
+# The capacity report file of the capacity permutation, A1 is exhausted in AD-1 and
+# in AD-2 where E5 is left in a single fault domain
+CAPACITY_REPORT = {
+    "AD-1": {
+        "VM.Standard.A1.Flex": "OUT_OF_HOST_CAPACITY",
+        "VM.Standard.E5.Flex": {
+            "FAULT-DOMAIN-1": "OUT_OF_HOST_CAPACITY",
+            "FAULT-DOMAIN-2": "OUT_OF_HOST_CAPACITY",
+        },
+    },
+    "AD-2": {
+        "VM.Standard.A1.Flex": "OUT_OF_HOST_CAPACITY",
+        "VM.Standard.E5.Flex": {
+            "FAULT-DOMAIN-1": "OUT_OF_HOST_CAPACITY",
+            "FAULT-DOMAIN-2": "AVAILABLE",
+        },
+    },
+}
+
+
+# The IPv6 /56 Oracle allocates to the VCN of the ipv6 permutations
+VCN_IPV6_CIDR = "2603:c020:4000:5a00::/56"
+
+# Outputs of the network stack read by the cluster stacks
+NETWORK_STACK_OUTPUTS = {
+    "vcn_id": "ocid1.vcn.oc1..network",
+    "public_subnet_id": "ocid1.publicsubnet.oc1..network",
+    "workers_subnet_id": "ocid1.workerssubnet.oc1..network",
+    "loadbalancers_subnet_id": "ocid1.loadbalancerssubnet.oc1..network",
+    "pods_subnet_id": "ocid1.podssubnet.oc1..network",
+}
+
+KUBECONFIG = """apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: Y2VydGlmaWNhdGU=
+    server: https://10.0.64.2:6443
+  name: cluster-benchmark
+contexts:
+- context:
+    cluster: cluster-benchmark
+    user: user-benchmark
+  name: context-benchmark
+current-context: context-benchmark
+kind: ""
+users:
+- name: user-benchmark
+  user:
+    exec:
+      apiVersion: client.authentication.k8s.io/v1beta1
+      args:
+      - ce
+      - cluster
+      - generate-token
+      - --cluster-id
+      - {cluster_id}
+      - --region
+      - {region}
+      command: oci
+      env: []
+      interactiveMode: Never
+      provideClusterInfo: false
+"""
+
+
+def node_pool_sources(kubernetes_version):
+    version = kubernetes_version.lstrip("v")
+    sources = []
+    for build_date, build in (("2024.04.19", 700), ("2024.06.30", 716)):
+        for flavor in ("", "aarch64-", "Gen2-GPU-"):
+            name = f"Oracle-Linux-8.10-{flavor}{build_date}-0-OKE-{version}-{build}"
+            sources.append(
+                {
+                    "imageId": f"ocid1.image.oc1..{flavor.lower()}{build}",
+                    "sourceName": name,
+                    "sourceType": "IMAGE",
+                }
+            )
+    # Platform images without OKE components are part of the options too
+    sources.append(
+        {
+            "imageId": "ocid1.image.oc1..platform",
+            "sourceName": "Oracle-Linux-8.10-2024.06.30-0",
+            "sourceType": "IMAGE",
+        }
+    )
+    return sources
+
+
+class OciMocks(pulumi.runtime.Mocks):
+    def __init__(self, config, node_pools=None):
+        self.config = config
+        # The freeform tags of the node pools already deployed in the compartment by
+        # cluster name and node pool name
+        self.node_pools = node_pools or {}
+        self.invokes = collections.Counter()
+        self.resources = collections.Counter()
+        # The inputs of every resource by name
+        self.inputs = {}
+
+    def new_resource(self, args):
+        self.resources[args.typ] += 1
+        self.inputs[args.name] = args.inputs
+        if args.typ == "pulumi:pulumi:StackReference":
+            return args.name, {"name": args.name, "outputs": NETWORK_STACK_OUTPUTS}
+        if args.typ == "oci:Core/vcn:Vcn" and args.inputs.get("isIpv6enabled"):
+            return f"ocid1.{args.name.lower()}.oc1..benchmark", dict(
+                args.inputs, ipv6cidrBlocks=[VCN_IPV6_CIDR]
+            )
+        return f"ocid1.{args.name.lower()}.oc1..benchmark", dict(args.inputs)
+
+    def call(self, args):
+        self.invokes[args.token] += 1
+        if args.token == "oci:Core/getServices:getServices":
+            return {
+                "id": "services",
+                "services": [
+                    {
+                        "id": "ocid1.service.oc1..objectstorage",
+                        "name": "OCI FRA Object Storage",
+                        "cidrBlock": "oci-fra-objectstorage",
+                        "description": "OCI FRA Object Storage",
+                    },
+                    {
+                        "id": "ocid1.service.oc1..all",
+                        "name": "All FRA Services In Oracle Services Network",
+                        "cidrBlock": "all-fra-services-in-oracle-services-network",
+                        "description": "All FRA Services In Oracle Services Network",
+                    },
+                ],
+            }, []
+        if args.token == "oci:Identity/getAvailabilityDomains:getAvailabilityDomains":
+            return {
+                "id": "availability_domains",
+                "compartmentId": args.args["compartmentId"],
+                "availabilityDomains": [
+                    {
+                        "id": f"ad{n}",
+                        "name": f"Uocm:EU-FRANKFURT-1-AD-{n}",
+                        "compartmentId": args.args["compartmentId"],
+                    }
+                    for n in (1, 2, 3)
+                ],
+            }, []
+        if args.token == "oci:Identity/getCompartment:getCompartment":
+            return {
+                "id": args.args["id"],
+                "compartmentId": TENANCY_ID,
+                "name": "benchmark",
+                "state": "ACTIVE",
+            }, []
+        if args.token == "oci:ContainerEngine/getNodePoolOption:getNodePoolOption":
+            return {
+                "id": "node_pool_option",
+                "nodePoolOptionId": args.args["nodePoolOptionId"],
+                "kubernetesVersions": [self.config["kubernetes_version"]],
+                "shapes": [],
+                "sources": node_pool_sources(self.config["kubernetes_version"]),
+            }, []
+        if (
+            args.token
+            == "oci:ContainerEngine/getClusterKubeConfig:getClusterKubeConfig"
+        ):
+            return {
+                "id": "kube_config",
+                "clusterId": args.args["clusterId"],
+                "content": KUBECONFIG.format(
+                    cluster_id=args.args["clusterId"], region=REGION
+                ),
+            }, []
+        if args.token == "oci:ContainerEngine/getClusters:getClusters":
+            return {
+                "id": "clusters",
+                "compartmentId": args.args["compartmentId"],
+                "clusters": [
+                    {
+                        "id": f"ocid1.cluster.oc1..{name.lower()}",
+                        "name": name,
+                        "state": "ACTIVE",
+                    }
+                    for name in self.node_pools
+                    if name == args.args["name"]
+                ],
+            }, []
+        if args.token == "oci:ContainerEngine/getNodePools:getNodePools":
+            return {
+                "id": "node_pools",
+                "compartmentId": args.args["compartmentId"],
+                "nodePools": [
+                    {
+                        "id": f"ocid1.nodepool.oc1..{name.lower()}",
+                        "clusterId": args.args["clusterId"],
+                        "name": name,
+                        "state": "ACTIVE",
+                        "freeformTags": tags,
+                    }
+                    for cluster, pools in self.node_pools.items()
+                    if f"ocid1.cluster.oc1..{cluster.lower()}" == args.args["clusterId"]
+                    for name, tags in pools.items()
+                ],
+            }, []
+        if args.token == "oci:ContainerEngine/getWorkRequests:getWorkRequests":
+            return {
+                "id": "work_requests",
+                "compartmentId": args.args["compartmentId"],
+                "workRequests": [
+                    {
+                        "id": "ocid1.workrequest.oc1..cycling",
+                        "compartmentId": args.args["compartmentId"],
+                        "operationType": "NODEPOOL_CYCLING",
+                        "status": "SUCCEEDED",
+                        "resources": [],
+                        "timeAccepted": "2024-07-01T10:00:00.000Z",
+                        "timeStarted": "2024-07-01T10:00:05.000Z",
+                        "timeFinished": "2024-07-01T10:12:35.000Z",
+                    }
+                ],
+            }, []
+        raise NotImplementedError(f"No mock for {args.token}")
+
+
+def default_config():
+    with open(os.path.join(PROJECT_DIR, "Pulumi.yaml")) as f:
+        project = yaml.safe_load(f)
+    config = {
+        key: value["default"]
+        for key, value in project["config"].items()
+        if ":" not in key and "default" in value
+    }
+    config["compartment_ocid"] = COMPARTMENT_ID
+    return project["name"], config
+
+
+def evaluate(project, config, workdir, node_pools=None):
+    # Runs __main__.py with the config on the mocked providers, returns the
+    # mocks with their counters and the stack outputs
+    mocks = OciMocks(config, node_pools)
+    pulumi.runtime.reset_options(project=project, stack="benchmark", preview=True)
+    pulumi.runtime.set_mocks(mocks, project=project, stack="benchmark", preview=True)
+    pulumi.runtime.set_all_config(
+        {
+            "oci:region": REGION,
+            "oci:tenancyOcid": TENANCY_ID,
+            **{
+                f"{project}:{key}": (
+                    value if isinstance(value, str) else json.dumps(value)
+                )
+                for key, value in config.items()
+            },
+        }
+    )
+    outputs = {}
+
+    @pulumi.runtime.test
+    def program():
+        runpy.run_path(os.path.join(PROJECT_DIR, "__main__.py"), run_name="__main__")
+        stack = pulumi.runtime.get_root_resource()
+        return pulumi.Output.all(**stack.outputs).apply(outputs.update)
+
+    with open(os.path.join(workdir, "capacity.json"), "w") as f:
+        json.dump(CAPACITY_REPORT, f)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        program()
+    finally:
+        os.chdir(cwd)
+    return mocks, outputs
@@ -0,0 +1,40 @@
+import pytest
+import addons
+
+
+class Kubectl(list):
+    # Answers the kube-proxy ConfigMap and records the other kubectl calls
+    configmap = {}
+
+    def __call__(self, kubeconfig, *args):
+        if args[0] == "get":
+            return {"data": dict(self.configmap)}
+        self.append(args)
+        return {}
+
+
+@pytest.fixture
+def kubectl(monkeypatch):
+    fake = Kubectl()
+    monkeypatch.setattr(addons, "kubectl", fake)
+    return fake
+
+
+def test_use_ipvs_patches_the_config(kubectl):
+    kubectl.configmap = {"config.conf": 'mode: "iptables"\n'}
+    assert addons.use_ipvs("kubeconfig", log=lambda message: None)
+    patch, restart = kubectl
+    assert '"config.conf": "mode: ipvs\\n"' in patch[-1]
+    assert restart[:3] == ("rollout", "restart", "daemonset")
+
+
+def test_use_ipvs_is_idempotent(kubectl):
+    kubectl.configmap = {"config.conf": "mode: ipvs\n"}
+    assert not addons.use_ipvs("kubeconfig")
+    assert kubectl == []
+
+
+def test_use_ipvs_without_config(kubectl):
+    kubectl.configmap = {"kubeconfig.yaml": ""}
+    with pytest.raises(RuntimeError, match="no .conf key"):
+        addons.use_ipvs("kubeconfig")
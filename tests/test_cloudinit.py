@@ -0,0 +1,37 @@
+import subprocess
+from cloudinit import storage_script
+from nodepools import NodePoolSpec
+
+SPEC = NodePoolSpec(
+    name="io",
+    shape="VM.Standard.E4.Flex",
+    ocpus=1,
+    memory_in_gbs=16,
+    size=1,
+    max_pods_per_node=31,
+    min_size=1,
+    max_size=1,
+)
+
+
+def test_default_storage_needs_no_script():
+    assert storage_script(SPEC) == []
+
+
+def test_volumes_use_the_cli_of_the_image():
+    script = "".join(
+        storage_script(
+            SPEC._replace(boot_volume_vpus_per_gb=20, containerd_volume_size_in_gbs=100)
+        )
+    )
+    assert "dnf" not in script and "pip" not in script
+    assert "the node image has no OCI CLI" in script
+    subprocess.run(["bash", "-n"], input=script, text=True, check=True)
+
+
+def test_containerd_volumes_of_terminated_nodes_are_reaped():
+    script = "".join(storage_script(SPEC._replace(containerd_volume_size_in_gbs=100)))
+    assert "oci bv volume delete" in script
+    assert "TERMINATED" in script
+    # The reaping does not hold the bootstrap of the node
+    assert ") >/var/log/oke-containerd-reap.log 2>&1 &" in script
@@ -0,0 +1,33 @@
+import pytest
+from images import ImageCatalog
+from lookups import NodePoolSource
+
+SOURCES = [
+    NodePoolSource("x86-old", "Oracle-Linux-8.10-2024.05.29-0-OKE-1.30.1-707"),
+    NodePoolSource("x86", "Oracle-Linux-8.10-2024.06.30-0-OKE-1.30.1-716"),
+    NodePoolSource("arm", "Oracle-Linux-8.10-aarch64-2024.06.30-0-OKE-1.30.1-716"),
+    NodePoolSource("gpu", "Oracle-Linux-8.10-Gen2-GPU-2024.06.30-0-OKE-1.30.1-716"),
+    NodePoolSource("x86-1.29", "Oracle-Linux-8.10-2024.06.30-0-OKE-1.29.1-716"),
+    NodePoolSource("windows", "Windows-Server-2019-Standard-Edition-VM-2024.06.30-0"),
+]
+
+
+def test_newest_build_by_platform():
+    catalog = ImageCatalog(SOURCES)
+    assert catalog.image_id("VM.Standard.E4.Flex", "v1.30.1") == "x86"
+    assert catalog.image_id("VM.Standard.A1.Flex", "v1.30.1") == "arm"
+    assert catalog.image_id("VM.GPU.A10.1", "v1.30.1") == "gpu"
+    assert catalog.image_id("VM.Standard.E4.Flex", "1.29.1") == "x86-1.29"
+
+
+def test_unparsed_sources_are_ignored():
+    catalog = ImageCatalog(SOURCES)
+    assert "windows" not in {image.image_id for image in catalog.images.values()}
+
+
+def test_missing_version_lists_the_available_ones():
+    catalog = ImageCatalog(SOURCES)
+    with pytest.raises(ValueError, match="available versions: 1.29.1, 1.30.1"):
+        catalog.find("VM.Standard.E4.Flex", "v1.31.1")
+    with pytest.raises(ValueError, match="available versions: none"):
+        ImageCatalog([]).find("VM.Standard.A1.Flex", "v1.30.1")
@@ -0,0 +1,154 @@
+import pytest
+from nodepools import (
+    CAPACITY_FIT_TAG,
+    FAULT_DOMAINS,
+    NodePoolSpec,
+    fit_capacity,
+    fit_new_capacity,
+    node_pool_specs,
+    place_node_pools,
+    planned_counts,
+    virtual_node_pool_specs,
+)
+
+ADS = ["Uocm:US-ASHBURN-AD-1", "Uocm:US-ASHBURN-AD-2", "Uocm:US-ASHBURN-AD-3"]
+DEFAULTS = NodePoolSpec(
+    name="pool1",
+    shape="VM.Standard.E4.Flex",
+    ocpus=1,
+    memory_in_gbs=16,
+    size=3,
+    max_pods_per_node=31,
+    min_size=3,
+    max_size=3,
+)
+
+
+def specs(*pools):
+    return node_pool_specs(list(pools), DEFAULTS)
+
+
+def test_legacy_keys_make_one_pool():
+    assert node_pool_specs(None, DEFAULTS) == [DEFAULTS]
+
+
+def test_node_pool_specs_validate():
+    with pytest.raises(ValueError, match="needs a name"):
+        specs({"size": 1})
+    with pytest.raises(ValueError, match="Unknown settings"):
+        specs({"name": "a", "colour": "blue"})
+    with pytest.raises(ValueError, match="unique"):
+        specs({"name": "a"}, {"name": "a"})
+    with pytest.raises(ValueError, match="min_size <= size <= max_size"):
+        specs({"name": "a", "size": 5, "max_size": 4})
+
+
+def test_virtual_node_pool_fault_domains():
+    [default, pinned] = virtual_node_pool_specs(
+        [
+            {"name": "burst", "size": 1},
+            {"name": "pinned", "size": 1, "fault_domains": ["FAULT-DOMAIN-1"]},
+        ]
+    )
+    assert default.fault_domains == list(FAULT_DOMAINS)
+    assert pinned.fault_domains == ["FAULT-DOMAIN-1"]
+    with pytest.raises(ValueError, match="must be in"):
+        virtual_node_pool_specs([{"name": "a", "size": 1, "fault_domains": ["FD-4"]}])
+    with pytest.raises(ValueError, match="at least one fault domain"):
+        virtual_node_pool_specs([{"name": "a", "size": 1, "fault_domains": []}])
+
+
+def test_planned_counts():
+    placements = place_node_pools(
+        specs(
+            {"name": "a", "max_size": 5},
+            {"name": "b", "size": 1, "max_pods_per_node": 10, "per_ad": True},
+        ),
+        ADS,
+    )
+    burst = virtual_node_pool_specs([{"name": "burst", "size": 2}])
+    assert planned_counts(placements, burst, False, 31) == (3 + 3 + 2, 93 + 30 + 62)
+    assert planned_counts(placements, [], True, 31) == (5 + 9, 155 + 90)
+
+
+def test_place_node_pools():
+    placements = place_node_pools(
+        specs({"name": "spread"}, {"name": "zonal", "per_ad": True}), ADS
+    )
+    assert [(p.name, p.availability_domains) for p in placements] == [
+        ("spread", ADS),
+        ("zonal-ad1", ADS[:1]),
+        ("zonal-ad2", ADS[1:2]),
+        ("zonal-ad3", ADS[2:]),
+    ]
+
+
+def test_fit_capacity_with_capacity_everywhere():
+    placements = place_node_pools(specs({"name": "a", "per_ad": True}), ADS)
+    assert fit_capacity(placements, lambda spec, ad, shape, fd: True) == placements
+
+
+def test_fit_capacity_drops_exhausted_ads():
+    placements = place_node_pools(specs({"name": "spread"}), ADS)
+    fitted = fit_capacity(placements, lambda spec, ad, shape, fd: ad != ADS[0])
+    assert fitted[0].availability_domains == ADS[1:]
+
+
+def test_fit_capacity_falls_back_to_the_next_shape():
+    placements = place_node_pools(
+        specs({"name": "a", "fallback_shapes": ["VM.Standard.E5.Flex"]}), ADS
+    )
+    fitted = fit_capacity(
+        placements, lambda spec, ad, shape, fd: shape == "VM.Standard.E5.Flex"
+    )
+    assert fitted[0].spec.shape == "VM.Standard.E5.Flex"
+
+
+def test_fit_capacity_without_any_capacity():
+    placements = place_node_pools(specs({"name": "a"}), ADS)
+    with pytest.raises(ValueError, match="No capacity for the node pool a"):
+        fit_capacity(placements, lambda spec, ad, shape, fd: False)
+
+
+def not_in(*exhausted):
+    # Capacity everywhere but in the exhausted availability domains or shapes
+    return lambda spec, ad, shape, fd: ad not in exhausted and shape not in exhausted
+
+
+def test_fit_new_capacity_places_the_new_pools():
+    placements = place_node_pools(specs({"name": "a", "per_ad": True}), ADS)
+    fitted = fit_new_capacity(placements, {}, not_in(ADS[0]))
+    assert [p.spec.size for p in fitted] == [0, 5, 4]
+    assert all(len(p.capacity_fit) <= 256 for p in fitted)
+    assert fit_new_capacity(placements, {}, not_in()) == placements
+
+
+def test_fit_new_capacity_leaves_the_deployed_pools():
+    # A capacity report never shrinks or reshapes a deployed pool
+    placements = place_node_pools(
+        specs({"name": "a", "fallback_shapes": ["VM.Standard.E5.Flex"]}), ADS
+    )
+    fitted = fit_new_capacity(placements, {"a": {}}, not_in("VM.Standard.E4.Flex"))
+    assert fitted == placements
+
+
+def test_fit_new_capacity_with_some_pools_deployed():
+    placements = place_node_pools(specs({"name": "a", "per_ad": True}), ADS)
+    fitted = fit_new_capacity(placements, {"a-ad1": {}}, not_in(ADS[0], ADS[1]))
+    assert [p.spec.size for p in fitted] == [3, 0, 6]
+
+
+def test_deployed_pools_keep_their_fit():
+    placements = place_node_pools(
+        specs({"name": "a", "fallback_shapes": ["VM.Standard.E5.Flex"]}), ADS
+    )
+    [created] = fit_new_capacity(placements, {}, not_in("VM.Standard.E4.Flex"))
+    assert created.spec.shape == "VM.Standard.E5.Flex"
+    tags = {CAPACITY_FIT_TAG: created.capacity_fit}
+    # The capacity is back but the next deploys keep the pool as it was created
+    assert fit_new_capacity(placements, {"a": tags}, not_in()) == [created]
+    # Until its config changes
+    resized = place_node_pools(
+        specs({"name": "a", "size": 4, "max_size": 4, "fallback_shapes": []}), ADS
+    )
+    assert fit_new_capacity(resized, {"a": tags}, not_in()) == resized
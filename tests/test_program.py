@@ -0,0 +1,171 @@
+import pytest
+from tests.mocks import PERMUTATIONS, TENANCY_ID, default_config, evaluate
+
+
+def run(tmp_path, node_pools=None, **overrides):
+    project, config = default_config()
+    if node_pools is not None:
+        overrides["node_pools"] = node_pools
+    return evaluate(project, dict(config, **overrides), str(tmp_path))
+
+
+@pytest.mark.parametrize("permutation", PERMUTATIONS)
+def test_permutation(tmp_path, permutation):
+    overrides = PERMUTATIONS[permutation]
+    mocks, outputs = run(tmp_path, **overrides)
+    assert sum(mocks.resources.values()) > 0
+    for stack in outputs["clusters"].values() if "clusters" in overrides else [outputs]:
+        assert stack["load_balancer_annotations"]
+        if overrides.get("stack_mode") != "cluster":
+            assert set(stack["subnet_plan"]) >= {"public", "workers"}
+
+
+def test_default_stack(tmp_path):
+    mocks, outputs = run(tmp_path)
+    assert set(outputs["node_pool_ids"]) == {"NodePool"}
+    assert outputs["node_pool_placements"]["NodePool"]["size"] == 2
+    assert len(outputs["node_pool_placements"]["NodePool"]["availability_domains"]) == 3
+    assert set(outputs["subnet_plan"]) == {"loadbalancers", "public", "pods", "workers"}
+    # The node image is resolved from the node pool options without the cluster
+    assert outputs["dependency_graph"]["node_images"] == []
+    assert mocks.resources["oci:ContainerEngine/nodePool:NodePool"] == 1
+
+
+def test_flannel_has_no_pods_subnet(tmp_path):
+    _, outputs = run(tmp_path, **PERMUTATIONS["flannel"])
+    assert "pods" not in outputs["subnet_plan"]
+    assert "pods_subnet_id" not in outputs
+
+
+def test_network_security_groups(tmp_path):
+    mocks, outputs = run(tmp_path, **PERMUTATIONS["nsg"])
+    assert set(outputs["network_security_group_ids"]) == {
+        "public",
+        "workers",
+        "pods",
+        "loadbalancers",
+    }
+    rules = sum(
+        count
+        for directions in outputs["security_rule_counts"].values()
+        for count in directions.values()
+    )
+    assert (
+        mocks.resources[
+            "oci:Core/networkSecurityGroupSecurityRule:NetworkSecurityGroupSecurityRule"
+        ]
+        == rules
+    )
+
+
+def test_virtual_nodes_get_their_policy(tmp_path):
+    pools = [{"name": "burst", "size": 3, "fault_domains": ["FAULT-DOMAIN-2"]}]
+    mocks, _ = run(
+        tmp_path, **dict(PERMUTATIONS["virtual_nodes"], virtual_node_pools=pools)
+    )
+    statements = mocks.inputs["VirtualNodePolicy"]["statements"]
+    assert statements == [
+        "define tenancy ContainerEngine as "
+        "ocid1.tenancy.oc1..aaaaaaaa6y3oz5kmqumnaa2vpvjwh2dnfpaqd5ddkncevgj3c7vlrdjiiq",
+        "endorse any-user to associate compute-container-instances in compartment "
+        "benchmark of tenancy ContainerEngine with subnets in compartment benchmark "
+        "where ALL {request.principal.type='virtualnode', "
+        "request.operation='CreateContainerInstance', "
+        "request.principal.subnet='ocid1.podssubnet.oc1..benchmark'}",
+    ]
+    assert mocks.inputs["VirtualNodePolicy"]["compartmentId"] == TENANCY_ID
+    placements = mocks.inputs["burst"]["placementConfigurations"]
+    assert len(placements) == 3
+    assert all(p["faultDomains"] == ["FAULT-DOMAIN-2"] for p in placements)
+
+
+def test_volume_dynamic_group_matches_the_tagged_nodes(tmp_path):
+    pools = [
+        {"name": "io", "containerd_volume_size_in_gbs": 200},
+        {"name": "web"},
+    ]
+    mocks, _ = run(tmp_path, node_pools=pools)
+    namespace = mocks.inputs["NodeVolumesTagNamespace"]["name"]
+    rule = mocks.inputs["NodeVolumesDynamicGroup"]["matchingRule"]
+    assert f"tag.{namespace}.managed.value = 'true'" in rule
+    assert mocks.inputs["io"]["nodeConfigDetails"]["definedTags"] == {
+        f"{namespace}.managed": "true"
+    }
+    assert "definedTags" not in mocks.inputs["web"]["nodeConfigDetails"]
+
+
+def test_capacity_preflight_places_the_new_pools(tmp_path):
+    mocks, outputs = run(tmp_path, **PERMUTATIONS["capacity"])
+    placements = outputs["node_pool_placements"]
+    # A1 is exhausted in AD-1 and AD-2 where E5 is left, the nodes of AD-1 move
+    assert [placements[f"arm-ad{n}"]["size"] for n in (1, 2, 3)] == [0, 5, 4]
+    assert placements["arm-ad2"]["shape"] == "VM.Standard.E5.Flex"
+    assert "oke-capacity-fit" in mocks.inputs["arm-ad1"]["freeformTags"]
+
+
+def test_capacity_preflight_leaves_the_deployed_pools(tmp_path):
+    project, config = default_config()
+    config.update(PERMUTATIONS["capacity"])
+    mocks, outputs = evaluate(
+        project, config, str(tmp_path), {"OkeCluster": {"arm-ad1": {}}}
+    )
+    placements = outputs["node_pool_placements"]
+    assert placements["arm-ad1"]["shape"] == "VM.Standard.A1.Flex"
+    assert [placements[f"arm-ad{n}"]["size"] for n in (1, 2, 3)] == [3, 3, 3]
+    assert placements["arm-ad2"]["shape"] == "VM.Standard.E5.Flex"
+    assert "freeformTags" not in mocks.inputs["arm-ad1"]
+
+
+def test_capacity_preflight_ignores_the_pools_of_other_clusters(tmp_path):
+    project, config = default_config()
+    config.update(PERMUTATIONS["capacity"])
+    # Another stack of the compartment deployed a cluster with a pool of the same name
+    mocks, outputs = evaluate(
+        project, config, str(tmp_path), {"OtherCluster": {"arm-ad1": {}}}
+    )
+    placements = outputs["node_pool_placements"]
+    assert [placements[f"arm-ad{n}"]["size"] for n in (1, 2, 3)] == [0, 5, 4]
+    assert "oke-capacity-fit" in mocks.inputs["arm-ad1"]["freeformTags"]
+    assert mocks.invokes["oci:ContainerEngine/getNodePools:getNodePools"] == 0
+
+
+def test_missing_capacity_report_file(tmp_path):
+    overrides = dict(PERMUTATIONS["capacity"], capacity_report_file="missing.json")
+    with pytest.raises(
+        Exception, match="capacity_report_file missing.json is not a file"
+    ):
+        run(tmp_path, **overrides)
+
+
+def test_node_alarms_cover_the_nodes_of_the_cluster(tmp_path):
+    mocks, _ = run(tmp_path, **PERMUTATIONS["observability"])
+    # The mocked cluster OCID is ocid1.okecluster.oc1..benchmark
+    instances = 'resourceDisplayName =~ "oke-*.benchmark-*"'
+    assert mocks.inputs["NodeCpuSaturation"]["query"] == (
+        "CpuUtilization[5m]{" + instances + "}.mean() > 90"
+    )
+    assert instances in mocks.inputs["NodeMemorySaturation"]["query"]
+
+
+def test_cluster_stack_reads_the_network_stack(tmp_path):
+    mocks, outputs = run(tmp_path, **PERMUTATIONS["cluster_stack"])
+    assert "vcn_id" not in outputs
+    assert mocks.resources["oci:Core/vcn:Vcn"] == 0
+    assert mocks.resources["pulumi:pulumi:StackReference"] == 1
+
+
+def test_clusters_get_their_own_vcn(tmp_path):
+    mocks, outputs = run(tmp_path, **PERMUTATIONS["clusters"])
+    assert set(outputs["clusters"]) == {"blue", "green"}
+    assert mocks.resources["oci:Core/vcn:Vcn"] == 2
+
+
+def test_autoscaler_needs_an_enhanced_cluster(tmp_path):
+    overrides = dict(PERMUTATIONS["autoscaler"], cluster_type="BASIC_CLUSTER")
+    with pytest.raises(Exception, match="need cluster_type ENHANCED_CLUSTER"):
+        run(tmp_path, **overrides)
+
+
+def test_unknown_config_fails(tmp_path):
+    with pytest.raises(Exception, match="cni_type"):
+        run(tmp_path, cni_type="CALICO")
@@ -0,0 +1,95 @@
+from security import (
+    ALL,
+    ICMP,
+    TCP,
+    UDP,
+    Flow,
+    Rule,
+    compact,
+    compile_rules,
+    ipv6_flows,
+    oke_flows,
+)
+
+CIDRS = {
+    "workers": "10.0.0.0/24",
+    "pods": "10.0.64.0/19",
+    "loadbalancers": "10.0.1.0/24",
+    "public": "10.0.2.0/28",
+}
+SERVICES_CIDR = "all-iad-services-in-oracle-services-network"
+
+
+def test_compact_merges_adjacent_ports():
+    rules = compact(
+        [
+            Rule("10.0.0.0/24", "CIDR_BLOCK", TCP, 80, 80, description="http"),
+            Rule("10.0.0.0/24", "CIDR_BLOCK", TCP, 81, 90, description="alt"),
+            Rule("10.0.0.0/24", "CIDR_BLOCK", TCP, 443, 443, description="https"),
+        ]
+    )
+    assert [(r.port_min, r.port_max, r.description) for r in rules] == [
+        (80, 90, "http alt"),
+        (443, 443, "https"),
+    ]
+
+
+def test_compact_drops_covered_rules():
+    rules = compact(
+        [
+            Rule("10.0.0.0/16", "CIDR_BLOCK", ALL),
+            Rule("10.0.0.0/24", "CIDR_BLOCK", TCP, 22, 22),
+            Rule("10.0.0.0/24", "CIDR_BLOCK", ICMP, icmp_type=3, icmp_code=4),
+            Rule("192.168.0.0/24", "CIDR_BLOCK", UDP, 53, 53),
+        ]
+    )
+    assert [r.peer for r in rules] == ["10.0.0.0/16", "192.168.0.0/24"]
+
+
+def test_compact_is_idempotent():
+    rules = compile_rules(oke_flows(), CIDRS, SERVICES_CIDR)
+    for directions in rules.values():
+        for items in directions.values():
+            assert compact(items) == items
+
+
+def test_compile_rules_opens_both_ends():
+    rules = compile_rules(
+        [Flow("workers", "pods", TCP, [10250], "kubelet")], CIDRS, SERVICES_CIDR
+    )
+    assert rules["workers"]["egress"] == [
+        Rule(CIDRS["pods"], "CIDR_BLOCK", TCP, 10250, 10250, description="kubelet")
+    ]
+    assert rules["pods"]["ingress"] == [
+        Rule(CIDRS["workers"], "CIDR_BLOCK", TCP, 10250, 10250, description="kubelet")
+    ]
+    assert rules["public"] == {"ingress": [], "egress": []}
+
+
+def test_compile_rules_ignores_missing_tiers():
+    cidrs = {k: v for k, v in CIDRS.items() if k != "pods"}
+    rules = compile_rules(oke_flows(vcn_native=False), cidrs, SERVICES_CIDR)
+    assert "pods" not in rules
+    peers = {r.peer for d in rules.values() for items in d.values() for r in items}
+    assert CIDRS["pods"] not in peers
+
+
+def test_ipv6_flows_keep_the_internet_for_the_public_tiers():
+    flows = ipv6_flows(oke_flows())
+    assert all("services" not in (f.source, f.destination) for f in flows)
+    internet_tiers = {
+        f.source if f.destination == "internet" else f.destination
+        for f in flows
+        if "internet" in (f.source, f.destination)
+    }
+    assert internet_tiers <= {"public", "loadbalancers"}
+    assert all(f.protocol != ICMP for f in flows)
+
+
+def test_workers_reach_the_pods_over_tcp():
+    # The workers egress to the pods was TCP only in the original security lists
+    rules = compile_rules(oke_flows(), CIDRS, SERVICES_CIDR)
+    to_pods = [r for r in rules["workers"]["egress"] if r.peer == CIDRS["pods"]]
+    from_workers = [r for r in rules["pods"]["ingress"] if r.peer == CIDRS["workers"]]
+    assert [(r.protocol, r.port_min) for r in to_pods] == [(TCP, None)]
+    assert [(r.protocol, r.port_min) for r in from_workers] == [(TCP, None)]
@@ -0,0 +1,110 @@
+import ipaddress
+import pytest
+from subnets import (
+    CapacityError,
+    RESERVED_ADDRESSES,
+    calculate_subnets,
+    plan_subnets,
+    subnet_at,
+    subnet_layout,
+    subnet_requests,
+)
+
+
+def test_calculate_subnets_splits_equally():
+    assert calculate_subnets("10.0.0.0/16", 3) == [
+        "10.0.0.0/18",
+        "10.0.64.0/18",
+        "10.0.128.0/18",
+    ]
+    assert calculate_subnets("10.0.0.0/16", 1) == ["10.0.0.0/16"]
+
+
+def test_calculate_subnets_ipv6():
+    subnets = calculate_subnets("2001:db8::/56", 256)
+    assert len(subnets) == 256
+    assert subnets[-1] == "2001:db8:0:ff::/64"
+
+
+def test_calculate_subnets_too_many():
+    with pytest.raises(CapacityError):
+        calculate_subnets("10.0.0.0/30", 8)
+
+
+def test_subnet_at():
+    assert subnet_at("2001:db8::/32", 64, 2**32 - 1) == "2001:db8:ffff:ffff::/64"
+    with pytest.raises(CapacityError):
+        subnet_at("10.0.0.0/24", 26, 4)
+
+
+def test_plan_subnets_fits_the_requests():
+    requests = subnet_requests(nodes=10, pods=310, load_balancers=4, headroom=2)
+    plan = plan_subnets("10.0.0.0/16", requests)
+    assert set(plan) == {"loadbalancers", "public", "pods", "workers"}
+    for request in requests:
+        assert plan[request.name].capacity >= request.addresses
+    networks = [ipaddress.ip_network(s.cidr) for s in plan.values()]
+    for i, a in enumerate(networks):
+        assert a.subnet_of(ipaddress.ip_network("10.0.0.0/16"))
+        assert not any(a.overlaps(b) for b in networks[i + 1 :])
+    for subnet in plan.values():
+        network = ipaddress.ip_network(subnet.cidr)
+        assert subnet.capacity == network.num_addresses - RESERVED_ADDRESSES
+
+
+def cidrs(plan):
+    return {name: subnet.cidr for name, subnet in plan.items()}
+
+
+def test_plan_subnets_keeps_the_baseline_layout():
+    # The equal split of the original program: loadbalancers, public, pods, workers
+    baseline = calculate_subnets("10.0.0.0/16", 6)
+    plan = plan_subnets("10.0.0.0/16", subnet_requests(10, 310, 4, 2))
+    assert cidrs(plan) == {
+        "loadbalancers": baseline[0],
+        "public": baseline[1],
+        "pods": baseline[2],
+        "workers": baseline[3],
+    }
+    assert plan["pods"].cidr == "10.0.64.0/19"
+
+
+def test_plan_subnets_do_not_move_when_the_demand_changes():
+    small = plan_subnets("10.0.0.0/16", subnet_requests(2, 62, 1, 1))
+    large = plan_subnets("10.0.0.0/16", subnet_requests(100, 3100, 40, 2))
+    assert cidrs(small) == cidrs(large)
+
+
+def test_plan_subnets_without_pods():
+    plan = plan_subnets("10.0.0.0/16", subnet_requests(10, 0, 4, 2))
+    assert "pods" not in plan
+    assert plan["workers"].cidr == "10.0.96.0/19"
+
+
+def test_subnet_layout_moves_a_tier():
+    layout = subnet_layout({"pods": [4, 4]})
+    plan = plan_subnets("10.0.0.0/16", subnet_requests(100, 11000, 4, 2), layout)
+    assert plan["pods"].cidr == "10.0.128.0/17"
+    assert plan["workers"].cidr == "10.0.96.0/19"
+
+
+@pytest.mark.parametrize(
+    "layout, error",
+    [
+        ({"nodes": [4, 1]}, "Unknown subnet_layout tier nodes"),
+        ({"pods": [4, 3]}, "slot count"),
+        ({"pods": [2, 4]}, "slot count"),
+        ({"pods": [6, 4]}, "slot count"),
+        ({"pods": [0, 2]}, "share the slot 0"),
+    ],
+)
+def test_subnet_layout_is_validated(layout, error):
+    with pytest.raises(ValueError, match=error):
+        subnet_layout(layout)
+
+
+def test_plan_subnets_too_small():
+    with pytest.raises(CapacityError, match="too small"):
+        plan_subnets("10.0.0.0/16", subnet_requests(100, 11000, 4, 2))
+    with pytest.raises(CapacityError, match="too small for 8 subnets"):
+        plan_subnets("10.0.0.0/26", subnet_requests(1, 0, 1, 1))
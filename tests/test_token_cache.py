@@ -0,0 +1,88 @@
+import datetime
+import json
+import os
+import stat
+import sys
+import pytest
+import oke_token_cache
+
+ARGS = ["ce", "cluster", "generate-token", "--cluster-id", "ocid1.cluster.oc1..test"]
+
+
+def credential(seconds):
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        seconds=seconds
+    )
+    return {
+        "kind": "ExecCredential",
+        "status": {
+            "token": f"token-{seconds}",
+            "expirationTimestamp": expiration.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        },
+    }
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    # A fake OCI CLI counting its calls and printing a token valid for 5 minutes
+    calls = tmp_path / "calls"
+    script = tmp_path / "oci"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import datetime, json\n"
+        f"open({str(calls)!r}, 'a').write('x')\n"
+        "expiration = datetime.datetime.now(datetime.timezone.utc)"
+        " + datetime.timedelta(seconds=300)\n"
+        "print(json.dumps({'status': {'token': 'minted', 'expirationTimestamp':"
+        " expiration.strftime('%Y-%m-%dT%H:%M:%SZ')}}))\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setattr(oke_token_cache, "OCI_CLI", str(script))
+    monkeypatch.setattr(oke_token_cache, "CACHE_DIR", str(tmp_path / "cache"))
+
+    class Cli:
+        def calls(self):
+            return len(calls.read_text()) if calls.exists() else 0
+
+    return Cli()
+
+
+def test_mints_once_then_reads_the_cache(cli):
+    first = oke_token_cache.get_credential(ARGS)
+    second = oke_token_cache.get_credential(ARGS)
+    assert first == second
+    assert first["status"]["token"] == "minted"
+    assert cli.calls() == 1
+    path = oke_token_cache.cache_path(ARGS)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_expired_token_is_minted_again(cli):
+    path = oke_token_cache.cache_path(ARGS)
+    os.makedirs(oke_token_cache.CACHE_DIR)
+    with open(path, "w") as f:
+        json.dump(credential(5), f)
+    assert oke_token_cache.get_credential(ARGS)["status"]["token"] == "minted"
+    assert cli.calls() == 1
+
+
+def test_token_about_to_expire_is_refreshed_in_the_background(cli, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(
+        oke_token_cache,
+        "refresh_in_background",
+        lambda args, path: refreshed.append(args),
+    )
+    path = oke_token_cache.cache_path(ARGS)
+    os.makedirs(oke_token_cache.CACHE_DIR)
+    with open(path, "w") as f:
+        json.dump(credential(30), f)
+    assert oke_token_cache.get_credential(ARGS)["status"]["token"] == "token-30"
+    assert refreshed == [ARGS]
+    assert cli.calls() == 0
+
+
+def test_profiles_do_not_share_tokens(cli, monkeypatch):
+    path = oke_token_cache.cache_path(ARGS)
+    monkeypatch.setenv("OCI_CLI_PROFILE", "other")
+    assert oke_token_cache.cache_path(ARGS) != path